@@ -1,3 +1,4 @@
+from concurrent.futures import Future
 from datetime import datetime
 from django.db.models import Count, Exists, Max, OuterRef
 from django.utils.functional import cached_property
@@ -153,6 +154,13 @@ class ProjectDocumentListSerializer(ProjectDocumentSerializerBase):
 
 
 class ProjectDocumentDetailSerializer(ProjectDocumentSerializerBase):
+    """
+    The apartment documents of the project can be given in the context as
+    "apartments", either as a list or as a future. If the UUIDs of the apartments are
+    also given as "apartment_uuids", the database queries are run before the
+    documents are waited for.
+    """
+
     installment_templates = serializers.SerializerMethodField()
     apartments = serializers.SerializerMethodField()
     extra_data = serializers.SerializerMethodField()
@@ -167,9 +175,25 @@ class ProjectDocumentDetailSerializer(ProjectDocumentSerializerBase):
             installment_templates, many=True
         ).data
 
+    def to_representation(self, instance):
+        # Only the apartment UUIDs are needed for these
+        self.reservation_context
+        self.lottery_completed_at
+        self.application_count
+        return super().to_representation(instance)
+
     def get_apartments(self, obj):
+        return ApartmentSerializer(
+            self.apartment_objs,
+            many=True,
+            context={"project_uuid": obj.project_uuid, **self.reservation_context},
+        ).data
+
+    @cached_property
+    def reservation_context(self):
         reservation_counts = (
             ApartmentReservation.objects.active()
+            .filter(apartment_uuid__in=self.apartment_uuids)
             .values("apartment_uuid")
             .annotate(reservation_count=Count("apartment_uuid"))
         )
@@ -186,30 +210,28 @@ class ProjectDocumentDetailSerializer(ProjectDocumentSerializerBase):
             ApartmentReservation.objects.filter(apartment_uuid__in=self.apartment_uuids)
             .related_fields()
             .active()
+            .with_positions()
             .filter(queue_position=1)
             .annotate(
                 customer_has_other_winning_apartments=Exists(
                     customer_other_winning_apartments
                 )
             )
-            # Winning reservations are sorted by list_position so that the results will
+            # Winning reservations are sorted by list order so that the results will
             # be consistent even if there are multiple winning reservations for the same
             # apartment. That should not normally happen.
-            .order_by("list_position")
+            .order_by("list_order", "pk")
         )
 
-        return ApartmentSerializer(
-            self.apartment_objs,
-            many=True,
-            context={
-                "project_uuid": obj.project_uuid,
-                "reservation_counts": reservation_counts,
-                "winning_reservations": winning_reservations,
-                "reserved_reservations": ApartmentReservation.objects.filter(
+        return {
+            "reservation_counts": list(reservation_counts),
+            "winning_reservations": list(winning_reservations),
+            "reserved_reservations": list(
+                ApartmentReservation.objects.filter(
                     apartment_uuid__in=self.apartment_uuids
-                ).reserved(),
-            },
-        ).data
+                ).reserved()
+            ),
+        }
 
     def get_extra_data(self, obj):
         try:
@@ -219,12 +241,19 @@ class ProjectDocumentDetailSerializer(ProjectDocumentSerializerBase):
         return ProjectExtraDataSerializer(extra_data).data
 
     def get_lottery_completed_at(self, obj) -> datetime:
-        lottery_completed_at = LotteryEvent.objects.filter(
+        return self.lottery_completed_at
+
+    def get_application_count(self, obj) -> int:
+        return self.application_count
+
+    @cached_property
+    def lottery_completed_at(self):
+        return LotteryEvent.objects.filter(
             apartment_uuid__in=self.apartment_uuids
         ).aggregate(Max("timestamp"))["timestamp__max"]
-        return lottery_completed_at
 
-    def get_application_count(self, obj) -> int:
+    @cached_property
+    def application_count(self):
         return (
             Application.objects.filter(
                 application_apartments__apartment_uuid__in=self.apartment_uuids
@@ -238,8 +267,15 @@ class ProjectDocumentDetailSerializer(ProjectDocumentSerializerBase):
 
     @cached_property
     def apartment_objs(self):
-        return get_apartments(self.instance.project_uuid)
+        apartments = self.context.get("apartments")
+        if apartments is None:
+            return get_apartments(self.instance.project_uuid)
+        if isinstance(apartments, Future):
+            return apartments.result()
+        return apartments
 
     @cached_property
     def apartment_uuids(self):
+        if "apartment_uuids" in self.context:
+            return self.context["apartment_uuids"]
         return [a.uuid for a in self.apartment_objs]
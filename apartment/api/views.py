@@ -1,6 +1,12 @@
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from dateutil import parser
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.http import Http404, HttpResponse
+from django.db import connections
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.text import format_lazy
 from django.utils.translation import gettext_lazy as _
 from rest_framework.exceptions import NotFound, ValidationError
@@ -35,6 +41,82 @@ from application_form.services.export import (
     ProjectLotteryResultExportService,
     SaleReportExportService,
 )
+from application_form.services.export_cache import (
+    get_etag,
+    get_project_data_version,
+    iter_cached_csv_bytes,
+)
+
+# Runs the Elasticsearch queries of a request concurrently with its database queries
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    Create the executor on first use, so that the processes which don't serve these
+    views, such as management commands, don't have one.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.ELASTICSEARCH_EXECUTOR_MAX_WORKERS,
+                    thread_name_prefix="elasticsearch",
+                )
+    return _executor
+
+
+def _submit(func, *args) -> Future:
+    """
+    Run the function in the executor in a copy of the caller's context, so that it
+    sees the Elasticsearch query memo of the request. Django closes the database
+    connections only of the request threads, so the connections the function opens
+    in the worker thread are closed when it is done.
+    """
+    context = contextvars.copy_context()
+
+    def run():
+        try:
+            return context.run(func, *args)
+        finally:
+            connections.close_all()
+
+    return _get_executor().submit(run)
+
+
+def _stream_csv_response(content, file_name):
+    response = StreamingHttpResponse(
+        content, content_type="text/csv; charset=utf-8-sig"
+    )
+    response["Content-Disposition"] = "attachment; filename={file_name}.csv".format(
+        file_name=file_name
+    )
+    return response
+
+
+def _cached_project_csv_response(
+    request, export_service, export_name, project_uuid, apartment_uuids, file_name
+):
+    """
+    Return the export file of the project from the export cache, or a Not Modified
+    response if the client already has the current version of the file.
+    """
+    data_version = get_project_data_version(project_uuid, apartment_uuids)
+    etag = get_etag(export_name, project_uuid, data_version)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = _stream_csv_response(
+            iter_cached_csv_bytes(
+                export_service, export_name, project_uuid, data_version
+            ),
+            file_name,
+        )
+    response["ETag"] = etag
+    # The file may be stored by the browser, but must be revalidated before use
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 class ApartmentAPIView(APIView):
@@ -54,7 +136,8 @@ class ApartmentReservationsAPIView(APIView):
         serializer = SalesApartmentReservationSerializer(
             ApartmentReservation.objects.related_fields()
             .filter(apartment_uuid=apartment_uuid)
-            .order_by("list_position"),
+            .with_window_positions()
+            .order_by("list_order", "pk"),
             many=True,
         )
         return Response(serializer.data)
@@ -64,18 +147,25 @@ class ProjectAPIView(APIView):
     http_method_names = ["get"]
 
     def get(self, request, project_uuid=None):
-        many = project_uuid is None
+        if project_uuid is None:
+            serializer = ProjectDocumentListSerializer(get_projects(), many=True)
+            return Response(serializer.data)
+        # The apartment UUIDs and documents are fetched while the project is, and the
+        # documents also while the database queries, which need only the apartment
+        # UUIDs, are run
+        apartment_uuids = _submit(get_apartment_uuids, project_uuid)
+        apartments = _submit(get_apartments, project_uuid)
         try:
-            if not many:
-                project_data = get_project(project_uuid)
-            else:
-                project_data = get_projects()
+            project_data = get_project(project_uuid)
         except ObjectDoesNotExist:
             raise NotFound()
-        serializer_class = (
-            ProjectDocumentListSerializer if many else ProjectDocumentDetailSerializer
+        serializer = ProjectDocumentDetailSerializer(
+            project_data,
+            context={
+                "apartments": apartments,
+                "apartment_uuids": apartment_uuids.result(),
+            },
         )
-        serializer = serializer_class(project_data, many=many)
         return Response(serializer.data)
 
 
@@ -90,18 +180,20 @@ class ProjectExportApplicantsAPIView(APIView):
             raise NotFound()
         reservations = ApartmentReservation.objects.filter(
             apartment_uuid__in=apartment_uuids
-        )
+        ).with_window_positions()
         export_services = ApplicantExportService(reservations)
-        csv_file = export_services.get_csv_string()
         file_name = format_lazy(
             _("[Project {title}] Applicants information"),
             title=project.project_street_address,
         ).replace(" ", "_")
-        response = HttpResponse(csv_file, content_type="text/csv; charset=utf-8-sig")
-        response["Content-Disposition"] = "attachment; filename={file_name}.csv".format(
-            file_name=file_name
+        return _cached_project_csv_response(
+            request,
+            export_services,
+            "applicants",
+            project_uuid,
+            apartment_uuids,
+            file_name,
         )
-        return response
 
 
 class ProjectExportLotteryResultsAPIView(APIView):
@@ -116,16 +208,18 @@ class ProjectExportLotteryResultsAPIView(APIView):
         if LotteryEvent.objects.filter(apartment_uuid__in=apartment_uuids).count() == 0:
             raise ValidationError("Project lottery has not happened yet")
         export_services = ProjectLotteryResultExportService(project)
-        csv_file = export_services.get_csv_string()
         file_name = format_lazy(
             _("[Project {title}] Lottery result"),
             title=project.project_street_address,
         ).replace(" ", "_")
-        response = HttpResponse(csv_file, content_type="text/csv; charset=utf-8-sig")
-        response["Content-Disposition"] = "attachment; filename={file_name}.csv".format(
-            file_name=file_name
+        return _cached_project_csv_response(
+            request,
+            export_services,
+            "lottery_result",
+            project_uuid,
+            apartment_uuids,
+            file_name,
         )
-        return response
 
 
 class SaleReportAPIView(APIView):
@@ -151,17 +245,16 @@ class SaleReportAPIView(APIView):
             state=ApartmentReservationState.SOLD,
         )
         export_services = SaleReportExportService(state_events)
-        csv_file = export_services.get_csv_string()
         file_name = format_lazy(
             _("Sale report {start_date} - {end_date}"),
             start_date=start_date,
             end_date=end_date,
         ).replace(" ", "_")
-        response = HttpResponse(csv_file, content_type="text/csv; charset=utf-8-sig")
-        response["Content-Disposition"] = "attachment; filename={file_name}.csv".format(
-            file_name=file_name
+        # The rows are fetched before the response, and only their encoding is
+        # streamed
+        return _stream_csv_response(
+            export_services.iter_csv_bytes(export_services.get_rows()), file_name
         )
-        return response
 
 
 class ProjectExtraDataAPIView(RetrieveUpdateAPIView):
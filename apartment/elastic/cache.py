@@ -0,0 +1,235 @@
+"""
+A cache in front of the Elasticsearch queries of apartment.elastic.queries.
+
+The documents are stored in the Django cache configured by ELASTICSEARCH_CACHE_URL,
+so the cache can be shared across requests and processes with a shared cache
+backend. The entries expire after ELASTICSEARCH_CACHE_TIMEOUT seconds, and backends
+that support it evict entries beyond ELASTICSEARCH_CACHE_MAX_ENTRIES.
+"""
+from django.core.cache import caches
+from typing import Callable, Dict, Iterable, List, Optional
+
+from apartment.elastic.documents import APARTMENT_PROJECTIONS, ApartmentDocument
+from apartment.elastic.memo import clear_query_memo
+
+ELASTICSEARCH_CACHE_ALIAS = "elasticsearch"
+
+_STATS_KEY_PREFIX = "stats"
+_KINDS = ("apartment", "project", "apartment_uuids")
+
+
+def _get_cache():
+    return caches[ELASTICSEARCH_CACHE_ALIAS]
+
+
+def apartment_key(
+    apartment_uuid, include_project_fields: bool, projection: Optional[str] = None
+) -> str:
+    if projection:
+        suffix = f"projection:{projection}"
+    else:
+        suffix = "with_project" if include_project_fields else "without_project"
+    return f"apartment:{apartment_uuid}:{suffix}"
+
+
+def _all_apartment_keys(apartment_uuid) -> List[str]:
+    return [
+        apartment_key(apartment_uuid, True),
+        apartment_key(apartment_uuid, False),
+    ] + [
+        apartment_key(apartment_uuid, True, projection)
+        for projection in APARTMENT_PROJECTIONS
+    ]
+
+
+def project_key(project_uuid) -> str:
+    return f"project:{project_uuid}"
+
+
+def apartment_uuids_key(project_uuid) -> str:
+    return f"apartment_uuids:{project_uuid}"
+
+
+def get_or_fetch_document(
+    kind: str, key: str, fetch: Callable[[], ApartmentDocument]
+) -> ApartmentDocument:
+    """
+    Return the document cached with the given key, or fetch and cache it. Errors,
+    such as a missing document, are not cached.
+    """
+    cache = _get_cache()
+    data = cache.get(key)
+    if data is not None:
+        _increment_stat(kind, "hits")
+        return _document_from_cache(data)
+    _increment_stat(kind, "misses")
+    document = fetch()
+    cache.set(key, _document_to_cache(document))
+    return document
+
+
+def get_or_fetch_apartments(
+    apartment_uuids: Iterable[str],
+    include_project_fields: bool,
+    fetch: Callable[[List[str]], Dict[str, ApartmentDocument]],
+    projection: Optional[str] = None,
+) -> Dict[str, ApartmentDocument]:
+    """
+    Return the cached apartments with the given UUIDs, and fetch and cache the rest
+    with a single call. The result is keyed by the apartment UUID.
+    """
+    cache = _get_cache()
+    keys = {
+        apartment_uuid: apartment_key(
+            apartment_uuid, include_project_fields, projection
+        )
+        for apartment_uuid in apartment_uuids
+    }
+    cached = cache.get_many(keys.values())
+    apartments = {
+        apartment_uuid: _document_from_cache(cached[key])
+        for apartment_uuid, key in keys.items()
+        if key in cached
+    }
+    missing = [uuid for uuid in keys if uuid not in apartments]
+    _increment_stat("apartment", "hits", len(apartments))
+    _increment_stat("apartment", "misses", len(missing))
+    if missing:
+        fetched = fetch(missing)
+        cache.set_many(
+            {
+                keys[apartment_uuid]: _document_to_cache(apartment)
+                for apartment_uuid, apartment in fetched.items()
+            }
+        )
+        apartments.update(fetched)
+    return apartments
+
+
+def get_or_fetch_apartment_uuids(
+    project_uuid, fetch: Callable[[], List[str]]
+) -> List[str]:
+    cache = _get_cache()
+    apartment_uuids = cache.get(apartment_uuids_key(project_uuid))
+    if apartment_uuids is not None:
+        _increment_stat("apartment_uuids", "hits")
+        return apartment_uuids
+    _increment_stat("apartment_uuids", "misses")
+    apartment_uuids = fetch()
+    cache.set(apartment_uuids_key(project_uuid), apartment_uuids)
+    return apartment_uuids
+
+
+def set_project_documents(project_uuid, apartments: Iterable[ApartmentDocument]) -> int:
+    """
+    Cache the given apartments of the project, which must include the project fields.
+    Returns the number of cached apartments.
+    """
+    entries = {}
+    apartment_uuids = []
+    for apartment in apartments:
+        data = _document_to_cache(apartment)
+        entries[apartment_key(apartment.uuid, True)] = data
+        entries[apartment_key(apartment.uuid, False)] = {
+            **data,
+            "_source": {
+                name: value
+                for name, value in data["_source"].items()
+                if not name.startswith("project_")
+            },
+        }
+        for projection, fields in APARTMENT_PROJECTIONS.items():
+            entries[apartment_key(apartment.uuid, True, projection)] = {
+                **data,
+                "_source": {
+                    name: value
+                    for name, value in data["_source"].items()
+                    if name in fields
+                },
+            }
+        apartment_uuids.append(apartment.uuid)
+    if apartment_uuids:
+        entries[project_key(project_uuid)] = {
+            **data,
+            "_source": {
+                name: value
+                for name, value in data["_source"].items()
+                if name.startswith("project_")
+            },
+        }
+    entries[apartment_uuids_key(project_uuid)] = apartment_uuids
+    _get_cache().set_many(entries)
+    return len(apartment_uuids)
+
+
+def invalidate_apartment(apartment_uuid) -> None:
+    clear_query_memo()
+    _get_cache().delete_many(_all_apartment_keys(apartment_uuid))
+
+
+def invalidate_project(
+    project_uuid, apartment_uuids: Optional[Iterable[str]] = None
+) -> None:
+    """
+    Invalidate the project and all its apartments, since they include the project
+    fields. If the apartment UUIDs are not given, the cached ones are used.
+    """
+    clear_query_memo()
+    cache = _get_cache()
+    if apartment_uuids is None:
+        apartment_uuids = cache.get(apartment_uuids_key(project_uuid)) or []
+    keys = [project_key(project_uuid), apartment_uuids_key(project_uuid)]
+    for apartment_uuid in apartment_uuids:
+        keys += _all_apartment_keys(apartment_uuid)
+    cache.delete_many(keys)
+
+
+def get_stats() -> Dict[str, Dict[str, int]]:
+    """Return the number of cache hits and misses of each kind of query."""
+    cache = _get_cache()
+    keys = [_stat_key(kind, stat) for kind in _KINDS for stat in ("hits", "misses")]
+    values = cache.get_many(keys)
+    return {
+        kind: {
+            stat: values.get(_stat_key(kind, stat), 0) for stat in ("hits", "misses")
+        }
+        for kind in _KINDS
+    }
+
+
+def reset_stats() -> None:
+    _get_cache().delete_many(
+        [_stat_key(kind, stat) for kind in _KINDS for stat in ("hits", "misses")]
+    )
+
+
+def _stat_key(kind: str, stat: str) -> str:
+    return f"{_STATS_KEY_PREFIX}:{kind}:{stat}"
+
+
+def _increment_stat(kind: str, stat: str, delta: int = 1) -> None:
+    if not delta:
+        return
+    cache = _get_cache()
+    key = _stat_key(kind, stat)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # The counters never expire, unlike the documents
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def _document_to_cache(document: ApartmentDocument) -> dict:
+    # Plain dicts are cached instead of the documents, so that any cache backend can
+    # serialize them
+    return {
+        # Projects synced to the database have no document ID
+        "_id": getattr(document.meta, "id", None),
+        "_index": document.meta.index,
+        "_source": document.to_dict(skip_empty=False),
+    }
+
+
+def _document_from_cache(data: dict) -> ApartmentDocument:
+    return ApartmentDocument.from_es(data)
@@ -173,3 +173,16 @@ class ApartmentDocument(ReadOnlyDocument):
         return reservation_right_of_occupancy_payment(
             reservation_id, self.uuid, self.right_of_occupancy_payment
         )
+
+
+# Named sets of _source fields for the callers that need only a few fields of an
+# apartment. They can be given to the apartment queries as the projection argument.
+APARTMENT_PROJECTIONS = {
+    "ownership_type": ("uuid", "project_uuid", "project_ownership_type"),
+    "wbs_element": (
+        "uuid",
+        "project_uuid",
+        "project_ownership_type",
+        "project_property_number",
+    ),
+}
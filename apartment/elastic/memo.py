@@ -0,0 +1,65 @@
+"""
+Memoization of the Elasticsearch queries within a unit of work.
+
+Inside a query_memo() block, repeated calls of a query with the same arguments are
+served from memory instead of asking Elasticsearch (or the Elasticsearch cache)
+again. Requests are wrapped in the block by ElasticsearchQueryMemoMiddleware, and
+management commands can use the context manager directly. Outside of the block the
+queries are not memoized.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Iterator, Optional
+from uuid import UUID
+
+_memo: ContextVar[Optional[dict]] = ContextVar("elasticsearch_query_memo", default=None)
+
+
+@contextmanager
+def query_memo() -> Iterator[None]:
+    """
+    Memoize the Elasticsearch queries made inside the block. Nested blocks share the
+    memo of the outermost block.
+    """
+    if _memo.get() is not None:
+        yield
+        return
+    token = _memo.set({})
+    try:
+        yield
+    finally:
+        _memo.reset(token)
+
+
+def clear_query_memo() -> None:
+    """Forget the memoized results, e.g. after the documents have changed."""
+    memo = _memo.get()
+    if memo is not None:
+        memo.clear()
+
+
+def memoize_query(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        memo = _memo.get()
+        if memo is None:
+            return func(*args, **kwargs)
+        key = (
+            func.__name__,
+            tuple(_normalize(arg) for arg in args),
+            tuple(sorted((name, _normalize(arg)) for name, arg in kwargs.items())),
+        )
+        try:
+            return memo[key]
+        except KeyError:
+            pass
+        result = memo[key] = func(*args, **kwargs)
+        return result
+
+    return wrapper
+
+
+def _normalize(value):
+    # UUIDs are given both as strings and as UUID objects
+    return str(value) if isinstance(value, UUID) else value
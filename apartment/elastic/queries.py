@@ -1,16 +1,51 @@
+from datetime import timedelta
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from apartment.elastic import cache
+from apartment.elastic.documents import APARTMENT_PROJECTIONS, ApartmentDocument
+from apartment.elastic.memo import memoize_query
+from apartment.models import Project
+from connections.elastic_client import instrument_query
+
+# Keeps the size of a terms query below the default max_result_window of the index
+MAX_TERMS_PER_QUERY = 1000
+
+# Number of documents fetched per request when the results are iterated
+SEARCH_PAGE_SIZE = 500
+
+
+@memoize_query
+@instrument_query
+def get_apartment(apartment_uuid, include_project_fields=False, projection=None):
+    """
+    Get an apartment. If the name of a projection in APARTMENT_PROJECTIONS is given,
+    only its fields are fetched and include_project_fields is ignored.
+    """
+    return cache.get_or_fetch_document(
+        "apartment",
+        cache.apartment_key(apartment_uuid, include_project_fields, projection),
+        lambda: _get_apartment(apartment_uuid, include_project_fields, projection),
+    )
+
 
-from apartment.elastic.documents import ApartmentDocument
+def _apply_projection(search, include_project_fields, projection):
+    if projection:
+        return search.source(includes=list(APARTMENT_PROJECTIONS[projection]))
+    if not include_project_fields:
+        return search.source(excludes=["project_*"])
+    return search
 
 
-def get_apartment(apartment_uuid, include_project_fields=False):
+def _get_apartment(apartment_uuid, include_project_fields=False, projection=None):
     search = ApartmentDocument.search()
 
     # Filters
     search = search.filter("term", uuid__keyword=apartment_uuid)
 
-    if not include_project_fields:
-        search = search.source(excludes=["project_*"])
+    search = _apply_projection(search, include_project_fields, projection)
 
     # Get item
     try:
@@ -21,6 +56,49 @@ def get_apartment(apartment_uuid, include_project_fields=False):
     return apartment
 
 
+@instrument_query
+def get_apartments_by_uuids(
+    apartment_uuids: Iterable, include_project_fields=False, projection=None
+) -> Dict[str, ApartmentDocument]:
+    """
+    Get several apartments at once. The result is keyed by the apartment UUID as a
+    string, and UUIDs that do not exist in ElasticSearch are left out of it. The
+    projection works like in get_apartment().
+    """
+    apartment_uuids = list(dict.fromkeys(str(uuid) for uuid in apartment_uuids))
+    if not apartment_uuids:
+        return {}
+    return cache.get_or_fetch_apartments(
+        apartment_uuids,
+        include_project_fields,
+        lambda uuids: _get_apartments_by_uuids(
+            uuids, include_project_fields, projection
+        ),
+        projection,
+    )
+
+
+def _get_apartments_by_uuids(
+    apartment_uuids, include_project_fields=False, projection=None
+):
+    apartments = {}
+    for start in range(0, len(apartment_uuids), MAX_TERMS_PER_QUERY):
+        end = start + MAX_TERMS_PER_QUERY
+        chunk = apartment_uuids[start:end]
+        search = ApartmentDocument.search()
+
+        # Filters
+        search = search.filter("terms", uuid__keyword=chunk)
+
+        search = _apply_projection(search, include_project_fields, projection)
+
+        for apartment in search.extra(size=len(chunk)).execute():
+            apartments[apartment.uuid] = apartment
+    return apartments
+
+
+@memoize_query
+@instrument_query
 def get_apartment_project_uuid(apartment_uuid):
     search = ApartmentDocument.search()
 
@@ -37,7 +115,21 @@ def get_apartment_project_uuid(apartment_uuid):
     return apartment
 
 
+@memoize_query
+@instrument_query
 def get_apartments(project_uuid=None):
+    return list(iter_apartments(project_uuid))
+
+
+@instrument_query
+def iter_apartments(
+    project_uuid=None, page_size=SEARCH_PAGE_SIZE, include_project_fields=False
+) -> Iterator[ApartmentDocument]:
+    """
+    Yield the apartments lazily, fetching page_size apartments per request. The pages
+    are fetched with search_after in the order of the apartment UUIDs, so there is no
+    limit on the number of apartments.
+    """
     search = ApartmentDocument.search()
 
     # Filters
@@ -45,16 +137,107 @@ def get_apartments(project_uuid=None):
         search = search.filter("term", project_uuid__keyword=project_uuid)
 
     # Exclude project fields
-    search = search.source(excludes=["project_*"])
+    if not include_project_fields:
+        search = search.source(excludes=["project_*"])
 
-    # Get all items
-    count = search.count()
-    response = search[0:count].execute()
+    yield from _iter_pages(search, page_size)
+
+
+def _iter_pages(search, page_size):
+    # The sort needs to be unique for search_after
+    search = search.sort("uuid.keyword").extra(size=page_size)
+
+    search_after = None
+    while True:
+        page = search
+        if search_after is not None:
+            page = page.extra(search_after=search_after)
+        hits = page.execute().hits
+        yield from hits
+        if len(hits) < page_size:
+            return
+        search_after = list(hits[-1].meta.sort)
+
+
+@instrument_query
+def iter_apartment_versions(
+    project_uuid=None, page_size=SEARCH_PAGE_SIZE
+) -> Iterator[Tuple[str, str]]:
+    """
+    Yield the UUID and the version of each apartment, without the other fields of
+    the documents. The version changes whenever the document is written, see
+    get_apartments_with_versions().
+    """
+    index_uuids = _get_index_uuids()
+    search = ApartmentDocument.search()
+
+    # Filters
+    if project_uuid:
+        search = search.filter("term", project_uuid__keyword=project_uuid)
+
+    # Include only the apartment uuid
+    search = search.source(includes=["uuid"]).extra(seq_no_primary_term=True)
+
+    for hit in _iter_pages(search, page_size):
+        yield hit.uuid, _get_document_version(hit, index_uuids)
+
+
+@instrument_query
+def get_apartments_with_versions(
+    apartment_uuids: Iterable,
+) -> List[Tuple[ApartmentDocument, str]]:
+    """
+    Get the apartments with the project fields and the versions of their documents.
+    The version consists of the UUID of the index and the primary term and sequence
+    number of the document, which Elasticsearch changes on every write, so an
+    apartment whose version is unchanged doesn't need to be fetched again. UUIDs that
+    do not exist in ElasticSearch are left out of the result.
+    """
+    apartment_uuids = list(dict.fromkeys(str(uuid) for uuid in apartment_uuids))
+    if not apartment_uuids:
+        return []
+    index_uuids = _get_index_uuids()
+    apartments = []
+    for start in range(0, len(apartment_uuids), MAX_TERMS_PER_QUERY):
+        end = start + MAX_TERMS_PER_QUERY
+        chunk = apartment_uuids[start:end]
+        search = ApartmentDocument.search()
+
+        # Filters
+        search = search.filter("terms", uuid__keyword=chunk)
+
+        search = search.extra(size=len(chunk), seq_no_primary_term=True)
+        for hit in search.execute():
+            apartments.append((hit, _get_document_version(hit, index_uuids)))
+    return apartments
+
+
+def _get_index_uuids() -> Dict[str, str]:
+    """Get the UUIDs of the indices behind the apartment index name, by name."""
+    client = ApartmentDocument._get_connection()
+    response = client.indices.get_settings(
+        index=ApartmentDocument._index._name, name="index.uuid"
+    )
+    return {
+        name: index["settings"]["index"]["uuid"] for name, index in response.items()
+    }
 
-    return response
 
+def _get_document_version(hit, index_uuids) -> str:
+    # The sequence numbers start over when the index is recreated, which changes its
+    # UUID
+    return f"{index_uuids[hit.meta.index]}:{hit.meta.primary_term}:{hit.meta.seq_no}"
 
+
+@memoize_query
+@instrument_query
 def get_apartment_uuids(project_uuid):
+    return cache.get_or_fetch_apartment_uuids(
+        project_uuid, lambda: _get_apartment_uuids(project_uuid)
+    )
+
+
+def _get_apartment_uuids(project_uuid):
     search = ApartmentDocument.search()
 
     # Filters
@@ -69,7 +252,37 @@ def get_apartment_uuids(project_uuid):
     return result
 
 
+@memoize_query
+@instrument_query
 def get_project(project_uuid):
+    if not project_uuid:
+        return _get_project(project_uuid)
+    return cache.get_or_fetch_document(
+        "project",
+        cache.project_key(project_uuid),
+        lambda: _get_synced_project(project_uuid),
+    )
+
+
+def _get_synced_project(project_uuid):
+    """
+    Get the project from its record synced by sync_apartments, which takes a single
+    indexed lookup. Fall back to collapsing the apartments of the project if the
+    project has not been synced within SYNCED_PROJECT_MAX_AGE seconds.
+    """
+    synced_after = timezone.now() - timedelta(seconds=settings.SYNCED_PROJECT_MAX_AGE)
+    try:
+        project = Project.objects.get(
+            project_uuid=project_uuid, synced_at__gte=synced_after
+        )
+    except Project.DoesNotExist:
+        return _get_project(project_uuid)
+    return ApartmentDocument.from_es(
+        {"_index": ApartmentDocument._index._name, "_source": project.data}
+    )
+
+
+def _get_project(project_uuid):
     search = ApartmentDocument.search()
 
     # Filters
@@ -103,29 +316,60 @@ def get_project(project_uuid):
     return response
 
 
+@memoize_query
+@instrument_query
 def get_projects():
+    return list(iter_projects())
+
+
+@instrument_query
+def iter_projects(page_size=SEARCH_PAGE_SIZE) -> Iterator[ApartmentDocument]:
+    """
+    Yield the projects lazily, fetching page_size projects per request. Field
+    collapsing cannot be paginated, so the projects are fetched as the buckets of a
+    composite aggregation in the order of the project IDs.
+    """
+    after = None
+    while True:
+        search = ApartmentDocument.search()
+
+        # Project data needs to exist in apartment data
+        search = search.filter("exists", field="project_id")
+
+        # Get only one apartment which has project data per project
+        composite_kwargs = {"after": after} if after is not None else {}
+        search.aggs.bucket(
+            "projects",
+            "composite",
+            sources=[{"project_id": {"terms": {"field": "project_id"}}}],
+            size=page_size,
+            **composite_kwargs,
+        ).metric(
+            "most_recent",
+            "top_hits",
+            size=1,
+            # Retrieve only project fields
+            _source=["project_*"],
+        )
+
+        # Only the aggregation is needed
+        search = search.extra(size=0)
+
+        projects = search.execute().aggregations.projects
+        for bucket in projects.buckets:
+            yield bucket.most_recent.hits[0]
+        if len(projects.buckets) < page_size:
+            return
+        after = projects.after_key.to_dict()
+
+
+@instrument_query
+def warm_project_cache(project_uuid):
+    """
+    Fetch the project and all its apartments with a single scan and store them in
+    the cache. Returns the number of cached apartments.
+    """
     search = ApartmentDocument.search()
-
-    # Project data needs to exist in apartment data
-    search = search.filter("exists", field="project_id")
-
-    # Get only most recent apartment which has project data
-    search = search.extra(
-        collapse={
-            "field": "project_id",
-            "inner_hits": {
-                "name": "most_recent",
-                "size": 1,
-                "sort": [{"project_id": "desc"}],
-            },
-        }
-    )
-
-    # Retrieve only project fields
-    search = search.source(["project_*"])
-
-    # Get all items
-    count = search.count()
-    response = search[0:count].execute()
-
-    return response
+    search = search.filter("term", project_uuid__keyword=project_uuid)
+    cache.invalidate_project(project_uuid)
+    return cache.set_project_documents(project_uuid, search.scan())
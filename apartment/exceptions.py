@@ -0,0 +1,9 @@
+"""
+Apartment exception classes.
+"""
+
+
+class ApartmentDeletionRefusedException(Exception):
+    """
+    Syncing the apartments would delete too many of them.
+    """
@@ -0,0 +1,31 @@
+import json
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from apartment.elastic.queries import iter_apartments
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the apartment documents in Elasticsearch to a JSON fixture, which can "
+        "be used with ELASTICSEARCH_FAKE_FIXTURES."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--project",
+            dest="project_uuid",
+            help="UUID of a project to dump. By default all apartments are dumped.",
+        )
+
+    def handle(self, *args, **options):
+        documents = [
+            {"_id": apartment.meta.id, "_source": apartment.to_dict()}
+            for apartment in iter_apartments(
+                options["project_uuid"], include_project_fields=True
+            )
+        ]
+        with open(options["path"], "w", encoding="utf-8") as f:
+            json.dump(documents, f, cls=DjangoJSONEncoder, ensure_ascii=False)
+        self.stdout.write(f"Done! Wrote {len(documents)} apartment(s).")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from apartment.elastic import cache
+
+
+class Command(BaseCommand):
+    help = "Show the hits and misses of the Elasticsearch cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Reset the counters after showing."
+        )
+
+    def handle(self, *args, **options):
+        for kind, stats in cache.get_stats().items():
+            total = stats["hits"] + stats["misses"]
+            hit_rate = f"{stats['hits'] / total:.1%}" if total else "-"
+            self.stdout.write(
+                f"{kind}: {stats['hits']} hits, {stats['misses']} misses, "
+                f"hit rate {hit_rate}"
+            )
+        if options["reset"]:
+            cache.reset_stats()
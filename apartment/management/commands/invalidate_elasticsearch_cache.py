@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apartment.elastic import cache
+
+
+class Command(BaseCommand):
+    help = "Remove the given projects or apartments from the Elasticsearch cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--project",
+            action="append",
+            default=[],
+            dest="project_uuids",
+            help="UUID of a project to invalidate, including its apartments.",
+        )
+        parser.add_argument(
+            "--apartment",
+            action="append",
+            default=[],
+            dest="apartment_uuids",
+            help="UUID of an apartment to invalidate.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["project_uuids"] and not options["apartment_uuids"]:
+            raise CommandError("Give at least one --project or --apartment.")
+        for project_uuid in options["project_uuids"]:
+            cache.invalidate_project(project_uuid)
+        for apartment_uuid in options["apartment_uuids"]:
+            cache.invalidate_apartment(apartment_uuid)
+        self.stdout.write("Done!")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apartment.exceptions import ApartmentDeletionRefusedException
+from apartment.services import sync_apartments
+
+
+class Command(BaseCommand):
+    help = "Copy the changed apartment documents from Elasticsearch to the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--project",
+            action="append",
+            dest="project_uuids",
+            help="UUID of a project to sync. By default all apartments are synced.",
+        )
+        parser.add_argument(
+            "--allow-deletes",
+            action="store_true",
+            help="Delete the apartments missing from Elasticsearch even if there "
+            "are many of them, or Elasticsearch returns no apartments at all.",
+        )
+
+    def handle(self, *args, **options):
+        for project_uuid in options["project_uuids"] or [None]:
+            try:
+                created, updated, deleted = sync_apartments(
+                    project_uuid, allow_deletes=options["allow_deletes"]
+                )
+            except ApartmentDeletionRefusedException as e:
+                raise CommandError(
+                    f"{e} Use --allow-deletes if the apartments were removed."
+                )
+            self.stdout.write(
+                f"Done! Created {created}, updated {updated} and deleted {deleted} "
+                "apartment(s)."
+            )
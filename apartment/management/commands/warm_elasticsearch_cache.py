@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apartment.elastic.queries import warm_project_cache
+
+
+class Command(BaseCommand):
+    help = "Fetch the apartments of the given projects to the Elasticsearch cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument("project_uuids", nargs="+", metavar="project_uuid")
+
+    def handle(self, *args, **options):
+        for project_uuid in options["project_uuids"]:
+            num_of_apartments = warm_project_cache(project_uuid)
+            self.stdout.write(
+                f"Cached project {project_uuid} with {num_of_apartments} apartment(s)."
+            )
@@ -0,0 +1,12 @@
+from apartment.elastic.memo import query_memo
+
+
+class ElasticsearchQueryMemoMiddleware:
+    """Memoize the Elasticsearch queries made while handling a request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with query_memo():
+            return self.get_response(request)
@@ -0,0 +1,118 @@
+# Generated by Django 3.2.14 on 2022-08-31 09:12
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartment", "0012_add_project_extra_data"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Apartment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("uuid", models.UUIDField(unique=True, verbose_name="apartment UUID")),
+                (
+                    "project_uuid",
+                    models.UUIDField(db_index=True, verbose_name="project UUID"),
+                ),
+                (
+                    "project_id",
+                    models.BigIntegerField(null=True, verbose_name="project ID"),
+                ),
+                (
+                    "project_ownership_type",
+                    models.CharField(
+                        blank=True, max_length=32, verbose_name="project ownership type"
+                    ),
+                ),
+                (
+                    "project_housing_company",
+                    models.CharField(
+                        blank=True,
+                        max_length=255,
+                        verbose_name="project housing company",
+                    ),
+                ),
+                (
+                    "project_street_address",
+                    models.CharField(
+                        blank=True,
+                        max_length=255,
+                        verbose_name="project street address",
+                    ),
+                ),
+                (
+                    "project_property_number",
+                    models.CharField(
+                        blank=True,
+                        max_length=32,
+                        verbose_name="project property number",
+                    ),
+                ),
+                (
+                    "apartment_number",
+                    models.CharField(
+                        blank=True, max_length=32, verbose_name="apartment number"
+                    ),
+                ),
+                (
+                    "apartment_structure",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="apartment structure"
+                    ),
+                ),
+                (
+                    "living_area",
+                    models.FloatField(null=True, verbose_name="living area"),
+                ),
+                ("floor", models.IntegerField(null=True, verbose_name="floor")),
+                (
+                    "sales_price",
+                    models.BigIntegerField(null=True, verbose_name="sales price"),
+                ),
+                (
+                    "debt_free_sales_price",
+                    models.BigIntegerField(
+                        null=True, verbose_name="debt free sales price"
+                    ),
+                ),
+                (
+                    "right_of_occupancy_payment",
+                    models.BigIntegerField(
+                        null=True, verbose_name="right of occupancy payment"
+                    ),
+                ),
+                (
+                    "data",
+                    models.JSONField(
+                        default=dict,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        verbose_name="document data",
+                    ),
+                ),
+                (
+                    "data_hash",
+                    models.CharField(max_length=64, verbose_name="document data hash"),
+                ),
+            ],
+            options={
+                "verbose_name": "apartment",
+                "verbose_name_plural": "apartments",
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 3.2.14 on 2022-09-01 10:03
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartment", "0013_apartment"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Project",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "project_uuid",
+                    models.UUIDField(unique=True, verbose_name="project UUID"),
+                ),
+                (
+                    "project_id",
+                    models.BigIntegerField(null=True, verbose_name="project ID"),
+                ),
+                (
+                    "project_ownership_type",
+                    models.CharField(
+                        blank=True,
+                        max_length=32,
+                        verbose_name="project ownership type",
+                    ),
+                ),
+                (
+                    "project_housing_company",
+                    models.CharField(
+                        blank=True,
+                        max_length=255,
+                        verbose_name="project housing company",
+                    ),
+                ),
+                (
+                    "data",
+                    models.JSONField(
+                        default=dict,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        verbose_name="document data",
+                    ),
+                ),
+                (
+                    "data_hash",
+                    models.CharField(max_length=64, verbose_name="document data hash"),
+                ),
+            ],
+            options={
+                "verbose_name": "project",
+                "verbose_name_plural": "projects",
+            },
+        ),
+    ]
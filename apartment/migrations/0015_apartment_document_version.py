@@ -0,0 +1,20 @@
+# Generated by Django 3.2.14 on 2022-09-26 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartment", "0014_project"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apartment",
+            name="document_version",
+            field=models.CharField(
+                blank=True, max_length=64, verbose_name="document version"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.14 on 2022-09-27 08:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apartment", "0015_apartment_document_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="synced_at",
+            field=models.DateTimeField(null=True, verbose_name="synced at"),
+        ),
+    ]
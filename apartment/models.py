@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
@@ -14,3 +15,83 @@ class ProjectExtraData(TimestampedModel):
     offer_message_content = models.TextField(
         verbose_name=_("offer message content"), blank=True
     )
+
+
+class Apartment(TimestampedModel):
+    """
+    A read-only copy of an apartment document in Elasticsearch, including the project
+    fields, so that reservations can be joined to apartment data in SQL. The copy is
+    kept up to date with the sync_apartments management command.
+    """
+
+    uuid = models.UUIDField(verbose_name=_("apartment UUID"), unique=True)
+    project_uuid = models.UUIDField(verbose_name=_("project UUID"), db_index=True)
+    project_id = models.BigIntegerField(verbose_name=_("project ID"), null=True)
+    project_ownership_type = models.CharField(
+        verbose_name=_("project ownership type"), max_length=32, blank=True
+    )
+    project_housing_company = models.CharField(
+        verbose_name=_("project housing company"), max_length=255, blank=True
+    )
+    project_street_address = models.CharField(
+        verbose_name=_("project street address"), max_length=255, blank=True
+    )
+    project_property_number = models.CharField(
+        verbose_name=_("project property number"), max_length=32, blank=True
+    )
+    apartment_number = models.CharField(
+        verbose_name=_("apartment number"), max_length=32, blank=True
+    )
+    apartment_structure = models.CharField(
+        verbose_name=_("apartment structure"), max_length=255, blank=True
+    )
+    living_area = models.FloatField(verbose_name=_("living area"), null=True)
+    floor = models.IntegerField(verbose_name=_("floor"), null=True)
+    sales_price = models.BigIntegerField(verbose_name=_("sales price"), null=True)
+    debt_free_sales_price = models.BigIntegerField(
+        verbose_name=_("debt free sales price"), null=True
+    )
+    right_of_occupancy_payment = models.BigIntegerField(
+        verbose_name=_("right of occupancy payment"), null=True
+    )
+    # The whole _source of the document, for the fields without a column
+    data = models.JSONField(
+        verbose_name=_("document data"), default=dict, encoder=DjangoJSONEncoder
+    )
+    data_hash = models.CharField(verbose_name=_("document data hash"), max_length=64)
+    # Used to skip the apartments whose document has not changed since the last sync
+    document_version = models.CharField(
+        verbose_name=_("document version"), max_length=64, blank=True
+    )
+
+    class Meta:
+        verbose_name = _("apartment")
+        verbose_name_plural = _("apartments")
+
+
+class Project(TimestampedModel):
+    """
+    The project fields of the apartment documents in Elasticsearch, stored once per
+    project, so that a project can be looked up without collapsing its apartments.
+    The record is kept up to date with the sync_apartments management command.
+    """
+
+    project_uuid = models.UUIDField(verbose_name=_("project UUID"), unique=True)
+    project_id = models.BigIntegerField(verbose_name=_("project ID"), null=True)
+    project_ownership_type = models.CharField(
+        verbose_name=_("project ownership type"), max_length=32, blank=True
+    )
+    project_housing_company = models.CharField(
+        verbose_name=_("project housing company"), max_length=255, blank=True
+    )
+    # The project fields of the document
+    data = models.JSONField(
+        verbose_name=_("document data"), default=dict, encoder=DjangoJSONEncoder
+    )
+    data_hash = models.CharField(verbose_name=_("document data hash"), max_length=64)
+    # The time of the last sync that saw the project, whether it changed or not
+    synced_at = models.DateTimeField(verbose_name=_("synced at"), null=True)
+
+    class Meta:
+        verbose_name = _("project")
+        verbose_name_plural = _("projects")
@@ -1,9 +1,22 @@
+import hashlib
+import json
 from datetime import date
 from decimal import Decimal
-from typing import Optional, Union
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from typing import List, Optional, Tuple, Union
+from uuid import UUID
 
-from apartment.elastic.queries import get_apartment
-from apartment.models import ProjectExtraData
+from apartment.elastic import cache as elastic_cache
+from apartment.elastic.queries import (
+    get_apartment,
+    get_apartments_with_versions,
+    iter_apartment_versions,
+)
+from apartment.exceptions import ApartmentDeletionRefusedException
+from apartment.models import Apartment, Project, ProjectExtraData
 from application_form.models import ApartmentReservation, Offer
 
 
@@ -111,3 +124,207 @@ def _get_date_str(value: Union[date, None]) -> str:
     if value is None:
         return "Ei tiedossa"
     return value.strftime("%-d.%-m.%Y")
+
+
+SYNCED_APARTMENT_FIELDS = (
+    "project_uuid",
+    "project_id",
+    "project_ownership_type",
+    "project_housing_company",
+    "project_street_address",
+    "project_property_number",
+    "apartment_number",
+    "apartment_structure",
+    "living_area",
+    "floor",
+    "sales_price",
+    "debt_free_sales_price",
+    "right_of_occupancy_payment",
+    "data",
+    "data_hash",
+    "document_version",
+)
+
+
+def sync_apartments(
+    project_uuid=None, batch_size=500, allow_deletes=False
+) -> Tuple[int, int, int]:
+    """
+    Copy the apartment documents from Elasticsearch to the Apartment model, and their
+    project fields to the Project model. Elasticsearch is first scanned for only the
+    versions of the documents, and only the apartments whose document has been
+    written since the last sync are fetched and saved. The apartments that no longer
+    exist in Elasticsearch are deleted, and so are the projects left without
+    apartments. If a project UUID is given, only the apartments of the project are
+    synced.
+
+    Elasticsearch is scanned before the transaction that writes the changes. If the
+    scan returns no apartments, or more than SYNC_APARTMENTS_MAX_DELETE_RATIO of the
+    synced apartments would be deleted, ApartmentDeletionRefusedException is raised
+    and nothing is written, unless allow_deletes is given.
+
+    Returns the number of created, updated and deleted apartments.
+    """
+    apartments = Apartment.objects.all()
+    if project_uuid:
+        apartments = apartments.filter(project_uuid=project_uuid)
+    existing = {
+        uuid: (pk, document_version)
+        for pk, uuid, document_version in apartments.values_list(
+            "pk", "uuid", "document_version"
+        )
+    }
+
+    versions = {
+        UUID(uuid): version for uuid, version in iter_apartment_versions(project_uuid)
+    }
+    removed = {uuid: pk for uuid, (pk, _) in existing.items() if uuid not in versions}
+    if removed and not allow_deletes:
+        _check_deletions(len(removed), len(existing), len(versions))
+
+    changed = [
+        uuid
+        for uuid, version in versions.items()
+        if uuid not in existing or existing[uuid][1] != version
+    ]
+    project_data = {}
+    to_create = []
+    to_update = []
+    now = timezone.now()
+    for document, version in get_apartments_with_versions(changed):
+        apartment = _build_apartment(document, version)
+        project_data.setdefault(
+            apartment.project_uuid,
+            {
+                name: value
+                for name, value in apartment.data.items()
+                if name.startswith("project_")
+            },
+        )
+        if apartment.uuid in existing:
+            apartment.pk = existing[apartment.uuid][0]
+            apartment.updated_at = now
+            to_update.append(apartment)
+        else:
+            to_create.append(apartment)
+
+    with transaction.atomic():
+        Apartment.objects.bulk_create(to_create, batch_size=batch_size)
+        Apartment.objects.bulk_update(
+            to_update, SYNCED_APARTMENT_FIELDS + ("updated_at",), batch_size=batch_size
+        )
+        deleted, _ = Apartment.objects.filter(pk__in=removed.values()).delete()
+
+        changed_projects = _sync_projects(project_data)
+        Project.objects.filter(
+            project_uuid__in=apartments.values("project_uuid")
+        ).update(synced_at=now)
+        _invalidate_cache_on_commit(
+            {apartment.uuid for apartment in to_update} | set(removed),
+            changed_projects,
+        )
+
+    return len(to_create), len(to_update), deleted
+
+
+def _check_deletions(removed_count: int, existing_count: int, seen_count: int) -> None:
+    """
+    Raise ApartmentDeletionRefusedException if deleting the given number of
+    apartments is likely caused by a failed or partial Elasticsearch scan.
+    """
+    if not seen_count:
+        raise ApartmentDeletionRefusedException(
+            f"Elasticsearch returned no apartments, refusing to delete "
+            f"{removed_count} apartment(s)."
+        )
+    if removed_count > existing_count * settings.SYNC_APARTMENTS_MAX_DELETE_RATIO:
+        raise ApartmentDeletionRefusedException(
+            f"Refusing to delete {removed_count} of {existing_count} apartment(s)."
+        )
+
+
+def _invalidate_cache_on_commit(apartment_uuids, project_uuids) -> None:
+    def invalidate_cache():
+        for apartment_uuid in apartment_uuids:
+            elastic_cache.invalidate_apartment(apartment_uuid)
+        for project_uuid in project_uuids:
+            elastic_cache.invalidate_project(project_uuid)
+
+    transaction.on_commit(invalidate_cache)
+
+
+def _sync_projects(project_data) -> List[UUID]:
+    """
+    Write the changed project fields to the Project model, and delete the projects
+    without apartments. Returns the UUIDs of the changed projects.
+    """
+    existing = {
+        project.project_uuid: project
+        for project in Project.objects.filter(project_uuid__in=project_data)
+    }
+
+    to_create = []
+    to_update = []
+    now = timezone.now()
+    for uuid, data in project_data.items():
+        serialized_data = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+        data_hash = hashlib.sha256(serialized_data.encode()).hexdigest()
+        project = existing.get(uuid) or Project(project_uuid=uuid)
+        if project.pk and project.data_hash == data_hash:
+            continue
+        project.project_id = data.get("project_id")
+        project.project_ownership_type = data.get("project_ownership_type") or ""
+        project.project_housing_company = data.get("project_housing_company") or ""
+        project.data = data
+        project.data_hash = data_hash
+        if project.pk:
+            project.updated_at = now
+            to_update.append(project)
+        else:
+            to_create.append(project)
+
+    Project.objects.bulk_create(to_create)
+    Project.objects.bulk_update(
+        to_update,
+        (
+            "project_id",
+            "project_ownership_type",
+            "project_housing_company",
+            "data",
+            "data_hash",
+            "updated_at",
+        ),
+    )
+    removed = list(
+        Project.objects.exclude(
+            project_uuid__in=Apartment.objects.values("project_uuid")
+        ).values_list("project_uuid", flat=True)
+    )
+    Project.objects.filter(project_uuid__in=removed).delete()
+
+    return [project.project_uuid for project in to_create + to_update] + removed
+
+
+def _build_apartment(document, document_version: str) -> Apartment:
+    data = document.to_dict()
+    serialized_data = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    property_number = data.get("project_property_number")
+    return Apartment(
+        uuid=UUID(document.uuid),
+        project_uuid=UUID(data["project_uuid"]),
+        project_id=data.get("project_id"),
+        project_ownership_type=data.get("project_ownership_type") or "",
+        project_housing_company=data.get("project_housing_company") or "",
+        project_street_address=data.get("project_street_address") or "",
+        project_property_number=str(property_number) if property_number else "",
+        apartment_number=data.get("apartment_number") or "",
+        apartment_structure=data.get("apartment_structure") or "",
+        living_area=data.get("living_area"),
+        floor=data.get("floor"),
+        sales_price=data.get("sales_price"),
+        debt_free_sales_price=data.get("debt_free_sales_price"),
+        right_of_occupancy_payment=data.get("right_of_occupancy_payment"),
+        data=json.loads(serialized_data),
+        data_hash=hashlib.sha256(serialized_data.encode()).hexdigest(),
+        document_version=document_version,
+    )
@@ -1,10 +1,15 @@
+import codecs
 import pytest
 import uuid
 from django.urls import reverse
+from unittest import mock
 from urllib.parse import urlencode
 
+from apartment.api.views import _get_executor, _submit
+from apartment.elastic.memo import _memo, query_memo
 from apartment.elastic.queries import get_project
 from apartment.models import ProjectExtraData
+from apartment.services import sync_apartments
 from apartment.tests.factories import ApartmentDocumentFactory
 from application_form.enums import (
     ApartmentReservationCancellationReason,
@@ -61,8 +66,10 @@ def test_apartment_list_get_with_project_uuid(
         format="json",
     )
     assert response.status_code == 200
-    assert len(response.data) == 5
-    assert response.data[0].get("uuid") == apartments[0].uuid
+    data = response.data
+    assert len(data) == 5
+    # The apartments are listed in the order of their UUIDs
+    assert [a["uuid"] for a in data] == sorted(a.uuid for a in apartments)
 
 
 @pytest.mark.django_db
@@ -169,6 +176,27 @@ def test_project_get_with_project_uuid(
     assert response.data.get("apartments")[0].get("url")
 
 
+def test_submitted_query_sees_the_memo_and_closes_the_connections():
+    with query_memo(), mock.patch(
+        "apartment.api.views.connections.close_all"
+    ) as close_all:
+        memo = _memo.get()
+        future = _submit(_memo.get)
+
+        assert future.result() is memo
+    close_all.assert_called_once_with()
+
+
+def test_executor_is_created_on_first_use(settings):
+    settings.ELASTICSEARCH_EXECUTOR_MAX_WORKERS = 2
+    with mock.patch("apartment.api.views._executor", None):
+        executor = _get_executor()
+
+        assert executor._max_workers == 2
+        assert _get_executor() is executor
+    executor.shutdown()
+
+
 @pytest.mark.django_db
 def test_project_get_with_project_uuid_not_exist(sales_ui_salesperson_api_client):
     response = sales_ui_salesperson_api_client.get(
@@ -202,21 +230,21 @@ def test_project_detail_apartment_reservations(
     for apartment in apartments:
         ApartmentReservationFactory(
             apartment_uuid=apartment.uuid,
-            list_position=1,
-            queue_position=None,
+            list_order=1,
+            queue_order=None,
             state=ApartmentReservationState.CANCELED,
         )
         ApartmentReservationFactory(
             apartment_uuid=apartment.uuid,
-            list_position=2,
-            queue_position=1,
+            list_order=2,
+            queue_order=1,
             state=ApartmentReservationState.RESERVED,
         )
         for i in range(2, 5):
             ApartmentReservationFactory(
                 apartment_uuid=apartment.uuid,
-                list_position=i + 1,
-                queue_position=i,
+                list_order=i + 1,
+                queue_order=i,
                 state=ApartmentReservationState.SUBMITTED,
             )
 
@@ -265,14 +293,14 @@ def test_project_detail_apartment_reservations_has_children(
     for apartment in apartments:
         ApartmentReservationFactory(
             apartment_uuid=apartment.uuid,
-            list_position=1,
-            queue_position=1,
+            list_order=1,
+            queue_order=1,
             state=ApartmentReservationState.SUBMITTED,
         )
         ApartmentReservationFactory(
             apartment_uuid=apartment.uuid,
-            list_position=2,
-            queue_position=2,
+            list_order=2,
+            queue_order=2,
             application_apartment=None,
             state=ApartmentReservationState.SUBMITTED,
         )
@@ -354,7 +382,7 @@ def test_apartment_detail_reservations(
 
     cancelled_reservation = ApartmentReservationFactory(
         apartment_uuid=apartment.uuid,
-        list_position=1,
+        list_order=1,
         application_apartment=None,
         state=ApartmentReservationState.SUBMITTED,
     )
@@ -365,30 +393,30 @@ def test_apartment_detail_reservations(
 
     ApartmentReservationFactory(
         apartment_uuid=apartment.uuid,
-        list_position=2,
-        queue_position=1,
+        list_order=2,
+        queue_order=1,
         state=ApartmentReservationState.RESERVED,
     )
     for i in range(2, 5):
         ApartmentReservationFactory(
             apartment_uuid=apartment.uuid,
-            list_position=i + 1,
-            queue_position=i,
+            list_order=i + 1,
+            queue_order=i,
             state=ApartmentReservationState.SUBMITTED,
         )
 
     # another apartment, should not be returned
     ApartmentReservationFactory(
         apartment_uuid=apartments[1].uuid,
-        list_position=1,
-        queue_position=1,
+        list_order=1,
+        queue_order=1,
         state=ApartmentReservationState.RESERVED,
     )
     # another apartment, should not be returned
     ApartmentReservationFactory(
         apartment_uuid=apartments[1].uuid,
-        list_position=2,
-        queue_position=2,
+        list_order=2,
+        queue_order=2,
         state=ApartmentReservationState.SUBMITTED,
     )
 
@@ -448,6 +476,33 @@ def test_export_applicants_csv_per_project(
         in response.headers["Content-Disposition"]
     )
     assert response.status_code == 200
+    content = b"".join(response.streaming_content)
+    assert content.startswith(codecs.BOM_UTF8 + b'"Primary applicant";')
+    assert content.count(codecs.BOM_UTF8) == 1
+
+
+@pytest.mark.django_db
+def test_export_applicants_csv_etag(
+    sales_ui_salesperson_api_client, elastic_project_with_5_apartments
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    sync_apartments(project_uuid)
+    url = reverse(
+        "apartment:project-detail-export-applicant",
+        kwargs={"project_uuid": project_uuid},
+    )
+    response = sales_ui_salesperson_api_client.get(url)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = sales_ui_salesperson_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    ApartmentReservationFactory(apartment_uuid=apartments[0].uuid)
+    response = sales_ui_salesperson_api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
 
 
 @pytest.mark.django_db
@@ -480,6 +535,7 @@ def test_export_lottery_result_csv_per_project(
     Test export applicants information to CSV
     """
     project_uuid, apartments = elastic_project_with_5_apartments
+    sync_apartments(project_uuid)
     project = get_project(project_uuid)
 
     data = {"project_uuid": uuid.uuid4()}
@@ -525,8 +581,8 @@ def test_project_detail_apartment_states(
     # first apartment
     ApartmentReservationFactory(
         apartment_uuid=apartments[0].uuid,
-        queue_position=1,
-        list_position=1,
+        queue_order=1,
+        list_order=1,
         state=ApartmentReservationState.SUBMITTED,
     )
 
@@ -536,14 +592,14 @@ def test_project_detail_apartment_states(
     # third apartment
     ApartmentReservationFactory(
         apartment_uuid=apartments[2].uuid,
-        queue_position=1,
-        list_position=1,
+        queue_order=1,
+        list_order=1,
         state=ApartmentReservationState.RESERVED,
     )
     ApartmentReservationFactory(
         apartment_uuid=apartments[2].uuid,
-        queue_position=2,
-        list_position=2,
+        queue_order=2,
+        list_order=2,
         state=ApartmentReservationState.SUBMITTED,
     )
     LotteryEventFactory(apartment_uuid=apartments[2].uuid)
@@ -551,14 +607,14 @@ def test_project_detail_apartment_states(
     # fourth apartment
     ApartmentReservationFactory(
         apartment_uuid=apartments[3].uuid,
-        queue_position=1,
-        list_position=1,
+        queue_order=1,
+        list_order=1,
         state=ApartmentReservationState.OFFERED,
     )
     ApartmentReservationFactory(
         apartment_uuid=apartments[3].uuid,
-        queue_position=2,
-        list_position=2,
+        queue_order=2,
+        list_order=2,
         state=ApartmentReservationState.SUBMITTED,
     )
     LotteryEventFactory(apartment_uuid=apartments[3].uuid)
@@ -566,14 +622,14 @@ def test_project_detail_apartment_states(
     # fifth apartment
     ApartmentReservationFactory(
         apartment_uuid=apartments[4].uuid,
-        queue_position=None,
-        list_position=1,
+        queue_order=None,
+        list_order=1,
         state=ApartmentReservationState.CANCELED,
     )
     ApartmentReservationFactory(
         apartment_uuid=apartments[4].uuid,
-        queue_position=1,
-        list_position=2,
+        queue_order=1,
+        list_order=2,
         state=ApartmentReservationState.OFFER_ACCEPTED,
     )
     LotteryEventFactory(apartment_uuid=apartments[4].uuid)
@@ -0,0 +1,82 @@
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+
+from apartment.elastic import cache
+from apartment.elastic.queries import (
+    get_apartment,
+    get_apartment_uuids,
+    get_project,
+    warm_project_cache,
+)
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    cache.ELASTICSEARCH_CACHE_ALIAS: {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "elasticsearch-tests",
+    },
+}
+
+
+@pytest.fixture
+def elasticsearch_cache():
+    with override_settings(CACHES=LOCMEM_CACHES):
+        cache._get_cache().clear()
+        yield cache._get_cache()
+        cache._get_cache().clear()
+
+
+def test_get_apartment_is_cached(elastic_apartments, elasticsearch_cache):
+    apartment = elastic_apartments[0]
+
+    assert get_apartment(apartment.uuid).uuid == apartment.uuid
+    assert get_apartment(apartment.uuid).uuid == apartment.uuid
+    assert cache.get_stats()["apartment"] == {"hits": 1, "misses": 1}
+
+    cached = get_apartment(apartment.uuid, include_project_fields=True)
+    assert cached.project_uuid == apartment.project_uuid
+    assert cache.get_stats()["apartment"] == {"hits": 1, "misses": 2}
+
+
+def test_invalidate_apartment(elastic_apartments, elasticsearch_cache):
+    apartment = elastic_apartments[0]
+    get_apartment(apartment.uuid)
+
+    cache.invalidate_apartment(apartment.uuid)
+    get_apartment(apartment.uuid)
+
+    assert cache.get_stats()["apartment"] == {"hits": 0, "misses": 2}
+
+
+def test_warm_project_cache(elastic_project_with_5_apartments, elasticsearch_cache):
+    project_uuid, apartments = elastic_project_with_5_apartments
+
+    assert warm_project_cache(project_uuid) == 5
+    assert sorted(get_apartment_uuids(project_uuid)) == sorted(
+        apartment.uuid for apartment in apartments
+    )
+    assert get_project(project_uuid).project_uuid == project_uuid
+    for apartment in apartments:
+        assert get_apartment(apartment.uuid).uuid == apartment.uuid
+        assert "project_name" not in get_apartment(apartment.uuid).to_dict()
+
+    stats = cache.get_stats()
+    assert stats["apartment_uuids"] == {"hits": 1, "misses": 0}
+    assert stats["project"] == {"hits": 1, "misses": 0}
+    assert stats["apartment"] == {"hits": 10, "misses": 0}
+
+    cache.invalidate_project(project_uuid)
+    get_project(project_uuid)
+    assert cache.get_stats()["project"] == {"hits": 1, "misses": 1}
+
+
+def test_warm_elasticsearch_cache_command(
+    elastic_project_with_5_apartments, elasticsearch_cache
+):
+    project_uuid, _ = elastic_project_with_5_apartments
+
+    call_command("warm_elasticsearch_cache", project_uuid)
+    get_project(project_uuid)
+
+    assert cache.get_stats()["project"] == {"hits": 1, "misses": 0}
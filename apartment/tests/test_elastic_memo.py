@@ -0,0 +1,31 @@
+import uuid
+
+from apartment.elastic.memo import clear_query_memo, query_memo
+from apartment.elastic.queries import get_apartment, get_project
+
+
+def test_queries_are_memoized_inside_query_memo(elastic_apartments):
+    apartment_uuid = elastic_apartments[0].uuid
+
+    assert get_apartment(apartment_uuid) is not get_apartment(apartment_uuid)
+
+    with query_memo():
+        apartment = get_apartment(apartment_uuid)
+        assert get_apartment(uuid.UUID(apartment_uuid)) is apartment
+        assert get_apartment(apartment_uuid, include_project_fields=True) is not (
+            apartment
+        )
+        with query_memo():
+            assert get_apartment(apartment_uuid) is apartment
+
+        clear_query_memo()
+        assert get_apartment(apartment_uuid) is not apartment
+
+
+def test_query_memo_is_not_shared_between_blocks(elastic_apartments):
+    project_uuid = elastic_apartments[0].project_uuid
+
+    with query_memo():
+        project = get_project(project_uuid)
+    with query_memo():
+        assert get_project(project_uuid) is not project
@@ -0,0 +1,88 @@
+import uuid
+
+from apartment.elastic.queries import (
+    get_apartment,
+    get_apartments_by_uuids,
+    get_apartments_with_versions,
+    iter_apartment_versions,
+    iter_apartments,
+    iter_projects,
+)
+
+
+def test_get_apartments_by_uuids(elastic_project_with_5_apartments):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    missing_uuid = uuid.uuid4()
+
+    result = get_apartments_by_uuids(
+        [uuid.UUID(apartment.uuid) for apartment in apartments] + [missing_uuid]
+    )
+
+    assert set(result) == {apartment.uuid for apartment in apartments}
+    for apartment in apartments:
+        assert result[apartment.uuid].apartment_number == apartment.apartment_number
+        assert "project_uuid" not in result[apartment.uuid].to_dict()
+
+
+def test_get_apartments_by_uuids_include_project_fields(
+    elastic_project_with_5_apartments,
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+
+    result = get_apartments_by_uuids(
+        [apartment.uuid for apartment in apartments], include_project_fields=True
+    )
+
+    assert len(result) == 5
+    assert all(apartment.project_uuid == project_uuid for apartment in result.values())
+
+
+def test_get_apartments_by_uuids_empty():
+    assert get_apartments_by_uuids([]) == {}
+
+
+def test_iter_apartments_paginates(elastic_project_with_5_apartments):
+    project_uuid, apartments = elastic_project_with_5_apartments
+
+    result = list(iter_apartments(project_uuid, page_size=2))
+
+    assert [a.uuid for a in result] == sorted(a.uuid for a in apartments)
+
+
+def test_apartment_versions_change_when_the_document_is_written(
+    elastic_project_with_5_apartments,
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    versions = dict(iter_apartment_versions(project_uuid, page_size=2))
+    assert set(versions) == {apartment.uuid for apartment in apartments}
+
+    apartments[0].apartment_number = "X 1"
+    apartments[0].save(refresh="true")
+
+    new_versions = dict(iter_apartment_versions(project_uuid))
+    assert new_versions[apartments[0].uuid] != versions[apartments[0].uuid]
+    assert all(new_versions[a.uuid] == versions[a.uuid] for a in apartments[1:])
+    ((document, version),) = get_apartments_with_versions([apartments[0].uuid])
+    assert document.apartment_number == "X 1"
+    assert document.project_uuid == project_uuid
+    assert version == new_versions[apartments[0].uuid]
+
+
+def test_iter_projects_paginates(elastic_apartments):
+    result = list(iter_projects(page_size=3))
+
+    assert sorted(p.project_uuid for p in result) == sorted(
+        {a.project_uuid for a in elastic_apartments}
+    )
+
+
+def test_get_apartment_with_projection(elastic_apartments):
+    apartment = elastic_apartments[0]
+
+    result = get_apartment(apartment.uuid, projection="ownership_type")
+
+    assert result.to_dict() == {
+        "uuid": apartment.uuid,
+        "project_uuid": apartment.project_uuid,
+        "project_ownership_type": apartment.project_ownership_type,
+    }
@@ -0,0 +1,113 @@
+import pytest
+import uuid
+from datetime import timedelta
+from django.test import override_settings
+from django.utils import timezone
+from unittest import mock
+
+from apartment.elastic.queries import (
+    get_apartments_with_versions,
+    get_project,
+    iter_apartment_versions,
+)
+from apartment.exceptions import ApartmentDeletionRefusedException
+from apartment.models import Apartment, Project
+from apartment.services import sync_apartments
+
+
+@pytest.mark.django_db
+def test_sync_apartments(elastic_project_with_5_apartments):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    assert sync_apartments(project_uuid) == (5, 0, 0)
+    removed_apartment = Apartment.objects.create(
+        uuid=uuid.uuid4(), project_uuid=project_uuid, data_hash=""
+    )
+
+    assert sync_apartments(project_uuid) == (0, 0, 1)
+
+    assert not Apartment.objects.filter(pk=removed_apartment.pk).exists()
+    for document in apartments:
+        apartment = Apartment.objects.get(uuid=document.uuid)
+        assert str(apartment.project_uuid) == project_uuid
+        assert apartment.project_ownership_type == document.project_ownership_type
+        assert apartment.apartment_number == document.apartment_number
+        assert apartment.data["uuid"] == document.uuid
+
+    # Only the changed apartments are fetched and written
+    Apartment.objects.filter(uuid=apartments[0].uuid).update(document_version="old")
+    with mock.patch(
+        "apartment.services.get_apartments_with_versions",
+        wraps=get_apartments_with_versions,
+    ) as get_apartments_mock:
+        assert sync_apartments(project_uuid) == (0, 1, 0)
+        get_apartments_mock.assert_called_once_with([uuid.UUID(apartments[0].uuid)])
+
+        assert sync_apartments(project_uuid) == (0, 0, 0)
+        get_apartments_mock.assert_called_with([])
+
+
+@pytest.mark.django_db
+def test_sync_apartments_syncs_projects(elastic_project_with_5_apartments):
+    project_uuid, apartments = elastic_project_with_5_apartments
+
+    sync_apartments(project_uuid)
+
+    project = Project.objects.get(project_uuid=project_uuid)
+    assert project.project_housing_company == apartments[0].project_housing_company
+    assert project.data["project_uuid"] == project_uuid
+    assert "uuid" not in project.data
+
+    # The project is looked up from the synced record
+    Project.objects.filter(pk=project.pk).update(
+        data={**project.data, "project_housing_company": "Synced company"}
+    )
+    assert get_project(project_uuid).project_housing_company == "Synced company"
+
+    # A project that has not been synced recently is fetched from Elasticsearch
+    Project.objects.filter(pk=project.pk).update(
+        synced_at=timezone.now() - timedelta(seconds=61)
+    )
+    with override_settings(SYNCED_PROJECT_MAX_AGE=60):
+        assert (
+            get_project(project_uuid).project_housing_company
+            == apartments[0].project_housing_company
+        )
+
+
+@pytest.mark.django_db
+def test_sync_apartments_refuses_to_delete_when_elasticsearch_returns_nothing(
+    elastic_project_with_5_apartments,
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    sync_apartments(project_uuid)
+
+    with mock.patch("apartment.services.iter_apartment_versions", return_value=[]):
+        with pytest.raises(ApartmentDeletionRefusedException):
+            sync_apartments(project_uuid)
+        assert Apartment.objects.filter(project_uuid=project_uuid).count() == 5
+        assert Project.objects.filter(project_uuid=project_uuid).exists()
+
+        assert sync_apartments(project_uuid, allow_deletes=True) == (0, 0, 5)
+    assert not Project.objects.filter(project_uuid=project_uuid).exists()
+
+
+@pytest.mark.django_db
+@override_settings(SYNC_APARTMENTS_MAX_DELETE_RATIO=0.5)
+def test_sync_apartments_refuses_to_delete_most_apartments(
+    elastic_project_with_5_apartments,
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    sync_apartments(project_uuid)
+    versions = list(iter_apartment_versions(project_uuid))
+
+    with mock.patch(
+        "apartment.services.iter_apartment_versions", return_value=versions[:2]
+    ):
+        with pytest.raises(ApartmentDeletionRefusedException):
+            sync_apartments(project_uuid)
+        assert Apartment.objects.filter(project_uuid=project_uuid).count() == 5
+
+    with mock.patch(
+        "apartment.services.iter_apartment_versions", return_value=versions[:3]
+    ):
+        assert sync_apartments(project_uuid) == (0, 0, 2)
@@ -20,7 +20,7 @@ def get_apartment_state_from_apartment_uuid(apartment_uuid):
     ).value
 
 
-def get_apartment_state_of_sale_from_event(event):
+def get_apartment_state_of_sale_from_event(event, apartment=None):
     """
     If there is a reservation marked as Sold in Sales UI, the apartment state of sale
     should be also changed to SOLD
@@ -29,6 +29,8 @@ def get_apartment_state_of_sale_from_event(event):
     If it has any reservations - regardless the status of reservations -
     the apartment should show as RESERVED (varattu) or RESERVED_HASO (käsittelyssä)
     depending on the apartment type
+
+    The apartment of the event can be given if it has already been fetched.
     """
     if event.state == ApartmentReservationState.SOLD:
         return ApartmentStateOfSale.SOLD
@@ -55,9 +57,11 @@ def get_apartment_state_of_sale_from_event(event):
         ):
             return ApartmentStateOfSale.SOLD
 
-    apartment_type = get_apartment(
-        event.reservation.apartment_uuid, include_project_fields=True
-    ).project_ownership_type
+    if apartment is None:
+        apartment = get_apartment(
+            event.reservation.apartment_uuid, projection="ownership_type"
+        )
+    apartment_type = apartment.project_ownership_type
     if apartment_type.lower() == OwnershipType.HASO.value:
         return ApartmentStateOfSale.RESERVED_HASO
     else:
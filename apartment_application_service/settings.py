@@ -31,6 +31,12 @@ env = environ.Env(
         "@localhost/apartment-application",
     ),
     CACHE_URL=(str, "locmemcache://"),
+    ELASTICSEARCH_CACHE_URL=(str, "dummycache://"),
+    ELASTICSEARCH_CACHE_TIMEOUT=(int, 300),
+    ELASTICSEARCH_CACHE_MAX_ENTRIES=(int, 10000),
+    EXPORT_CACHE_URL=(str, "locmemcache://exports"),
+    EXPORT_CACHE_TIMEOUT=(int, 8 * 60 * 60),
+    EXPORT_CACHE_MAX_ENTRIES=(int, 100),
     DEFAULT_FROM_EMAIL=(str, "asuntomyynti@hel.fi"),
     MAIL_MAILGUN_KEY=(str, ""),
     MAIL_MAILGUN_DOMAIN=(str, ""),
@@ -53,6 +59,13 @@ env = environ.Env(
     ELASTICSEARCH_PORT=(int, 9200),
     ELASTICSEARCH_USERNAME=(str, ""),
     ELASTICSEARCH_PASSWORD=(str, ""),
+    ELASTICSEARCH_MAX_CONNECTIONS=(int, 10),
+    ELASTICSEARCH_TIMEOUT=(float, 10.0),
+    ELASTICSEARCH_MAX_RETRIES=(int, 3),
+    ELASTICSEARCH_RETRY_BACKOFF=(float, 0.5),
+    ELASTICSEARCH_SLOW_QUERY_SECONDS=(float, 1.0),
+    ELASTICSEARCH_EXECUTOR_MAX_WORKERS=(int, 4),
+    ELASTICSEARCH_FAKE_FIXTURES=(list, []),
     APARTMENT_INDEX_NAME=(str, "asuntotuotanto-apartments"),
     ETUOVI_SUPPLIER_SOURCE_ITEMCODE=(str, ""),
     ETUOVI_COMPANY_NAME=(str, ""),
@@ -95,6 +108,11 @@ env = environ.Env(
     DRUPAL_SERVER_AUTH_TOKEN=(str, "example-token"),
     DEFAULT_SOLD_APARMENT_TIME_RANGE=(int, 1),
     DEFAULT_APARTMENT_REVALUATION_TIME_RANGE=(int, 1),
+    APARTMENT_QUEUE_LOCK_MODE=(str, "apartment"),
+    HASO_QUEUE_ORDERING_DEFERRED=(bool, False),
+    LOTTERY_JOB_TIMEOUT=(int, 30 * 60),
+    SYNC_APARTMENTS_MAX_DELETE_RATIO=(float, 0.5),
+    SYNCED_PROJECT_MAX_AGE=(int, 60 * 60),
 )
 if os.path.exists(env_file):
     env.read_env(env_file)
@@ -112,7 +130,26 @@ USE_X_FORWARDED_HOST = env.bool("USE_X_FORWARDED_HOST")
 DATABASES = {"default": env.db()}
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
-CACHES = {"default": env.cache()}
+CACHES = {
+    "default": env.cache(),
+    # Cache for the apartment and project documents fetched from Elasticsearch, see
+    # apartment.elastic.cache. Disabled by default. Use a backend shared by all the
+    # processes, e.g. "dbcache://elasticsearch_cache", to share it across processes.
+    "elasticsearch": {
+        **env.cache("ELASTICSEARCH_CACHE_URL"),
+        "TIMEOUT": env.int("ELASTICSEARCH_CACHE_TIMEOUT"),
+        "OPTIONS": {"MAX_ENTRIES": env.int("ELASTICSEARCH_CACHE_MAX_ENTRIES")},
+    },
+    # Cache for the generated project export files, see
+    # application_form.services.export_cache. The files are cached by the data
+    # version of the project, so a cache local to the process never serves stale
+    # files, but a shared backend lets the processes reuse each other's files.
+    "exports": {
+        **env.cache("EXPORT_CACHE_URL"),
+        "TIMEOUT": env.int("EXPORT_CACHE_TIMEOUT"),
+        "OPTIONS": {"MAX_ENTRIES": env.int("EXPORT_CACHE_MAX_ENTRIES")},
+    },
+}
 
 EMAIL_CONFIG = env.email_url("EMAIL_URL", default="consolemail://")
 vars().update(EMAIL_CONFIG)
@@ -192,6 +229,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "simple_history.middleware.HistoryRequestMiddleware",
+    "apartment.middleware.ElasticsearchQueryMemoMiddleware",
 ]
 
 TEMPLATES = [
@@ -343,6 +381,23 @@ ELASTICSEARCH_URL = env("ELASTICSEARCH_URL")
 ELASTICSEARCH_PORT = env("ELASTICSEARCH_PORT")
 ELASTICSEARCH_USERNAME = env("ELASTICSEARCH_USERNAME")
 ELASTICSEARCH_PASSWORD = env("ELASTICSEARCH_PASSWORD")
+# Maximum number of pooled connections per Elasticsearch node
+ELASTICSEARCH_MAX_CONNECTIONS = env("ELASTICSEARCH_MAX_CONNECTIONS")
+# Request timeout in seconds
+ELASTICSEARCH_TIMEOUT = env("ELASTICSEARCH_TIMEOUT")
+# Transient errors are retried this many times, waiting ELASTICSEARCH_RETRY_BACKOFF
+# seconds before the first retry and doubling the wait for each next one
+ELASTICSEARCH_MAX_RETRIES = env("ELASTICSEARCH_MAX_RETRIES")
+ELASTICSEARCH_RETRY_BACKOFF = env("ELASTICSEARCH_RETRY_BACKOFF")
+# Queries taking at least this many seconds are logged as warnings
+ELASTICSEARCH_SLOW_QUERY_SECONDS = env("ELASTICSEARCH_SLOW_QUERY_SECONDS")
+# Maximum number of threads per process running the Elasticsearch queries of the
+# requests concurrently with their database queries. Each thread may hold a pooled
+# connection, so this should not exceed ELASTICSEARCH_MAX_CONNECTIONS.
+ELASTICSEARCH_EXECUTOR_MAX_WORKERS = env("ELASTICSEARCH_EXECUTOR_MAX_WORKERS")
+# Paths of JSON fixtures to answer the Elasticsearch queries from in memory instead of
+# a cluster, e.g. for profiling and load testing. See connections.fake_elasticsearch.
+ELASTICSEARCH_FAKE_FIXTURES = env("ELASTICSEARCH_FAKE_FIXTURES")
 APARTMENT_INDEX_NAME = env("APARTMENT_INDEX_NAME")
 
 # Etuovi settings
@@ -394,6 +449,30 @@ DEFAULT_APARTMENT_REVALUATION_TIME_RANGE = env.int(
     "DEFAULT_APARTMENT_REVALUATION_TIME_RANGE"
 )  # hours
 
+# How apartment queues are locked while they are modified: "apartment" takes an
+# advisory lock per apartment, "table" locks the whole reservation table.
+APARTMENT_QUEUE_LOCK_MODE = env.str("APARTMENT_QUEUE_LOCK_MODE")
+
+# If enabled, HASO applications submitted during the application period are added to
+# the end of the queues without ranking their right of residence numbers. The queues
+# are ranked and ordered once, when the lottery is run, when a late HASO application is
+# added to them, or with the apply_deferred_queue_orders management command.
+HASO_QUEUE_ORDERING_DEFERRED = env.bool("HASO_QUEUE_ORDERING_DEFERRED")
+
+# Seconds after which a running lottery job that has not sent a heartbeat is
+# considered stale, e.g. because its worker died, and is marked as failed.
+LOTTERY_JOB_TIMEOUT = env.int("LOTTERY_JOB_TIMEOUT")
+
+# The largest share of the synced apartments that sync_apartments deletes when they
+# are missing from Elasticsearch. Larger deletions, or any deletion when Elasticsearch
+# returns no apartments, are refused unless they are explicitly allowed.
+SYNC_APARTMENTS_MAX_DELETE_RATIO = env.float("SYNC_APARTMENTS_MAX_DELETE_RATIO")
+
+# Seconds for which a project synced by sync_apartments is used instead of the project
+# in Elasticsearch. Projects that have not been synced within this time are fetched
+# from Elasticsearch, so it should be longer than the interval of the sync.
+SYNCED_PROJECT_MAX_AGE = env.int("SYNCED_PROJECT_MAX_AGE")
+
 # local_settings.py can be used to override environment-specific settings
 # like database and email that differ between development and production.
 local_settings_path = os.path.join(checkout_dir(), "local_settings.py")
@@ -17,7 +17,13 @@ from application_form.api.serializers import (
     ApplicationSerializerBase,
 )
 from application_form.enums import ApartmentReservationState, ApplicationArrivalMethod
-from application_form.models import ApartmentReservation, Applicant, LotteryEvent, Offer
+from application_form.models import (
+    ApartmentReservation,
+    Applicant,
+    LotteryEvent,
+    LotteryJob,
+    Offer,
+)
 from application_form.services.offer import create_offer, update_offer
 from application_form.services.reservation import create_reservation_without_application
 from cost_index.api.serializers import ApartmentRevaluationSerializer
@@ -42,6 +48,23 @@ class ProjectUUIDSerializer(serializers.Serializer):
     project_uuid = UUIDField()
 
 
+class LotteryJobSerializer(EnumSupportSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = LotteryJob
+        fields = (
+            "id",
+            "project_uuid",
+            "state",
+            "apartments_total",
+            "apartments_done",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        )
+        read_only_fields = fields
+
+
 class SalesApplicantSerializer(ApplicantSerializerBase):
     pass
 
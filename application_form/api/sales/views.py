@@ -14,13 +14,18 @@ from rest_framework.decorators import (
     authentication_classes,
     permission_classes,
 )
-from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.exceptions import APIException, NotFound, ValidationError
 from rest_framework.response import Response
 
-from apartment.elastic.queries import get_apartment, get_project
+from apartment.elastic.queries import (
+    get_apartment,
+    get_apartments_by_uuids,
+    get_project,
+)
 from apartment.models import ProjectExtraData
 from apartment.utils import get_apartment_state_of_sale_from_event
 from application_form.api.sales.serializers import (
+    LotteryJobSerializer,
     OfferMessageSerializer,
     OfferSerializer,
     ProjectExtraDataSerializer,
@@ -42,6 +47,7 @@ from application_form.exceptions import ProjectDoesNotHaveApplicationsException
 from application_form.models import (
     ApartmentReservation,
     ApartmentReservationStateChangeEvent,
+    LotteryJob,
     Offer,
 )
 from application_form.pdf import (
@@ -53,8 +59,9 @@ from application_form.permissions import DrupalAuthentication, IsDrupalServer
 from application_form.services.application import cancel_reservation
 from application_form.services.lottery.exceptions import (
     ApplicationTimeNotFinishedException,
+    LotteryJobAlreadyRunningException,
 )
-from application_form.services.lottery.machine import distribute_apartments
+from application_form.services.lottery.jobs import run_lottery_now, submit_lottery_job
 from application_form.services.reservation import (
     transfer_reservation_to_another_customer,
 )
@@ -68,6 +75,9 @@ from users.permissions import IsDjangoSalesperson, IsDrupalSalesperson
 def execute_lottery_for_project(request):
     """
     Run the lottery for the given project.
+
+    The lottery is run right away, but as a lottery job, so that it cannot run at the
+    same time as a pending or running lottery job of the project.
     """
     serializer = ProjectUUIDSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
@@ -80,15 +90,62 @@ def execute_lottery_for_project(request):
         raise NotFound(detail="Project not found.")
 
     try:
-        distribute_apartments(project_uuid, request.user)
+        run_lottery_now(project_uuid, request.user)
     except ProjectDoesNotHaveApplicationsException as ex:
         raise ValidationError(detail="Project does not have applications.") from ex
     except ApplicationTimeNotFinishedException as ex:
         raise ValidationError(detail=str(ex)) from ex
+    except LotteryJobAlreadyRunningException as ex:
+        raise LotteryJobConflict(detail=str(ex)) from ex
 
     return Response({"status": "success"}, status=status.HTTP_200_OK)
 
 
+class LotteryJobConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Project's lottery is already pending or running."
+    default_code = "conflict"
+
+
+class LotteryJobViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    Run the lottery of a project asynchronously.
+
+    Creating a job returns its id right away, and the job can be polled for its
+    progress and outcome. The jobs are run by the run_lottery_jobs management command.
+    """
+
+    queryset = LotteryJob.objects.all()
+    serializer_class = LotteryJobSerializer
+
+    @extend_schema(request=ProjectUUIDSerializer, responses={202: LotteryJobSerializer})
+    def create(self, request, *args, **kwargs):
+        serializer = ProjectUUIDSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        project_uuid = serializer.data.get("project_uuid")
+
+        try:
+            get_project(project_uuid)
+        except ObjectDoesNotExist:
+            raise NotFound(detail="Project not found.")
+
+        try:
+            job = submit_lottery_job(project_uuid, request.user)
+        except ProjectDoesNotHaveApplicationsException as ex:
+            raise ValidationError(detail="Project does not have applications.") from ex
+        except ApplicationTimeNotFinishedException as ex:
+            raise ValidationError(detail=str(ex)) from ex
+        except LotteryJobAlreadyRunningException as ex:
+            raise LotteryJobConflict(detail=str(ex)) from ex
+
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
 @api_view(http_method_names=["GET"])
 @require_http_methods(["GET"])  # For SonarCloud
 @permission_classes([IsDrupalServer])
@@ -132,8 +189,15 @@ def apartment_states(request):
         .distinct("reservation__apartment_uuid")
     )
 
+    state_events = list(state_events)
+    apartments = get_apartments_by_uuids(
+        (e.reservation.apartment_uuid for e in state_events),
+        projection="ownership_type",
+    )
     results = {
-        str(e.reservation.apartment_uuid): get_apartment_state_of_sale_from_event(e)
+        str(e.reservation.apartment_uuid): get_apartment_state_of_sale_from_event(
+            e, apartments.get(str(e.reservation.apartment_uuid))
+        )
         for e in state_events
     }
 
@@ -144,12 +208,17 @@ class SalesApplicationViewSet(ApplicationViewSet):
     serializer_class = SalesApplicationSerializer
     permission_classes = [permissions.IsAuthenticated, IsDrupalSalesperson]
 
+    # Applications are created in batches only by the applicants' own requests
+    batch = None
+
 
 class ApartmentReservationViewSet(
     mixins.RetrieveModelMixin, mixins.CreateModelMixin, viewsets.GenericViewSet
 ):
-    queryset = ApartmentReservation.objects.select_related("offer").prefetch_related(
-        "apartment_installments", "apartment_installments__payments"
+    queryset = (
+        ApartmentReservation.objects.select_related("offer")
+        .prefetch_related("apartment_installments", "apartment_installments__payments")
+        .with_positions()
     )
     serializer_class = RootApartmentReservationSerializer
 
@@ -161,6 +230,7 @@ class ApartmentReservationViewSet(
     @action(methods=["GET"], detail=True)
     def contract(self, request, pk=None):
         reservation = self.get_object()
+        # The same apartment is used for the PDF, so it is fetched only once
         apartment = get_apartment(
             reservation.apartment_uuid, include_project_fields=True
         )
@@ -169,10 +239,10 @@ class ApartmentReservationViewSet(
         ownership_type = apartment.project_ownership_type.lower()
         if ownership_type == "hitas":
             filename = f"hitas_sopimus_{title}" if title else "hitas_sopimus"
-            pdf_data = create_hitas_contract_pdf(reservation)
+            pdf_data = create_hitas_contract_pdf(reservation, apartment)
         elif ownership_type == "haso":
             filename = f"haso_sopimus_{title}" if title else "haso_sopimus"
-            pdf_data = create_haso_contract_pdf(reservation)
+            pdf_data = create_haso_contract_pdf(reservation, apartment)
         else:
             raise ValueError(
                 f"Unknown ownership_type: {apartment.project_ownership_type}"
@@ -204,7 +274,7 @@ class ApartmentReservationViewSet(
         filename = f"haso_luovutuslaskelma{title}" if title else "haso_luovutuslaskelma"
 
         pdf_data = create_haso_release_pdf(
-            request.user.profile_or_user_full_name, reservation
+            request.user.profile_or_user_full_name, reservation, apartment
         )
 
         response = HttpResponse(pdf_data, content_type="application/pdf")
@@ -15,6 +15,7 @@ from application_form.enums import (
     ApartmentReservationCancellationReason,
     ApartmentReservationState,
     ApplicationArrivalMethod,
+    ApplicationBatchItemStatus,
     ApplicationType,
 )
 from application_form.models import (
@@ -164,6 +165,10 @@ class ApplicationSerializer(ApplicationSerializerBase):
         return value
 
     def validate(self, attrs):
+        if self.context.get("batch"):
+            # The applicants of a batch are validated together, see
+            # ApplicationViewSet.batch()
+            return super().validate(attrs)
         project_uuid = attrs["project_id"]
         applicants = []
         profile = self.context["request"].user.profile
@@ -185,6 +190,12 @@ class ApplicationSerializer(ApplicationSerializerBase):
         return super().validate(attrs)
 
 
+class ApplicationBatchResultSerializer(serializers.Serializer):
+    application_uuid = UUIDField(allow_null=True)
+    status = EnumField(ApplicationBatchItemStatus)
+    errors = serializers.JSONField(required=False)
+
+
 class ReservationOfferSerializer(
     EnumSupportSerializerMixin, serializers.ModelSerializer
 ):
@@ -208,6 +219,9 @@ class ApartmentReservationSerializerBase(serializers.ModelSerializer):
         allow_null=True,
         read_only=True,
     )
+    # Annotate the positions to the serialized querysets, see
+    # ApartmentReservation.queue_position
+    queue_position = IntegerField(allow_null=True, read_only=True)
     priority_number = serializers.IntegerField(
         source="application_apartment.priority_number", allow_null=True, read_only=True
     )
@@ -1,14 +1,26 @@
-from rest_framework import permissions
+import uuid
+from django.db import transaction
+from drf_spectacular.utils import extend_schema
+from rest_framework import permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
 from apartment.elastic.queries import get_apartment_uuids
+from application_form import error_codes
 from application_form.api.serializers import (
     ApartmentReservationSerializer,
+    ApplicationBatchResultSerializer,
     ApplicationSerializer,
 )
+from application_form.enums import ApplicationBatchItemStatus
 from application_form.models import ApartmentReservation, Application
+from application_form.services.application import create_applications
+from application_form.validators import ProjectApplicantValidator
+from audit_log import audit_logging
+from audit_log.enums import Operation
 from audit_log.viewsets import AuditLoggingModelViewSet
 
 
@@ -20,6 +32,161 @@ class ApplicationViewSet(AuditLoggingModelViewSet):
     lookup_field = "external_uuid"
     http_method_names = ["post"]
 
+    @extend_schema(
+        description="Create several applications at once. The applications are "
+        "validated and created independently of each other, and a result is returned "
+        "for each of them in the same order. Applications whose UUID already exists "
+        "are not created again.",
+        request=ApplicationSerializer(many=True),
+        responses=ApplicationBatchResultSerializer(many=True),
+    )
+    @action(methods=["POST"], detail=False)
+    def batch(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError("Expected a list of applications.")
+
+        results = []
+        item_serializers = []
+        # The applicants of the whole batch are validated at once below
+        context = {**self.get_serializer_context(), "batch": True}
+        profile = request.user.profile
+        for item in request.data:
+            serializer = self.get_serializer(data=item, context=context)
+            if serializer.is_valid():
+                serializer.validated_data["profile"] = profile
+                results.append(
+                    {
+                        "application_uuid": serializer.validated_data["external_uuid"],
+                        "status": ApplicationBatchItemStatus.CREATED,
+                    }
+                )
+            else:
+                results.append(
+                    {
+                        "application_uuid": None,
+                        "status": ApplicationBatchItemStatus.INVALID,
+                        "errors": serializer.errors,
+                    }
+                )
+            item_serializers.append(serializer)
+        valid_items = [
+            (result, serializer)
+            for result, serializer in zip(results, item_serializers)
+            if result["status"] == ApplicationBatchItemStatus.CREATED
+        ]
+
+        self._exclude_existing_applications(valid_items)
+        self._validate_projects(valid_items)
+
+        valid_items = [
+            (result, serializer)
+            for result, serializer in valid_items
+            if result["status"] == ApplicationBatchItemStatus.CREATED
+        ]
+        if valid_items:
+            actor = self._get_actor()
+            with transaction.atomic():
+                applications = create_applications(
+                    [
+                        serializer.prepare_metadata(serializer.validated_data)
+                        for _, serializer in valid_items
+                    ]
+                )
+                for (result, _), application in zip(valid_items, applications):
+                    if application is None:
+                        # Created by another request after the check above
+                        result["status"] = ApplicationBatchItemStatus.ALREADY_EXISTS
+                        continue
+                    audit_logging.log(actor, Operation.CREATE, application)
+
+        return Response(
+            ApplicationBatchResultSerializer(results, many=True).data,
+            status=status.HTTP_200_OK,
+        )
+
+    @staticmethod
+    def _exclude_existing_applications(items):
+        """
+        Mark the items whose application already exists, either in the database or
+        earlier in the same batch, so that resending a batch is safe.
+        """
+        digests = [
+            Application.get_external_uuid_digest(result["application_uuid"])
+            for result, _ in items
+        ]
+        existing_digests = set(
+            Application.objects.filter(external_uuid_digest__in=digests).values_list(
+                "external_uuid_digest", flat=True
+            )
+        )
+        for (result, _), digest in zip(items, digests):
+            if digest in existing_digests:
+                result["status"] = ApplicationBatchItemStatus.ALREADY_EXISTS
+            existing_digests.add(digest)
+
+    @staticmethod
+    def _validate_projects(items):
+        """
+        Validate that the apartments applied to belong to the project, and that the
+        applicants haven't applied to the project yet, neither earlier nor in the same
+        batch. The apartments of each project are fetched from Elasticsearch only once.
+        """
+        project_apartment_uuids = {}
+        batch_applicants = set()
+        validator = ProjectApplicantValidator()
+        for result, serializer in items:
+            if result["status"] != ApplicationBatchItemStatus.CREATED:
+                continue
+            data = serializer.validated_data
+            project_uuid = data["project_id"]
+            if project_uuid not in project_apartment_uuids:
+                project_apartment_uuids[project_uuid] = [
+                    uuid.UUID(apartment_uuid)
+                    for apartment_uuid in get_apartment_uuids(project_uuid)
+                ]
+            apartment_uuids = project_apartment_uuids[project_uuid]
+
+            invalid_apartments = [
+                str(apartment["identifier"])
+                for apartment in data["apartments"]
+                if apartment["identifier"] not in apartment_uuids
+            ]
+            if invalid_apartments:
+                result["status"] = ApplicationBatchItemStatus.INVALID
+                result["errors"] = {
+                    "apartments": [
+                        f"Apartment {apartment_uuid} does not belong to project "
+                        f"{project_uuid}."
+                        for apartment_uuid in invalid_apartments
+                    ]
+                }
+                continue
+
+            applicants = [(data["profile"].date_of_birth, data["ssn_suffix"])]
+            if data["additional_applicant"]:
+                applicants.append(
+                    (
+                        data["additional_applicant"]["date_of_birth"],
+                        data["additional_applicant"]["ssn_suffix"],
+                    )
+                )
+            try:
+                if batch_applicants.intersection(
+                    (project_uuid, *applicant) for applicant in applicants
+                ):
+                    raise PermissionDenied(
+                        detail="Applicant(s) have already applied to project.",
+                        code=error_codes.E1001_APPLICANT_HAS_ALREADY_APPLIED,
+                    )
+                validator(project_uuid, applicants, apartment_uuids=apartment_uuids)
+            except PermissionDenied as e:
+                result["status"] = ApplicationBatchItemStatus.INVALID
+                result["errors"] = {"non_field_errors": [str(e.detail)]}
+                continue
+            batch_applicants.update(
+                (project_uuid, *applicant) for applicant in applicants
+            )
+
 
 class ListProjectReservations(GenericAPIView):
     """
@@ -37,6 +204,6 @@ class ListProjectReservations(GenericAPIView):
         reservations = ApartmentReservation.objects.filter(
             apartment_uuid__in=apartment_uuid_list,
             application_apartment__application__customer__primary_profile__id=profile_uuid,  # noqa
-        )
+        ).with_positions()
         serializer = self.get_serializer(reservations, many=True)
         return Response(serializer.data)
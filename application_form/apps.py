@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ApplicationFormConfig(AppConfig):
     name = "application_form"
     default_auto_field = "django.db.models.BigAutoField"
+
+    def ready(self):
+        from application_form import signals  # noqa: F401
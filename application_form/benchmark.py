@@ -0,0 +1,476 @@
+"""
+Lottery and application intake benchmarks with synthetic projects.
+
+The Elasticsearch requests of the lottery are answered from the documents of the
+synthetic project by the in-process fake of connections.fake_elasticsearch, so the
+benchmark measures the lottery itself: the wall time, the number of database queries
+and the number of Elasticsearch calls of each phase of the lottery.
+
+The intake benchmark adds applications to the apartment queues concurrently, which
+shows how the locking of the queues scales.
+
+Run them with the benchmark_lottery and benchmark_queue_intake management commands,
+or call run_lottery_benchmark() and run_intake_benchmark() directly.
+"""
+import functools
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import override_settings
+from django.utils import timezone
+from elasticsearch_dsl import connections
+from typing import Callable, Dict, Iterator, List, Optional
+from unittest import mock
+
+from apartment.enums import OwnershipType
+from application_form.enums import ApplicationType
+from application_form.models import ApartmentReservation, Application
+from application_form.services.application import (
+    _reserve_apartments,
+    _reserve_haso_apartment,
+)
+from application_form.services.lottery import haso, hitas, machine
+from application_form.services.lottery.engine import LotteryEngine
+from application_form.services.queue import add_application_to_queues
+from application_form.utils import APARTMENT_QUEUE_LOCK_MODE_APARTMENT
+from connections.elastic_client import create_elasticsearch_client
+from connections.fake_elasticsearch import (
+    FakeElasticsearchConnection,
+    FakeElasticsearchStore,
+)
+from customer.models import Customer
+from users.models import Profile
+
+# The room counts of the synthetic apartments, in turn. The HITAS lottery gives
+# priority to families with children in apartments with at least
+# hitas._PRIORITIZE_CHILDREN_ROOM_THRESHOLD rooms, so both kinds are included.
+ROOM_COUNTS = [1, 2, 3, 4]
+
+PHASES = ["validate", "shuffle", "save_orders", "load", "reserve", "save", "other"]
+
+
+@dataclass
+class PhaseResult:
+    name: str
+    wall_time: float = 0.0
+    db_queries: int = 0
+    es_calls: int = 0
+
+
+@dataclass
+class BenchmarkResult:
+    ownership_type: str
+    apartments: int
+    applications: int
+    reservations: int
+    setup_time: float
+    phases: List[PhaseResult] = field(default_factory=list)
+
+    @property
+    def total(self) -> PhaseResult:
+        return PhaseResult(
+            name="total",
+            wall_time=sum(p.wall_time for p in self.phases),
+            db_queries=sum(p.db_queries for p in self.phases),
+            es_calls=sum(p.es_calls for p in self.phases),
+        )
+
+    def format(self) -> str:
+        lines = [
+            f"{self.ownership_type} project: {self.apartments} apartments, "
+            f"{self.applications} applications, {self.reservations} reservations "
+            f"(setup {self.setup_time:.2f} s)",
+            f"{'phase':<12}{'wall time (s)':>15}{'db queries':>12}{'es calls':>10}",
+        ]
+        for phase in self.phases + [self.total]:
+            lines.append(
+                f"{phase.name:<12}{phase.wall_time:>15.3f}"
+                f"{phase.db_queries:>12}{phase.es_calls:>10}"
+            )
+        return "\n".join(lines)
+
+
+class _CountingConnection(FakeElasticsearchConnection):
+    def __init__(self, on_request: Callable[[], None] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.on_request = on_request
+
+    def perform_request(self, *args, **kwargs):
+        self.on_request()
+        return super().perform_request(*args, **kwargs)
+
+
+class FakeElasticsearch:
+    """
+    The apartment documents of a single synthetic project, served by the in-process
+    Elasticsearch fake, which counts the requests.
+    """
+
+    def __init__(self, project_uuid: uuid.UUID, ownership_type: str, apartments: int):
+        self.calls = 0
+        self.project_uuid = project_uuid
+        self.ownership_type = ownership_type
+        self.apartment_uuids = [str(uuid.uuid4()) for _ in range(apartments)]
+        # Project ids of real projects are positive
+        project_id = -random.randint(1, 2**31)
+        self.documents = [
+            {
+                "uuid": apartment_uuid,
+                "apartment_number": f"A{index}",
+                "room_count": ROOM_COUNTS[index % len(ROOM_COUNTS)],
+                "project_uuid": str(project_uuid),
+                "project_id": project_id,
+                "project_ownership_type": ownership_type,
+                "project_housing_company": "Benchmark housing company",
+                "project_application_end_time": (
+                    timezone.now() - timedelta(days=1)
+                ).isoformat(),
+            }
+            for index, apartment_uuid in enumerate(self.apartment_uuids)
+        ]
+        self.store = FakeElasticsearchStore()
+        self.store.add_documents(self.documents)
+
+    def _count_request(self) -> None:
+        self.calls += 1
+
+    @contextmanager
+    def patch(self) -> Iterator[None]:
+        """Serve the requests of the default connection from the documents."""
+        previous = connections.get_connection()
+        connections.add_connection(
+            "default",
+            create_elasticsearch_client(
+                [settings.ELASTICSEARCH_URL],
+                connection_class=_CountingConnection,
+                store=self.store,
+                on_request=self._count_request,
+            ),
+        )
+        try:
+            yield
+        finally:
+            connections.add_connection("default", previous)
+
+
+class LegacyLotteryEngine:
+    """
+    Reserves the apartments one by one with _reserve_apartments() and
+    _reserve_haso_apartment(), which is how the lottery worked before LotteryEngine.
+    """
+
+    def __init__(self, apartment_uuids, ownership_type):
+        pass
+
+    def reserve_apartments(self, apartment_uuids):
+        _reserve_apartments(apartment_uuids)
+
+    def reserve_haso_apartment(self, apartment_uuid):
+        _reserve_haso_apartment(apartment_uuid)
+
+    def save(self):
+        pass
+
+
+class PhaseRecorder:
+    """
+    Attributes the wall time, database queries and Elasticsearch calls of the lottery
+    to phases. Nested calls are attributed to the outermost phase.
+    """
+
+    def __init__(self, es: FakeElasticsearch):
+        self.es = es
+        self.db_queries = 0
+        self.phases: Dict[str, PhaseResult] = {
+            name: PhaseResult(name) for name in PHASES
+        }
+        self._current: Optional[str] = None
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.db_queries += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        if self._current is not None:
+            yield
+            return
+        self._current = name
+        start = time.perf_counter()
+        db_queries = self.db_queries
+        es_calls = self.es.calls
+        try:
+            yield
+        finally:
+            result = self.phases[name]
+            result.wall_time += time.perf_counter() - start
+            result.db_queries += self.db_queries - db_queries
+            result.es_calls += self.es.calls - es_calls
+            self._current = None
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    @contextmanager
+    def record(self, engine_class) -> Iterator[None]:
+        wrapped = [
+            (machine, "_validate_project_has_applications", "validate"),
+            (machine, "_validate_project_application_time_has_finished", "validate"),
+            (hitas, "_shuffle_applications", "shuffle"),
+            (hitas, "_save_application_orders", "save_orders"),
+            (haso, "_save_application_orders", "save_orders"),
+            (engine_class, "__init__", "load"),
+            (engine_class, "reserve_apartments", "reserve"),
+            (engine_class, "reserve_haso_apartment", "reserve"),
+            (engine_class, "save", "save"),
+        ]
+        with ExitStack() as stack:
+            for target, name, phase in wrapped:
+                stack.enter_context(
+                    mock.patch.object(
+                        target, name, self.wrap(phase, getattr(target, name))
+                    )
+                )
+            for module in (hitas, haso):
+                stack.enter_context(
+                    mock.patch.object(module, "LotteryEngine", engine_class)
+                )
+            stack.enter_context(connection.execute_wrapper(self._count_query))
+            start = time.perf_counter()
+            db_queries = self.db_queries
+            es_calls = self.es.calls
+            yield
+
+        # Whatever was not attributed to any of the phases above
+        other = self.phases["other"]
+        other.wall_time = time.perf_counter() - start
+        other.db_queries = self.db_queries - db_queries
+        other.es_calls = self.es.calls - es_calls
+        for phase in self.phases.values():
+            if phase is not other:
+                other.wall_time -= phase.wall_time
+                other.db_queries -= phase.db_queries
+                other.es_calls -= phase.es_calls
+
+
+def create_application(
+    application_type: ApplicationType,
+    has_children: bool = False,
+    right_of_residence: Optional[int] = None,
+    email: str = "",
+) -> Application:
+    """Create an application of a synthetic customer."""
+    profile = Profile.objects.create(
+        first_name="Benchmark",
+        last_name="Applicant",
+        email=email,
+        phone_number="",
+        street_address="",
+        city="",
+        postal_code="",
+        date_of_birth=date(1980, 1, 1),
+        contact_language="fi",
+    )
+    customer = Customer.objects.create(
+        primary_profile=profile,
+        has_children=has_children,
+        right_of_residence=right_of_residence,
+    )
+    return Application.objects.create(
+        applicants_count=1,
+        type=application_type,
+        right_of_residence=right_of_residence,
+        has_children=has_children,
+        customer=customer,
+        process_number=settings.METADATA_HASO_PROCESS_NUMBER
+        if application_type == ApplicationType.HASO
+        else settings.METADATA_HITAS_PROCESS_NUMBER,
+        handler_information=settings.METADATA_HANDLER_INFORMATION,
+        sender_names="Benchmark Applicant",
+    )
+
+
+def create_synthetic_project(
+    es: FakeElasticsearch,
+    applications: int,
+    priorities: int = 5,
+    children_share: float = 0.5,
+    rng: random.Random = None,
+) -> int:
+    """
+    Create applications to the apartments of the fake project and add them to the
+    queues. Returns the number of created reservations.
+    """
+    rng = rng or random.Random()
+    if es.ownership_type.lower() == OwnershipType.HASO.value:
+        application_type = ApplicationType.HASO
+    else:
+        application_type = ApplicationType.HITAS
+
+    reservations = 0
+    for _ in range(applications):
+        application = create_application(
+            application_type,
+            has_children=rng.random() < children_share,
+            right_of_residence=rng.randint(1, 10 * applications),
+        )
+        apartment_uuids = rng.sample(
+            es.apartment_uuids, min(priorities, len(es.apartment_uuids))
+        )
+        for priority_number, apartment_uuid in enumerate(apartment_uuids, start=1):
+            application.application_apartments.create(
+                apartment_uuid=apartment_uuid, priority_number=priority_number
+            )
+        add_application_to_queues(application)
+        reservations += len(apartment_uuids)
+    return reservations
+
+
+def run_lottery_benchmark(
+    ownership_type: str = "Hitas",
+    apartments: int = 50,
+    applications: int = 200,
+    priorities: int = 5,
+    children_share: float = 0.5,
+    seed: Optional[int] = None,
+    legacy: bool = False,
+) -> BenchmarkResult:
+    """
+    Run the lottery of a synthetic project and measure each of its phases.
+
+    Everything is done in a transaction which is rolled back at the end, so the
+    benchmark leaves no data behind. With legacy=True the apartments are reserved
+    one by one like before LotteryEngine, which gives a baseline to compare against.
+    """
+    rng = random.Random(seed)
+
+    project_uuid = uuid.uuid4()
+    es = FakeElasticsearch(project_uuid, ownership_type, apartments)
+    engine_class = LegacyLotteryEngine if legacy else LotteryEngine
+    recorder = PhaseRecorder(es)
+
+    with transaction.atomic(), es.patch():
+        start = time.perf_counter()
+        reservations = create_synthetic_project(
+            es, applications, priorities, children_share, rng
+        )
+        setup_time = time.perf_counter() - start
+        es.calls = 0
+
+        with recorder.record(engine_class):
+            machine.distribute_apartments(project_uuid)
+
+        transaction.set_rollback(True)
+
+    return BenchmarkResult(
+        ownership_type=ownership_type,
+        apartments=apartments,
+        applications=applications,
+        reservations=reservations,
+        setup_time=setup_time,
+        phases=list(recorder.phases.values()),
+    )
+
+
+@dataclass
+class IntakeBenchmarkResult:
+    lock_mode: str
+    threads: int
+    projects: int
+    applications: int
+    wall_time: float
+
+    def format(self) -> str:
+        return (
+            f"lock mode {self.lock_mode}: {self.applications} applications to "
+            f"{self.projects} projects with {self.threads} threads in "
+            f"{self.wall_time:.2f} s ({self.applications / self.wall_time:.1f} "
+            "applications/s)"
+        )
+
+
+def run_intake_benchmark(
+    lock_mode: str = APARTMENT_QUEUE_LOCK_MODE_APARTMENT,
+    threads: int = 4,
+    projects: int = 4,
+    apartments: int = 10,
+    applications: int = 200,
+    priorities: int = 5,
+    application_type: ApplicationType = ApplicationType.HITAS,
+    seed: Optional[int] = None,
+) -> IntakeBenchmarkResult:
+    """
+    Add applications to the apartment queues from several threads at once and
+    measure the throughput with the given APARTMENT_QUEUE_LOCK_MODE.
+
+    Each application applies to the apartments of one of the projects. The threads
+    use their own database connections, so the data has to be committed and it is
+    deleted at the end. The applications are created by stress test users, so
+    leftovers of an interrupted run can be removed with clean_stress_test_data.
+    """
+    rng = random.Random(seed)
+
+    project_apartment_uuids = [
+        [uuid.uuid4() for _ in range(apartments)] for _ in range(projects)
+    ]
+    created = []
+    for _ in range(applications):
+        application = create_application(
+            application_type,
+            right_of_residence=rng.randint(1, 10 * applications),
+            email=f"TestUser-{uuid.uuid4()}@example.com",
+        )
+        apartment_uuids = rng.choice(project_apartment_uuids)
+        for priority_number, apartment_uuid in enumerate(
+            rng.sample(apartment_uuids, min(priorities, apartments)), start=1
+        ):
+            application.application_apartments.create(
+                apartment_uuid=apartment_uuid, priority_number=priority_number
+            )
+        created.append(application)
+
+    def add_to_queues(thread_applications):
+        try:
+            for application in thread_applications:
+                # Like create_application() does it
+                with transaction.atomic():
+                    add_application_to_queues(application)
+        finally:
+            connection.close()
+
+    try:
+        with override_settings(APARTMENT_QUEUE_LOCK_MODE=lock_mode):
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                start = time.perf_counter()
+                futures = [
+                    executor.submit(add_to_queues, created[i::threads])
+                    for i in range(threads)
+                ]
+                for future in futures:
+                    future.result()
+                wall_time = time.perf_counter() - start
+    finally:
+        ApartmentReservation.objects.filter(
+            apartment_uuid__in=[u for uuids in project_apartment_uuids for u in uuids]
+        ).delete()
+        call_command("clean_stress_test_data")
+
+    return IntakeBenchmarkResult(
+        lock_mode=lock_mode,
+        threads=threads,
+        projects=projects,
+        applications=applications,
+        wall_time=wall_time,
+    )
@@ -44,6 +44,19 @@ class OfferState(Enum):
     REJECTED = "rejected"
 
 
+class LotteryJobState(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class ApplicationBatchItemStatus(Enum):
+    CREATED = "created"
+    ALREADY_EXISTS = "already_exists"
+    INVALID = "invalid"
+
+
 class ApplicationArrivalMethod(Enum):
     ELECTRONICAL_SYSTEM = "electronical_system"
     EMAIL = "email"
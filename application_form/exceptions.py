@@ -7,3 +7,9 @@ class ProjectDoesNotHaveApplicationsException(Exception):
     """
     Applications not exists in project or aparments.
     """
+
+
+class PositionsNotAnnotatedException(Exception):
+    """
+    Positions of an apartment reservation were read without annotating them.
+    """
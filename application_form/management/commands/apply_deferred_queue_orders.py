@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from apartment.elastic.queries import get_apartment_uuids
+from application_form.services.queue import apply_deferred_queue_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Order the apartment queues whose HASO applications were added without "
+        "ordering. Meant to be run when the application period of a project ends."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--project",
+            help="UUID of the project whose queues are ordered. Defaults to all.",
+        )
+
+    def handle(self, *args, **options):
+        apartment_uuids = None
+        if options["project"]:
+            apartment_uuids = get_apartment_uuids(options["project"])
+        num_of_queues = apply_deferred_queue_orders(apartment_uuids)
+        self.stdout.write(f"Done! Ordered {num_of_queues} queue(s).")
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from application_form.benchmark import run_lottery_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the lottery with a synthetic project. Reports the wall time, the "
+        "number of database queries and the number of Elasticsearch calls of each "
+        "phase. The data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ownership-type",
+            choices=["Haso", "Hitas", "Puolihitas"],
+            default="Hitas",
+        )
+        parser.add_argument("--apartments", type=int, default=50)
+        parser.add_argument("--applications", type=int, default=200)
+        parser.add_argument(
+            "--priorities",
+            type=int,
+            default=5,
+            help="Number of apartments applied to by each application.",
+        )
+        parser.add_argument(
+            "--children-share",
+            type=float,
+            default=0.5,
+            help="Share of the applications with children, between 0 and 1.",
+        )
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument(
+            "--legacy",
+            action="store_true",
+            help="Reserve the apartments one by one like before LotteryEngine.",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=1, help="Number of runs to do."
+        )
+
+    def handle(self, *args, **options):
+        for _ in range(options["repeat"]):
+            result = run_lottery_benchmark(
+                ownership_type=options["ownership_type"],
+                apartments=options["apartments"],
+                applications=options["applications"],
+                priorities=options["priorities"],
+                children_share=options["children_share"],
+                seed=options["seed"],
+                legacy=options["legacy"],
+            )
+            self.stdout.write(result.format())
+            self.stdout.write("")
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from application_form.benchmark import run_intake_benchmark
+from application_form.enums import ApplicationType
+from application_form.utils import (
+    APARTMENT_QUEUE_LOCK_MODE_APARTMENT,
+    APARTMENT_QUEUE_LOCK_MODE_TABLE,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark adding applications to the apartment queues concurrently with "
+        "each of the queue lock modes. Uses stress test users, whose data is deleted "
+        "afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--projects", type=int, default=4)
+        parser.add_argument(
+            "--apartments", type=int, default=10, help="Apartments per project."
+        )
+        parser.add_argument("--applications", type=int, default=200)
+        parser.add_argument("--priorities", type=int, default=5)
+        parser.add_argument(
+            "--application-type",
+            choices=[t.value for t in ApplicationType],
+            default=ApplicationType.HITAS.value,
+        )
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument(
+            "--lock-mode",
+            choices=[
+                APARTMENT_QUEUE_LOCK_MODE_APARTMENT,
+                APARTMENT_QUEUE_LOCK_MODE_TABLE,
+            ],
+            action="append",
+            help="Lock mode to benchmark, can be given several times. Default: both.",
+        )
+
+    def handle(self, *args, **options):
+        lock_modes = options["lock_mode"] or [
+            APARTMENT_QUEUE_LOCK_MODE_TABLE,
+            APARTMENT_QUEUE_LOCK_MODE_APARTMENT,
+        ]
+        for lock_mode in lock_modes:
+            result = run_intake_benchmark(
+                lock_mode=lock_mode,
+                threads=options["threads"],
+                projects=options["projects"],
+                apartments=options["apartments"],
+                applications=options["applications"],
+                priorities=options["priorities"],
+                application_type=ApplicationType(options["application_type"]),
+                seed=options["seed"],
+            )
+            self.stdout.write(result.format())
@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import BaseCommand
+
+from apartment.elastic.memo import query_memo
+from application_form.services.lottery.jobs import run_next_lottery_job
+
+
+class Command(BaseCommand):
+    help = "Run pending lottery jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new jobs instead of exiting when none are left.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait between polls when --loop is given.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            with query_memo():
+                job = run_next_lottery_job()
+            if job is not None:
+                self.stdout.write(
+                    f"Lottery job {job.pk} of project {job.project_uuid} "
+                    f"finished: {job.state.value}"
+                )
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
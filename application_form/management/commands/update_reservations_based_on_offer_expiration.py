@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 
+from apartment.elastic.memo import query_memo
 from application_form.services.offer import (
     update_reservations_based_on_offer_expiration,
 )
@@ -12,10 +13,11 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         self.stdout.write("Updating reservations' states based on offer expiration...")
-        (
-            num_of_expired,
-            num_of_unexpired,
-        ) = update_reservations_based_on_offer_expiration()
+        with query_memo():
+            (
+                num_of_expired,
+                num_of_unexpired,
+            ) = update_reservations_based_on_offer_expiration()
         self.stdout.write(
             f'Done! Set {num_of_expired} reservation(s) "expired" and '
             f'{num_of_unexpired} reservation(s) back to "offered".'
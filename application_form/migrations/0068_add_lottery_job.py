@@ -0,0 +1,86 @@
+# Generated by Django 3.2.14 on 2022-08-15 10:12
+
+import django.db.models.deletion
+import enumfields.fields
+from django.conf import settings
+from django.db import migrations, models
+
+import application_form.enums
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("application_form", "0067_fix_metadata_handler"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LotteryJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("project_uuid", models.UUIDField(verbose_name="project uuid")),
+                (
+                    "state",
+                    enumfields.fields.EnumField(
+                        default="pending",
+                        enum=application_form.enums.LotteryJobState,
+                        max_length=10,
+                        verbose_name="state",
+                    ),
+                ),
+                (
+                    "apartments_total",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="apartments total"
+                    ),
+                ),
+                (
+                    "apartments_done",
+                    models.IntegerField(default=0, verbose_name="apartments done"),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="error")),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="started at"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="finished at"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="user",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="lotteryjob",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("state__in", ["pending", "running"])),
+                fields=("project_uuid",),
+                name="lottery_job_project_uuid_active_unq_const",
+            ),
+        ),
+    ]
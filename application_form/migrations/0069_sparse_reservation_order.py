@@ -0,0 +1,91 @@
+# Generated by Django 3.2.14 on 2022-08-17 09:03
+
+from django.db import migrations, models
+import django.db.models.constraints
+
+# Must match POSITION_GAP in application_form.services.queue
+POSITION_GAP = 1 << 20
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("application_form", "0068_add_lottery_job"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="apartmentreservation",
+            name="apt_uuid_list_pos_unq_def_const",
+        ),
+        migrations.RenameField(
+            model_name="apartmentreservation",
+            old_name="queue_position",
+            new_name="queue_order",
+        ),
+        migrations.RenameField(
+            model_name="apartmentreservation",
+            old_name="list_position",
+            new_name="list_order",
+        ),
+        migrations.AlterField(
+            model_name="apartmentreservation",
+            name="queue_order",
+            field=models.BigIntegerField(
+                blank=True, null=True, verbose_name="order in queue"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="apartmentreservation",
+            name="list_order",
+            field=models.BigIntegerField(verbose_name="order in list"),
+        ),
+        migrations.RunSQL(
+            sql=[
+                (
+                    "UPDATE application_form_apartmentreservation "
+                    "SET queue_order = queue_order * %s, list_order = list_order * %s",
+                    [POSITION_GAP, POSITION_GAP],
+                )
+            ],
+            reverse_sql=[
+                # Dense positions are restored with a window function, since the
+                # keys may have been inserted between the original positions
+                """
+                UPDATE application_form_apartmentreservation AS r
+                SET queue_order = p.queue_order, list_order = p.list_order
+                FROM (
+                    SELECT
+                        id,
+                        CASE WHEN queue_order IS NULL THEN NULL ELSE row_number() OVER
+                            (PARTITION BY apartment_uuid ORDER BY queue_order, id)
+                        END AS queue_order,
+                        row_number() OVER
+                            (PARTITION BY apartment_uuid ORDER BY list_order, id)
+                        AS list_order
+                    FROM application_form_apartmentreservation
+                ) AS p
+                WHERE r.id = p.id
+                """
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="apartmentreservation",
+            constraint=models.UniqueConstraint(
+                deferrable=django.db.models.constraints.Deferrable["DEFERRED"],
+                fields=("apartment_uuid", "list_order"),
+                name="apt_uuid_list_order_unq_def_const",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="apartmentreservation",
+            index=models.Index(
+                fields=["apartment_uuid", "queue_order"],
+                name="apt_uuid_queue_order_idx",
+            ),
+        ),
+        migrations.AlterModelOptions(
+            name="apartmentreservation",
+            options={"base_manager_name": "objects"},
+        ),
+    ]
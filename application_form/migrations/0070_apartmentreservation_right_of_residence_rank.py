@@ -0,0 +1,66 @@
+# Generated by Django 3.2.14 on 2022-08-24 10:12
+
+from django.db import migrations, models
+from itertools import groupby
+
+# Must match POSITION_GAP in application_form.services.queue
+POSITION_GAP = 1 << 20
+BATCH_SIZE = 1000
+
+
+def populate_right_of_residence_rank(apps, schema_editor):
+    ApartmentReservation = apps.get_model("application_form", "ApartmentReservation")
+
+    reservations = (
+        ApartmentReservation.objects.exclude(right_of_residence=None)
+        .order_by("apartment_uuid")
+        .only("pk", "apartment_uuid", "right_of_residence")
+    )
+    batch = []
+    for _, apartment_reservations in groupby(
+        reservations.iterator(chunk_size=BATCH_SIZE), lambda r: r.apartment_uuid
+    ):
+        apartment_reservations = sorted(
+            apartment_reservations, key=lambda r: (r.right_of_residence, r.pk)
+        )
+        for index, reservation in enumerate(apartment_reservations, start=1):
+            reservation.right_of_residence_rank = index * POSITION_GAP
+        batch += apartment_reservations
+        if len(batch) >= BATCH_SIZE:
+            ApartmentReservation.objects.bulk_update(
+                batch, ["right_of_residence_rank"], batch_size=BATCH_SIZE
+            )
+            batch = []
+    ApartmentReservation.objects.bulk_update(
+        batch, ["right_of_residence_rank"], batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("application_form", "0069_sparse_reservation_order"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apartmentreservation",
+            name="right_of_residence_rank",
+            field=models.BigIntegerField(
+                blank=True,
+                editable=False,
+                null=True,
+                verbose_name="right of residence rank",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="apartmentreservation",
+            index=models.Index(
+                fields=["apartment_uuid", "right_of_residence_rank"],
+                name="apt_uuid_ror_rank_idx",
+            ),
+        ),
+        migrations.RunPython(
+            populate_right_of_residence_rank, migrations.RunPython.noop
+        ),
+    ]
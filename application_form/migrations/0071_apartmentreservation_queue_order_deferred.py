@@ -0,0 +1,28 @@
+# Generated by Django 3.2.14 on 2022-08-30 08:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("application_form", "0070_apartmentreservation_right_of_residence_rank"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apartmentreservation",
+            name="queue_order_deferred",
+            field=models.BooleanField(
+                default=False, editable=False, verbose_name="queue order deferred"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="apartmentreservation",
+            index=models.Index(
+                condition=models.Q(("queue_order_deferred", True)),
+                fields=["apartment_uuid"],
+                name="apt_uuid_order_deferred_idx",
+            ),
+        ),
+    ]
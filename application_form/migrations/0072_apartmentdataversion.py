@@ -0,0 +1,35 @@
+# Generated by Django 3.2.14 on 2022-09-14 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("application_form", "0071_apartmentreservation_queue_order_deferred"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ApartmentDataVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "apartment_uuid",
+                    models.UUIDField(unique=True, verbose_name="apartment uuid"),
+                ),
+                (
+                    "version",
+                    models.PositiveBigIntegerField(default=0, verbose_name="version"),
+                ),
+            ],
+        ),
+    ]
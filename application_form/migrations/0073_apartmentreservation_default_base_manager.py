@@ -0,0 +1,17 @@
+# Generated by Django 3.2.14 on 2022-09-20 09:41
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("application_form", "0072_apartmentdataversion"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="apartmentreservation",
+            options={},
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 3.2.14 on 2022-09-22 12:08
+
+import hashlib
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def populate_external_uuid_digest(apps, schema_editor):
+    Application = apps.get_model("application_form", "Application")
+
+    digests = set()
+    batch = []
+    for application in (
+        Application.objects.order_by("pk")
+        .only("pk", "external_uuid")
+        .iterator(chunk_size=BATCH_SIZE)
+    ):
+        digest = hashlib.sha256(str(application.external_uuid).encode()).hexdigest()
+        # Applications created twice before the digest existed keep the digest only
+        # in the first one
+        if digest in digests:
+            continue
+        digests.add(digest)
+        application.external_uuid_digest = digest
+        batch.append(application)
+        if len(batch) >= BATCH_SIZE:
+            Application.objects.bulk_update(
+                batch, ["external_uuid_digest"], batch_size=BATCH_SIZE
+            )
+            batch = []
+    Application.objects.bulk_update(
+        batch, ["external_uuid_digest"], batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("application_form", "0073_apartmentreservation_default_base_manager"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="application",
+            name="external_uuid_digest",
+            field=models.CharField(
+                editable=False,
+                max_length=64,
+                null=True,
+                verbose_name="application identifier digest",
+            ),
+        ),
+        migrations.RunPython(populate_external_uuid_digest, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="application",
+            name="external_uuid_digest",
+            field=models.CharField(
+                editable=False,
+                max_length=64,
+                null=True,
+                unique=True,
+                verbose_name="application identifier digest",
+            ),
+        ),
+    ]
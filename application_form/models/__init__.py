@@ -3,9 +3,10 @@ from application_form.models.application import (
     Application,
     ApplicationApartment,
 )
-from application_form.models.lottery import LotteryEvent, LotteryEventResult
+from application_form.models.lottery import LotteryEvent, LotteryEventResult, LotteryJob
 from application_form.models.offer import Offer
 from application_form.models.reservation import (
+    ApartmentDataVersion,
     ApartmentQueueChangeEvent,
     ApartmentReservation,
     ApartmentReservationStateChangeEvent,
@@ -17,6 +18,8 @@ __all__ = [
     "ApplicationApartment",
     "LotteryEvent",
     "LotteryEventResult",
+    "LotteryJob",
+    "ApartmentDataVersion",
     "ApartmentReservation",
     "ApartmentQueueChangeEvent",
     "ApartmentReservationStateChangeEvent",
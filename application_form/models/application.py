@@ -1,3 +1,4 @@
+import hashlib
 from django.core.validators import MinLengthValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
@@ -25,6 +26,15 @@ class Application(TimestampedModel):
     external_uuid = UUIDPGPPublicKeyField(
         _("application identifier"), default=uuid4, editable=False
     )
+    # The external_uuid is encrypted, so it is also stored as a digest that can be
+    # looked up and that makes sure the same application is not created twice
+    external_uuid_digest = models.CharField(
+        _("application identifier digest"),
+        max_length=64,
+        unique=True,
+        null=True,
+        editable=False,
+    )
     applicants_count = IntegerPGPPublicKeyField(_("applicants count"))
     type = EnumPGPPublicKeyField(
         ApplicationType, max_length=15, verbose_name=_("application type")
@@ -57,6 +67,14 @@ class Application(TimestampedModel):
 
     audit_log_id_field = "external_uuid"
 
+    def save(self, *args, **kwargs):
+        self.external_uuid_digest = self.get_external_uuid_digest(self.external_uuid)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def get_external_uuid_digest(external_uuid) -> str:
+        return hashlib.sha256(str(external_uuid).encode()).hexdigest()
+
 
 class Applicant(TimestampedModel):
     first_name = CharPGPPublicKeyField(_("first name"), max_length=30)
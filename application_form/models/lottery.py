@@ -1,8 +1,12 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Q, UniqueConstraint
 from django.utils.translation import gettext_lazy as _
+from enumfields import EnumField
 from pgcrypto.fields import CharPGPPublicKeyField
 
+from apartment_application_service.models import TimestampedModel
+from application_form.enums import LotteryJobState
 from application_form.models.application import ApplicationApartment
 
 User = get_user_model()
@@ -24,3 +28,48 @@ class LotteryEventResult(models.Model):
 
     class Meta:
         unique_together = [("event", "application_apartment")]
+
+
+class LotteryJob(TimestampedModel):
+    """
+    A lottery of a project that is run asynchronously by the run_lottery_jobs
+    management command.
+    """
+
+    project_uuid = models.UUIDField(verbose_name=_("project uuid"))
+    state = EnumField(
+        LotteryJobState, verbose_name=_("state"), default=LotteryJobState.PENDING
+    )
+    apartments_total = models.IntegerField(
+        verbose_name=_("apartments total"), null=True, blank=True
+    )
+    apartments_done = models.IntegerField(verbose_name=_("apartments done"), default=0)
+    error = models.TextField(verbose_name=_("error"), blank=True)
+    user = models.ForeignKey(
+        User,
+        verbose_name=_("user"),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    started_at = models.DateTimeField(
+        verbose_name=_("started at"), null=True, blank=True
+    )
+    finished_at = models.DateTimeField(
+        verbose_name=_("finished at"), null=True, blank=True
+    )
+
+    class Meta:
+        constraints = [
+            # Only one lottery per project can be pending or running at a time
+            UniqueConstraint(
+                name="lottery_job_project_uuid_active_unq_const",
+                fields=["project_uuid"],
+                condition=Q(
+                    state__in=[
+                        LotteryJobState.PENDING.value,
+                        LotteryJobState.RUNNING.value,
+                    ]
+                ),
+            )
+        ]
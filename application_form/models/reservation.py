@@ -1,8 +1,24 @@
+import hashlib
 import uuid
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
-from django.db.models import Deferrable, UniqueConstraint
+from django.db.models import (
+    Case,
+    Count,
+    Deferrable,
+    F,
+    Index,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    UniqueConstraint,
+    Value,
+    When,
+    Window,
+)
+from django.db.models.functions import RowNumber
 from django.utils.translation import gettext_lazy as _
 from enumfields import EnumField
 from pgcrypto.fields import (
@@ -17,6 +33,7 @@ from application_form.enums import (
     ApartmentReservationCancellationReason,
     ApartmentReservationState,
 )
+from application_form.exceptions import PositionsNotAnnotatedException
 from application_form.models import ApplicationApartment
 from audit_log import audit_logging
 from audit_log.enums import Operation
@@ -55,11 +72,70 @@ class ApartmentReservationQuerySet(models.QuerySet):
             return (
                 self.active()
                 .filter(apartment_uuid=apartment_uuid)
-                .earliest("queue_position")
+                .earliest("queue_order", "pk")
             )
         except ApartmentReservation.DoesNotExist:
             return None
 
+    def with_positions(self):
+        """
+        Annotate the dense 1..n queue_position and list_position of each reservation
+        in the queue of its apartment.
+
+        The positions are counted from the whole queue of the apartment, so this can
+        be used with any filtering. The reservations without a queue_order, i.e. the
+        ones removed from the queue, get a null queue_position.
+        """
+        return self.annotate(
+            queue_position=self._get_position_expression("queue_order"),
+            list_position=self._get_position_expression("list_order"),
+        )
+
+    def with_window_positions(self):
+        """
+        Same as with_positions(), but the positions are calculated with a window
+        function over the reservations of the queryset itself. This is cheaper for
+        long queues, but can only be used when the queryset contains the whole queues
+        of its apartments, and the positions cannot be filtered on.
+        """
+        return self.annotate(
+            queue_position=Case(
+                When(queue_order__isnull=True, then=Value(None)),
+                default=self._get_window_position_expression("queue_order"),
+                output_field=IntegerField(),
+            ),
+            list_position=self._get_window_position_expression("list_order"),
+        )
+
+    def _get_position_expression(self, order_field: str):
+        outer_order = OuterRef(order_field)
+        preceding_count = (
+            ApartmentReservationQuerySet(self.model)
+            .filter(apartment_uuid=OuterRef("apartment_uuid"))
+            .filter(
+                Q(**{f"{order_field}__lt": outer_order})
+                | Q(**{order_field: outer_order, "pk__lte": OuterRef("pk")})
+            )
+            .order_by()
+            .values("apartment_uuid")
+            .annotate(count=Count("*"))
+            .values("count")
+        )
+        return Case(
+            When(**{f"{order_field}__isnull": True}, then=Value(None)),
+            default=Subquery(preceding_count),
+            output_field=IntegerField(),
+        )
+
+    @staticmethod
+    def _get_window_position_expression(order_field: str):
+        # NULLs are sorted last, so they do not affect the positions of the others
+        return Window(
+            RowNumber(),
+            partition_by=[F("apartment_uuid")],
+            order_by=[F(order_field).asc(), F("pk").asc()],
+        )
+
 
 class ApartmentReservation(models.Model):
     """
@@ -73,10 +149,19 @@ class ApartmentReservation(models.Model):
         on_delete=models.PROTECT,
         related_name="apartment_reservations",
     )
-    queue_position = models.IntegerField(
-        verbose_name=_("position in queue"), null=True, blank=True
+    # The order of the reservation in the queue and in the list of the apartment. The
+    # keys are sparse so that a reservation can be added or removed without
+    # renumbering the others, see application_form.services.queue. The dense 1..n
+    # positions are available as queue_position and list_position.
+    queue_order = models.BigIntegerField(
+        verbose_name=_("order in queue"), null=True, blank=True
+    )
+    list_order = models.BigIntegerField(_("order in list"))
+    # Set when a HASO application was added to the end of the queue without ordering
+    # it by the right of residence number, see apply_deferred_queue_orders()
+    queue_order_deferred = models.BooleanField(
+        _("queue order deferred"), default=False, editable=False
     )
-    list_position = models.IntegerField(_("position in list"))
     application_apartment = models.OneToOneField(
         ApplicationApartment,
         models.CASCADE,
@@ -103,6 +188,14 @@ class ApartmentReservation(models.Model):
     right_of_residence = IntegerPGPPublicKeyField(
         _("right of residence number"), blank=True, null=True
     )
+    # The order of the right of residence number among the reservations of the
+    # apartment, used for finding the place of a HASO application in the queue
+    # without decrypting the whole queue. The keys are sparse like the queue orders,
+    # so they tell the order of the numbers but not the numbers themselves. See
+    # application_form.services.queue.get_right_of_residence_rank().
+    right_of_residence_rank = models.BigIntegerField(
+        _("right of residence rank"), blank=True, null=True, editable=False
+    )
     # Metadata fields
     handler = CharPGPPublicKeyField(
         verbose_name=_("handler"), max_length=200, blank=True
@@ -114,11 +207,80 @@ class ApartmentReservation(models.Model):
         unique_together = [("apartment_uuid", "application_apartment")]
         constraints = [
             UniqueConstraint(
-                name="apt_uuid_list_pos_unq_def_const",
-                fields=["apartment_uuid", "list_position"],
+                name="apt_uuid_list_order_unq_def_const",
+                fields=["apartment_uuid", "list_order"],
                 deferrable=Deferrable.DEFERRED,
             )
         ]
+        indexes = [
+            Index(
+                name="apt_uuid_queue_order_idx",
+                fields=["apartment_uuid", "queue_order"],
+            ),
+            Index(
+                name="apt_uuid_ror_rank_idx",
+                fields=["apartment_uuid", "right_of_residence_rank"],
+            ),
+            Index(
+                name="apt_uuid_order_deferred_idx",
+                fields=["apartment_uuid"],
+                condition=Q(queue_order_deferred=True),
+            ),
+        ]
+
+    @property
+    def queue_position(self) -> Optional[int]:
+        """
+        The dense 1..n position of the reservation in the queue of its apartment, or
+        None if it has been removed from the queue.
+
+        The positions are not fetched implicitly, because doing that for each
+        reservation of a list would make a query per reservation. Querysets which
+        need them must annotate them with with_positions() or with_window_positions(),
+        or a single reservation can fetch them with refresh_positions().
+        """
+        return self._get_position("queue_position")
+
+    @queue_position.setter
+    def queue_position(self, value: Optional[int]) -> None:
+        self.__dict__["queue_position"] = value
+
+    @property
+    def list_position(self) -> Optional[int]:
+        """The dense 1..n position of the reservation in the list of its apartment."""
+        return self._get_position("list_position")
+
+    @list_position.setter
+    def list_position(self, value: Optional[int]) -> None:
+        self.__dict__["list_position"] = value
+
+    def _get_position(self, name: str) -> Optional[int]:
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            raise PositionsNotAnnotatedException(
+                f"{name} of reservation {self.pk} has not been annotated or fetched"
+            ) from None
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None:
+            # The positions may have changed, so they must be fetched again
+            self.__dict__.pop("queue_position", None)
+            self.__dict__.pop("list_position", None)
+
+    def refresh_positions(self, using=None) -> None:
+        """Fetch the queue_position and list_position of the reservation."""
+        if self.pk is None:
+            self.__dict__.update(queue_position=None, list_position=None)
+            return
+        self.__dict__.update(
+            ApartmentReservation.objects.using(using)
+            .filter(pk=self.pk)
+            .with_positions()
+            .values("queue_position", "list_position")
+            .get()
+        )
 
     @transaction.atomic
     def save(self, *args, **kwargs):
@@ -203,3 +365,71 @@ class ApartmentReservationStateChangeEvent(models.Model):
 
     class Meta:
         ordering = ("id",)
+
+
+class ApartmentDataVersionQuerySet(models.QuerySet):
+    def bump(self, apartment_uuids) -> None:
+        """
+        Increment the data versions of the given apartments, after their
+        reservations, lottery results or the profiles of their applicants have
+        changed.
+
+        The version rows are created and locked in the order of the apartment UUIDs,
+        so that bumps of overlapping apartments cannot deadlock.
+        """
+        apartment_uuids = sorted(
+            {uuid.UUID(str(apartment_uuid)) for apartment_uuid in apartment_uuids}
+        )
+        if not apartment_uuids:
+            return
+        with transaction.atomic():
+            self.bulk_create(
+                [
+                    self.model(apartment_uuid=apartment_uuid)
+                    for apartment_uuid in apartment_uuids
+                ],
+                ignore_conflicts=True,
+            )
+            list(
+                self.filter(apartment_uuid__in=apartment_uuids)
+                .order_by("apartment_uuid")
+                .select_for_update()
+                .values_list("pk", flat=True)
+            )
+            self.filter(apartment_uuid__in=apartment_uuids).update(
+                version=F("version") + 1
+            )
+
+    def get_version(self, apartment_uuids) -> str:
+        """
+        Return the combined data version of the given apartments, e.g. of all the
+        apartments of a project. The version changes whenever the version of one of
+        the apartments changes, or the set of apartments changes.
+        """
+        apartment_uuids = sorted(
+            str(apartment_uuid) for apartment_uuid in apartment_uuids
+        )
+        versions = {
+            str(apartment_uuid): version
+            for apartment_uuid, version in self.filter(
+                apartment_uuid__in=apartment_uuids
+            ).values_list("apartment_uuid", "version")
+        }
+        digest = hashlib.sha256()
+        for apartment_uuid in apartment_uuids:
+            digest.update(
+                f"{apartment_uuid}:{versions.get(apartment_uuid, 0)};".encode()
+            )
+        return digest.hexdigest()
+
+
+class ApartmentDataVersion(models.Model):
+    """
+    The version of the export data of an apartment, used to cache the export files
+    of its project. Apartments without a version have the version 0.
+    """
+
+    apartment_uuid = models.UUIDField(verbose_name=_("apartment uuid"), unique=True)
+    version = models.PositiveBigIntegerField(verbose_name=_("version"), default=0)
+
+    objects = ApartmentDataVersionQuerySet.as_manager()
@@ -6,6 +6,7 @@ from io import BytesIO
 from num2words import num2words
 from typing import ClassVar, Dict, Optional, Union
 
+from apartment.elastic.documents import ApartmentDocument
 from apartment.elastic.queries import get_apartment
 from apartment_application_service.pdf import create_pdf, PDFCurrencyField, PDFData
 from apartment_application_service.utils import SafeAttributeObject
@@ -135,11 +136,20 @@ class HasoReleasePDFData(PDFData):
     }
 
 
-def create_haso_contract_pdf(reservation: ApartmentReservation) -> BytesIO:
+def create_haso_contract_pdf(
+    reservation: ApartmentReservation, apartment: Optional[ApartmentDocument] = None
+) -> BytesIO:
+    """
+    Create the contract PDF of the reservation. The apartment with the project fields
+    can be given if the caller has already fetched it.
+    """
     customer = SafeAttributeObject(reservation.customer)
     primary_profile = SafeAttributeObject(customer.primary_profile)
     secondary_profile = SafeAttributeObject(customer.secondary_profile)
-    apartment = get_apartment(reservation.apartment_uuid, include_project_fields=True)
+    if apartment is None:
+        apartment = get_apartment(
+            reservation.apartment_uuid, include_project_fields=True
+        )
 
     first_payment = SafeAttributeObject(
         reservation.apartment_installments.filter(
@@ -228,12 +238,21 @@ def create_haso_contract_pdf(reservation: ApartmentReservation) -> BytesIO:
 
 
 def create_haso_release_pdf(
-    sales_person_name: str, reservation: ApartmentReservation
+    sales_person_name: str,
+    reservation: ApartmentReservation,
+    apartment: Optional[ApartmentDocument] = None,
 ) -> BytesIO:
+    """
+    Create the release PDF of the reservation. The apartment with the project fields
+    can be given if the caller has already fetched it.
+    """
     customer = SafeAttributeObject(reservation.customer)
     primary_profile = SafeAttributeObject(customer.primary_profile)
     secondary_profile = SafeAttributeObject(customer.secondary_profile)
-    apartment = get_apartment(reservation.apartment_uuid, include_project_fields=True)
+    if apartment is None:
+        apartment = get_apartment(
+            reservation.apartment_uuid, include_project_fields=True
+        )
 
     revaluation = reservation.revaluation
     total_alteration_work_value = total_alteration_work(reservation.apartment_uuid)
@@ -3,8 +3,9 @@ from datetime import date, datetime
 from decimal import Decimal
 from io import BytesIO
 from num2words import num2words
-from typing import ClassVar, Dict, Union
+from typing import ClassVar, Dict, Optional, Union
 
+from apartment.elastic.documents import ApartmentDocument
 from apartment.elastic.queries import get_apartment
 from apartment_application_service.pdf import create_pdf, PDFCurrencyField, PDFData
 from apartment_application_service.utils import SafeAttributeObject
@@ -216,13 +217,21 @@ class HitasContractPDFData(PDFData):
     }
 
 
-def create_hitas_contract_pdf(reservation: ApartmentReservation) -> BytesIO:
+def create_hitas_contract_pdf(
+    reservation: ApartmentReservation, apartment: Optional[ApartmentDocument] = None
+) -> BytesIO:
+    """
+    Create the contract PDF of the reservation. The apartment with the project fields
+    can be given if the caller has already fetched it.
+    """
     customer = SafeAttributeObject(reservation.customer)
     primary_profile = SafeAttributeObject(customer.primary_profile)
     secondary_profile = SafeAttributeObject(customer.secondary_profile)
-    apartment = SafeAttributeObject(
-        get_apartment(reservation.apartment_uuid, include_project_fields=True)
-    )
+    if apartment is None:
+        apartment = get_apartment(
+            reservation.apartment_uuid, include_project_fields=True
+        )
+    apartment = SafeAttributeObject(apartment)
 
     project_installment_templates = ProjectInstallmentTemplate.objects.filter(
         project_uuid=apartment.project_uuid
@@ -2,7 +2,7 @@ import logging
 import uuid
 from datetime import date
 from django.contrib.auth import get_user_model
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.db.models import QuerySet
 from typing import Iterable, List, Optional
 
@@ -20,6 +20,7 @@ from application_form.models import (
     ApplicationApartment,
 )
 from application_form.services.queue import (
+    add_application_apartments_to_queues,
     add_application_to_queues,
     remove_reservation_from_queue,
 )
@@ -49,7 +50,7 @@ def cancel_reservation(
         apartment_reservation.state is not ApartmentReservationState.SUBMITTED
     )
     apartment_uuid = apartment_reservation.apartment_uuid
-    apartment = get_apartment(apartment_uuid, include_project_fields=True)
+    apartment = get_apartment(apartment_uuid, projection="ownership_type")
 
     if (ownership_type := apartment.project_ownership_type.upper()) not in (
         "HASO",
@@ -87,70 +88,149 @@ def create_application(
         "Creating a new application with external UUID %s",
         application_data["external_uuid"],
     )
-    data = application_data.copy()
-    profile = data.pop("profile")
-    additional_applicant_data = data.pop("additional_applicant")
+    application = _build_application(application_data)
+    application.save()
+    Applicant.objects.bulk_create(_build_applicants(application, application_data))
+    ApplicationApartment.objects.bulk_create(
+        _build_application_apartments(application, application_data)
+    )
+
+    _logger.debug(
+        "Application created with external UUID %s", application_data["external_uuid"]
+    )
+    add_application_to_queues(application, user=user)
+    return application
+
+
+@transaction.atomic
+def create_applications(
+    applications_data: List[dict], user: Optional[User] = None
+) -> List[Optional[Application]]:
+    """
+    Create the given applications at once and add them to the apartment queues.
+
+    Each application is inserted in a savepoint of its own, so that an application
+    whose external UUID already exists, e.g. because another request created it at
+    the same time, is skipped and None is returned in its place. The applicants and
+    application apartments are inserted in bulk, and the queues are updated in one
+    locked pass per apartment. The applications are added to the queues in the given
+    order.
+    """
+    _logger.debug("Creating %s new applications", len(applications_data))
+    applications = [
+        _save_new_application(_build_application(application_data))
+        for application_data in applications_data
+    ]
+    applicants = []
+    application_apartments = []
+    for application, application_data in zip(applications, applications_data):
+        if application is None:
+            continue
+        applicants += _build_applicants(application, application_data)
+        application_apartments += _build_application_apartments(
+            application, application_data
+        )
+    Applicant.objects.bulk_create(applicants)
+    ApplicationApartment.objects.bulk_create(application_apartments)
+
+    _logger.debug("%s applications created", sum(a is not None for a in applications))
+    add_application_apartments_to_queues(application_apartments, user=user)
+    return applications
+
+
+def _save_new_application(application: Application) -> Optional[Application]:
+    try:
+        with transaction.atomic():
+            application.save()
+    except IntegrityError:
+        if not Application.objects.filter(
+            external_uuid_digest=application.external_uuid_digest
+        ).exists():
+            raise
+        _logger.info(
+            "Application with external UUID %s already exists",
+            application.external_uuid,
+        )
+        return None
+    return application
+
+
+def _build_application(application_data: dict) -> Application:
+    additional_applicant_data = application_data["additional_applicant"]
     customer = get_or_create_customer_from_profiles(
-        profile, additional_applicant_data, data.get("has_children")
+        application_data["profile"],
+        additional_applicant_data,
+        application_data.get("has_children"),
     )
-    application = Application.objects.create(
-        external_uuid=data.pop("external_uuid"),
+    return Application(
+        external_uuid=application_data["external_uuid"],
         applicants_count=2 if additional_applicant_data else 1,
-        type=data.pop("type"),
-        has_children=data.pop("has_children"),
-        right_of_residence=data.pop("right_of_residence"),
-        has_hitas_ownership=data.pop("has_hitas_ownership"),
-        is_right_of_occupancy_housing_changer=data.pop(
+        type=application_data["type"],
+        has_children=application_data["has_children"],
+        right_of_residence=application_data["right_of_residence"],
+        has_hitas_ownership=application_data["has_hitas_ownership"],
+        is_right_of_occupancy_housing_changer=application_data[
             "is_right_of_occupancy_housing_changer"
-        ),
+        ],
         customer=customer,
-        process_number=data.pop("process_number"),
-        handler_information=data.pop("handler_information"),
-        method_of_arrival=data.pop("method_of_arrival"),
-        sender_names=data.pop("sender_names"),
+        process_number=application_data["process_number"],
+        handler_information=application_data["handler_information"],
+        method_of_arrival=application_data["method_of_arrival"],
+        sender_names=application_data["sender_names"],
     )
-    Applicant.objects.create(
-        first_name=profile.first_name,
-        last_name=profile.last_name,
-        email=profile.email,
-        phone_number=profile.phone_number,
-        street_address=profile.street_address,
-        city=profile.city,
-        postal_code=profile.postal_code,
-        age=_calculate_age(profile.date_of_birth),
-        date_of_birth=profile.date_of_birth,
-        ssn_suffix=application_data["ssn_suffix"],
-        contact_language=profile.contact_language,
-        is_primary_applicant=True,
-        application=application,
-    )
-    if additional_applicant_data:
-        Applicant.objects.create(
-            first_name=additional_applicant_data["first_name"],
-            last_name=additional_applicant_data["last_name"],
-            email=additional_applicant_data["email"],
-            phone_number=additional_applicant_data["phone_number"],
-            street_address=additional_applicant_data["street_address"],
-            city=additional_applicant_data["city"],
-            postal_code=additional_applicant_data["postal_code"],
-            age=_calculate_age(additional_applicant_data["date_of_birth"]),
-            date_of_birth=additional_applicant_data["date_of_birth"],
-            ssn_suffix=additional_applicant_data["ssn_suffix"],
+
+
+def _build_applicants(
+    application: Application, application_data: dict
+) -> List[Applicant]:
+    profile = application_data["profile"]
+    applicants = [
+        Applicant(
+            first_name=profile.first_name,
+            last_name=profile.last_name,
+            email=profile.email,
+            phone_number=profile.phone_number,
+            street_address=profile.street_address,
+            city=profile.city,
+            postal_code=profile.postal_code,
+            age=_calculate_age(profile.date_of_birth),
+            date_of_birth=profile.date_of_birth,
+            ssn_suffix=application_data["ssn_suffix"],
+            contact_language=profile.contact_language,
+            is_primary_applicant=True,
             application=application,
         )
-    apartment_data = data.pop("apartments")
-    for apartment_item in apartment_data:
-        ApplicationApartment.objects.create(
+    ]
+    if additional_applicant_data := application_data["additional_applicant"]:
+        applicants.append(
+            Applicant(
+                first_name=additional_applicant_data["first_name"],
+                last_name=additional_applicant_data["last_name"],
+                email=additional_applicant_data["email"],
+                phone_number=additional_applicant_data["phone_number"],
+                street_address=additional_applicant_data["street_address"],
+                city=additional_applicant_data["city"],
+                postal_code=additional_applicant_data["postal_code"],
+                age=_calculate_age(additional_applicant_data["date_of_birth"]),
+                date_of_birth=additional_applicant_data["date_of_birth"],
+                ssn_suffix=additional_applicant_data["ssn_suffix"],
+                application=application,
+            )
+        )
+    return applicants
+
+
+def _build_application_apartments(
+    application: Application, application_data: dict
+) -> List[ApplicationApartment]:
+    return [
+        ApplicationApartment(
             application=application,
             apartment_uuid=apartment_item["identifier"],
             priority_number=apartment_item["priority"],
         )
-
-    _logger.debug(
-        "Application created with external UUID %s", application_data["external_uuid"]
-    )
-    add_application_to_queues(application, user=user)
-    return application
+        for apartment_item in application_data["apartments"]
+    ]
 
 
 def get_ordered_applications(apartment_uuid: uuid.UUID) -> QuerySet:
@@ -164,7 +244,10 @@ def get_ordered_applications(apartment_uuid: uuid.UUID) -> QuerySet:
         ).exclude(
             apartment_reservation__queue_change_events__type=ApartmentQueueChangeEventType.REMOVED  # noqa: E501
         )
-    ).order_by("application_apartments__apartment_reservation__queue_position")
+    ).order_by(
+        "application_apartments__apartment_reservation__queue_order",
+        "application_apartments__apartment_reservation__id",
+    )
 
 
 def _cancel_lower_priority_apartments(
@@ -185,17 +268,24 @@ def _cancel_lower_priority_apartments(
     states_to_cancel = [ApartmentReservationState.SUBMITTED]
     if cancel_reserved:
         states_to_cancel.append(ApartmentReservationState.RESERVED)
-    app_apartments = application_apartment.application.application_apartments.all()
-    lower_priority_app_apartments = app_apartments.filter(
-        priority_number__gt=application_apartment.priority_number,
-        apartment_reservation__state__in=states_to_cancel,
+    lower_priority_reservations = (
+        ApartmentReservation.objects.filter(
+            application_apartment__application_id=application_apartment.application_id,
+            application_apartment__priority_number__gt=(
+                application_apartment.priority_number
+            ),
+            state__in=states_to_cancel,
+        )
+        .select_related("application_apartment")
+        .with_positions()
+        .order_by("application_apartment_id")
     )
     canceled_winners = []
-    for app_apartment in lower_priority_app_apartments:
-        if app_apartment.apartment_reservation.queue_position == 1:
-            canceled_winners.append(app_apartment)
+    for reservation in lower_priority_reservations:
+        if reservation.queue_position == 1:
+            canceled_winners.append(reservation.application_apartment)
         cancel_reservation(
-            app_apartment.apartment_reservation,
+            reservation,
             cancellation_reason=ApartmentReservationCancellationReason.LOWER_PRIORITY,
         )
     return canceled_winners
@@ -298,7 +388,7 @@ def _reserve_apartment(apartment_uuid: uuid.UUID) -> Optional[ApplicationApartme
                 state=ApartmentReservationState.CANCELED
             )
             .filter(apartment_uuid=apartment_uuid)
-            .order_by("queue_position")
+            .order_by("queue_order", "pk")
             .first()
         )
 
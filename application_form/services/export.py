@@ -1,17 +1,14 @@
+import codecs
 import csv
 import operator
 from abc import abstractmethod
-from django.db.models import Max
-from io import StringIO
-
-from apartment.elastic.queries import (
-    get_apartment,
-    get_apartment_project_uuid,
-    get_apartment_uuids,
-    get_project,
-)
-from apartment.enums import ApartmentState
-from apartment.utils import get_apartment_state_from_apartment_uuid
+from collections import Counter, defaultdict
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, Max, OuterRef, Q, QuerySet, Subquery
+from typing import Iterable, Iterator, Optional
+
+from apartment.models import Apartment
+from application_form.enums import ApartmentReservationState
 from application_form.models import ApartmentReservation, LotteryEvent
 from application_form.utils import get_apartment_number_sort_tuple
 
@@ -52,42 +49,62 @@ def _get_reservation_cell_value(column_name, apartment=None, reservation=None):
     return ""
 
 
+class _Echo:
+    """A file-like object which returns the written value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
 class CSVExportService:
     CSV_DELIMITER = ";"
     FILE_ENCODING = "utf-8-sig"
     COLUMNS = []
 
     @abstractmethod
-    def get_rows(self):
+    def iter_rows(self) -> Iterator[list]:
         pass
 
     @abstractmethod
     def get_row(self, *args, **kwargs):
         pass
 
+    def get_rows(self):
+        return list(self.iter_rows())
+
     def _get_header_row(self):
         return [col[0] for col in self.COLUMNS]
 
     def write_csv_file(self, path):
-        csv_string = self.get_csv_string()
         with open(path, encoding=self.FILE_ENCODING, mode="w") as f:
-            f.write(csv_string)
+            for line in self._iter_csv_lines(self.iter_rows()):
+                f.write(line)
 
     def get_csv_string(self):
-        return self._make_csv(self.get_rows())
+        return self._make_csv(self.iter_rows())
+
+    def iter_csv_bytes(self, rows: Optional[Iterable[list]] = None) -> Iterator[bytes]:
+        """
+        Yield the CSV file encoded line by line, so that it can be streamed without
+        building the whole file in memory. The first line starts with the BOM of
+        the file encoding.
 
-    def _make_csv(self, lines):
-        if len(lines) == 0:
-            return ""
+        The rows are taken from iter_rows(), unless they are given, e.g. already
+        fetched with get_rows() before the response is streamed.
+        """
+        encoder = codecs.getincrementalencoder(self.FILE_ENCODING)()
+        for line in self._iter_csv_lines(self.iter_rows() if rows is None else rows):
+            yield encoder.encode(line)
 
-        io = StringIO()
+    def _make_csv(self, lines: Iterable[list]) -> str:
+        return "".join(self._iter_csv_lines(lines))
+
+    def _iter_csv_lines(self, lines: Iterable[list]) -> Iterator[str]:
         csv_writer = csv.writer(
-            io, delimiter=self.CSV_DELIMITER, quoting=csv.QUOTE_NONNUMERIC
+            _Echo(), delimiter=self.CSV_DELIMITER, quoting=csv.QUOTE_NONNUMERIC
         )
         for line in lines:
-            csv_writer.writerow(line)
-
-        return io.getvalue()
+            yield csv_writer.writerow(line)
 
 
 class ApplicantExportService(CSVExportService):
@@ -107,20 +124,31 @@ class ApplicantExportService(CSVExportService):
     ]
 
     def __init__(self, reservations):
+        if isinstance(reservations, QuerySet):
+            # Fetch the customers and their profiles with the reservations instead
+            # of a few queries per row
+            reservations = reservations.select_related(
+                "customer__primary_profile", "customer__secondary_profile"
+            )
+            if "queue_position" not in reservations.query.annotations:
+                reservations = reservations.with_positions()
         self.reservations = reservations
 
     def get_reservations(self):
         return self.reservations
 
-    def get_rows(self):
-        rows = [self._get_header_row()]
-        for reservation in self.reservations:
-            apartment = get_apartment(
-                reservation.apartment_uuid, include_project_fields=True
-            )
-            row = self.get_row(reservation, apartment)
-            rows.append(row)
-        return rows
+    def iter_rows(self):
+        yield self._get_header_row()
+        reservations = list(self.reservations)
+        apartments = Apartment.objects.in_bulk(
+            {reservation.apartment_uuid for reservation in reservations},
+            field_name="uuid",
+        )
+        for reservation in reservations:
+            apartment = apartments.get(reservation.apartment_uuid)
+            if apartment is None:
+                raise ObjectDoesNotExist("Apartment has not been synced.")
+            yield self.get_row(reservation, apartment)
 
     def get_row(self, reservation, apartment):
         line = []
@@ -157,10 +185,26 @@ class ProjectLotteryResultExportService(CSVExportService):
             ]
 
     def get_reservations_by_apartment_uuid(self, apartment_uuid):
+        return self.get_reservations([apartment_uuid])
+
+    def get_reservations(self, apartment_uuids):
+        """
+        Return the reservations with a lottery result of the given apartments, with
+        the lottery results and the profiles of the customers fetched in the same
+        query.
+        """
         return (
-            ApartmentReservation.objects.filter(apartment_uuid=apartment_uuid)
+            ApartmentReservation.objects.filter(apartment_uuid__in=apartment_uuids)
             .exclude(application_apartment__lotteryeventresult__isnull=True)
-            .order_by("application_apartment__lotteryeventresult__result_position")
+            .select_related(
+                "application_apartment__lotteryeventresult",
+                "customer__primary_profile",
+                "customer__secondary_profile",
+            )
+            .order_by(
+                "apartment_uuid",
+                "application_apartment__lotteryeventresult__result_position",
+            )
         )
 
     def _get_document_title(self, apartment_uuids):
@@ -177,18 +221,28 @@ class ProjectLotteryResultExportService(CSVExportService):
             [self.project.project_housing_company],
         ]
 
-    def get_rows(self):
-        apartment_uuids = get_apartment_uuids(self.project.project_uuid)
-        rows = [*self._get_document_title(apartment_uuids), self._get_header_row()]
-
-        # collect rows first to this dict grouped by apartment number so that they can
-        # be sorted by apartment number for the final result
-        apartment_dict = {}
-
-        for apartment_uuid in apartment_uuids:
-            reservations = self.get_reservations_by_apartment_uuid(apartment_uuid)
-            apartment = get_apartment(apartment_uuid, include_project_fields=True)
-            apartment_dict[apartment.apartment_number] = [
+    def iter_rows(self):
+        apartments = list(
+            Apartment.objects.filter(project_uuid=self.project.project_uuid)
+        )
+        if not apartments:
+            raise ObjectDoesNotExist("Project apartments have not been synced.")
+        apartment_uuids = [apartment.uuid for apartment in apartments]
+        yield from self._get_document_title(apartment_uuids)
+        yield self._get_header_row()
+
+        reservations_by_apartment = defaultdict(list)
+        for reservation in self.get_reservations(apartment_uuids):
+            reservations_by_apartment[reservation.apartment_uuid].append(reservation)
+
+        for apartment in sorted(
+            apartments,
+            key=lambda apartment: get_apartment_number_sort_tuple(
+                apartment.apartment_number
+            ),
+        ):
+            reservations = reservations_by_apartment[apartment.uuid]
+            yield from [
                 self.get_row(apartment=apartment if idx == 0 else None, reservation=r)
                 for idx, r in enumerate(reservations)
             ] or [
@@ -196,16 +250,6 @@ class ProjectLotteryResultExportService(CSVExportService):
                 self.get_row(apartment)
             ]
 
-        for apartment_rows in dict(
-            sorted(
-                apartment_dict.items(),
-                key=lambda item: get_apartment_number_sort_tuple(item[0]),
-            )
-        ).values():
-            rows.extend(apartment_rows)
-
-        return rows
-
     def get_row(self, apartment=None, reservation=None):
         line = []
         for column in self.COLUMNS:
@@ -224,42 +268,47 @@ class SaleReportExportService(CSVExportService):
 
     def __init__(self, sold_events):
         self.sold_events = sold_events
+        self.sold_apartment_uuids = list(
+            sold_events.values_list("reservation__apartment_uuid", flat=True)
+        )
+        # The apartments include the project fields, so that the projects need not
+        # be fetched separately
+        self.sold_apartments = Apartment.objects.in_bulk(
+            set(self.sold_apartment_uuids), field_name="uuid"
+        )
+        if len(self.sold_apartments) < len(set(self.sold_apartment_uuids)):
+            raise ObjectDoesNotExist("Apartment has not been synced.")
         self.project_uuids = self._get_project_uuids()
 
-    def get_rows(self):
-        rows = [self._get_header_row()]
+    def iter_rows(self):
+        yield self._get_header_row()
+        projects = {
+            apartment.project_uuid: apartment
+            for apartment in self.sold_apartments.values()
+        }
+        reported_sold_counts = Counter(
+            self.sold_apartments[apartment_uuid].project_uuid
+            for apartment_uuid in self.sold_apartment_uuids
+        )
+        sold_counts = self._get_sold_counts()
+
         total_hitas_sold = total_haso_sold = total_unsold = 0
         for project_uuid in self.project_uuids:
-            project = get_project(project_uuid)
-            row = self.get_row(project)
-            rows.append(row)
+            row = self.get_row(
+                projects[project_uuid],
+                sold_counts[project_uuid],
+                reported_sold_counts[project_uuid],
+            )
+            yield row
             total_hitas_sold += int(row[1] or 0)
             total_haso_sold += int(row[2] or 0)
             total_unsold += int(row[3])
         # Add a total row at the bottom
-        total_row = ["Total", total_hitas_sold, total_haso_sold, total_unsold]
-        rows.append(total_row)
-        return rows
+        yield ["Total", total_hitas_sold, total_haso_sold, total_unsold]
 
-    def get_row(self, project):
+    def get_row(self, project, total_sold, reported_sold):
         line = []
-        apartment_uuids = get_apartment_uuids(project.project_uuid)
-        total_sold = len(
-            [
-                apartment_uuid
-                for apartment_uuid in apartment_uuids
-                if get_apartment_state_from_apartment_uuid(apartment_uuid)
-                == ApartmentState.SOLD.value
-            ]
-        )
-        reported_sold = len(
-            [
-                e
-                for e in self.sold_events
-                if str(e.reservation.apartment_uuid) in apartment_uuids
-            ]
-        )
-        remaining = project.project_apartment_count - total_sold
+        remaining = project.data["project_apartment_count"] - total_sold
         for column in self.COLUMNS:
             cell_value = ""
             if column[1].startswith(project.project_ownership_type.lower()):
@@ -272,10 +321,31 @@ class SaleReportExportService(CSVExportService):
         return line
 
     def _get_project_uuids(self):
-        project_uuids = set()
-        for e in self.sold_events:
-            project_uuid = get_apartment_project_uuid(
-                e.reservation.apartment_uuid
-            ).project_uuid
-            project_uuids.add(project_uuid)
-        return project_uuids
+        return {apartment.project_uuid for apartment in self.sold_apartments.values()}
+
+    def _get_sold_counts(self):
+        """
+        Return the number of sold apartments of the projects by the project UUID. An
+        apartment is sold if it has a single reserved reservation and that one is
+        sold. The apartments of the projects are looked up from the synced apartments
+        in the same query.
+        """
+        apartments = Apartment.objects.filter(project_uuid__in=self.project_uuids)
+        return Counter(
+            row["project_uuid"]
+            for row in ApartmentReservation.objects.reserved()
+            .filter(apartment_uuid__in=apartments.values("uuid"))
+            .annotate(
+                project_uuid=Subquery(
+                    apartments.filter(uuid=OuterRef("apartment_uuid")).values(
+                        "project_uuid"
+                    )
+                )
+            )
+            .values("project_uuid", "apartment_uuid")
+            .annotate(
+                reserved_count=Count("id"),
+                sold_count=Count("id", filter=Q(state=ApartmentReservationState.SOLD)),
+            )
+            .filter(reserved_count=1, sold_count=1)
+        )
@@ -0,0 +1,100 @@
+"""
+A cache of the generated project export files.
+
+The files are cached by the data version of the project (see ApartmentDataVersion),
+so a file is reused only as long as the data of the project has not changed. The
+files are stored in the Django cache "exports" configured by EXPORT_CACHE_URL, and
+the file of an older version is evicted when the file of a newer one is cached.
+Changes to the Elasticsearch documents are noticed once they are synced to the
+database by sync_apartments.
+"""
+import hashlib
+from django.core.cache import caches
+from typing import Iterator
+
+from apartment.models import Apartment, Project
+from application_form.models import ApartmentDataVersion
+from application_form.services.export import CSVExportService
+
+EXPORT_CACHE_ALIAS = "exports"
+
+
+def _get_cache():
+    return caches[EXPORT_CACHE_ALIAS]
+
+
+def get_project_data_version(project_uuid, apartment_uuids) -> str:
+    """
+    Return the data version of the project with the given apartments. Besides the
+    versions of the reservation data, it covers the project and apartment documents
+    synced to the database, so that it changes when they are synced again.
+    """
+    digest = hashlib.sha256(
+        ApartmentDataVersion.objects.get_version(apartment_uuids).encode()
+    )
+    for queryset in [
+        Project.objects.filter(project_uuid=project_uuid),
+        Apartment.objects.filter(uuid__in=apartment_uuids),
+    ]:
+        for data_hash in sorted(queryset.values_list("data_hash", flat=True)):
+            digest.update(data_hash.encode())
+    return digest.hexdigest()
+
+
+def export_key(export_name: str, project_uuid, data_version: str) -> str:
+    return f"export:{export_name}:{project_uuid}:{data_version}"
+
+
+def latest_export_key(export_name: str, project_uuid) -> str:
+    return f"export:{export_name}:{project_uuid}:latest"
+
+
+def get_etag(export_name: str, project_uuid, data_version: str) -> str:
+    digest = hashlib.sha256(
+        export_key(export_name, project_uuid, data_version).encode()
+    ).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def iter_cached_csv_bytes(
+    export_service: CSVExportService,
+    export_name: str,
+    project_uuid,
+    data_version: str,
+) -> Iterator[bytes]:
+    """
+    Return the cached CSV file of the export, or the file streamed from the export
+    service, which is cached once it is complete.
+
+    The rows of the export are fetched before this returns, so that their queries
+    are run and their errors raised while the response is being created. Only the
+    encoding of the fetched rows is streamed.
+    """
+    cache = _get_cache()
+    key = export_key(export_name, project_uuid, data_version)
+    content = cache.get(key)
+    if content is not None:
+        return iter([content])
+    return _iter_and_cache_csv_bytes(
+        export_service.iter_csv_bytes(export_service.get_rows()),
+        export_name,
+        project_uuid,
+        key,
+    )
+
+
+def _iter_and_cache_csv_bytes(
+    csv_bytes: Iterator[bytes], export_name: str, project_uuid, key: str
+) -> Iterator[bytes]:
+    cache = _get_cache()
+    chunks = []
+    for chunk in csv_bytes:
+        chunks.append(chunk)
+        yield chunk
+
+    # The file of the previous version can no longer be used
+    latest_key = latest_export_key(export_name, project_uuid)
+    previous_key = cache.get(latest_key)
+    if previous_key is not None and previous_key != key:
+        cache.delete(previous_key)
+    cache.set_many({key: b"".join(chunks), latest_key: key})
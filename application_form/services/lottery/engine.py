@@ -0,0 +1,359 @@
+import uuid
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Subquery
+from logging import getLogger
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from apartment.elastic.queries import get_apartment
+from application_form.enums import (
+    ApartmentQueueChangeEventType,
+    ApartmentReservationCancellationReason,
+    ApartmentReservationState,
+)
+from application_form.models import (
+    ApartmentDataVersion,
+    ApartmentQueueChangeEvent,
+    ApartmentReservation,
+    ApartmentReservationStateChangeEvent,
+    ApplicationApartment,
+)
+from audit_log import audit_logging
+from audit_log.enums import Operation
+
+logger = getLogger(__name__)
+
+_VALID_OWNERSHIP_TYPES = ("HASO", "HITAS", "PUOLIHITAS")
+
+
+class LotteryEngine:
+    """
+    Resolves the winners of a project's apartments in memory.
+
+    The reservations of the given apartments, together with the applications and
+    their priorities, are loaded once. The winners and the cascade of lower priority
+    cancellations are then resolved the same way as _reserve_apartments() and
+    _reserve_haso_apartment() in application_form.services.application do it, but
+    without any database or Elasticsearch round trips. Finally save() writes the
+    reservations removed from the queues and the changed states, the state change
+    events, the queue change events and the audit log entries in bulk.
+    """
+
+    def __init__(self, apartment_uuids: Iterable[uuid.UUID], ownership_type: str):
+        self.apartment_uuids = [uuid.UUID(str(a)) for a in apartment_uuids]
+        self._ownership_types = {
+            apartment_uuid: ownership_type.upper()
+            for apartment_uuid in self.apartment_uuids
+        }
+        self._reservations_by_apartment: Dict[
+            uuid.UUID, List[ApartmentReservation]
+        ] = defaultdict(list)
+        self._reservations_by_application: Dict[
+            int, List[ApartmentReservation]
+        ] = defaultdict(list)
+        self._removed_reservation_ids: Set[int] = set()
+
+        self._changed_reservations: Dict[int, ApartmentReservation] = {}
+        self._state_change_events: List[ApartmentReservationStateChangeEvent] = []
+        self._queue_change_events: List[ApartmentQueueChangeEvent] = []
+        self._audit_log_entries: List[Tuple[Operation, object]] = []
+
+        self._load()
+
+    def _load(self) -> None:
+        # Applications can have applied to apartments outside of the given ones, and
+        # cancelling those must shift the queues of those apartments too.
+        application_ids = ApplicationApartment.objects.filter(
+            apartment_uuid__in=self.apartment_uuids
+        ).values("application_id")
+        apartment_uuids = set(self.apartment_uuids) | set(
+            ApplicationApartment.objects.filter(
+                application_id__in=Subquery(application_ids)
+            ).values_list("apartment_uuid", flat=True)
+        )
+
+        reservations = (
+            ApartmentReservation.objects.filter(apartment_uuid__in=apartment_uuids)
+            .with_window_positions()
+            .select_related("application_apartment__application")
+            .order_by("id")
+        )
+        for reservation in reservations:
+            self._reservations_by_apartment[reservation.apartment_uuid].append(
+                reservation
+            )
+
+        application_reservations = [
+            r
+            for reservations in self._reservations_by_apartment.values()
+            for r in reservations
+            if r.application_apartment_id
+        ]
+        for reservation in sorted(
+            application_reservations, key=lambda r: r.application_apartment_id
+        ):
+            self._reservations_by_application[
+                reservation.application_apartment.application_id
+            ].append(reservation)
+
+        self._removed_reservation_ids = set(
+            ApartmentQueueChangeEvent.objects.filter(
+                queue_application__apartment_uuid__in=apartment_uuids,
+                type=ApartmentQueueChangeEventType.REMOVED,
+            ).values_list("queue_application_id", flat=True)
+        )
+
+    @transaction.atomic
+    def save(self) -> None:
+        """Write the resolved lottery result to the database."""
+        ApartmentReservation.objects.bulk_update(
+            self._changed_reservations.values(), ["queue_order", "state"]
+        )
+        ApartmentDataVersion.objects.bump(
+            reservation.apartment_uuid
+            for reservation in self._changed_reservations.values()
+        )
+        ApartmentReservationStateChangeEvent.objects.bulk_create(
+            self._state_change_events
+        )
+        ApartmentQueueChangeEvent.objects.bulk_create(self._queue_change_events)
+        # The targets of the entries have primary keys only after the bulk creates
+        audit_logging.log_many(
+            (None, operation, target) for operation, target in self._audit_log_entries
+        )
+
+    def reserve_apartments(
+        self,
+        apartment_uuids: Iterable[uuid.UUID],
+        cancel_lower_priority_reserved: bool = True,
+    ) -> None:
+        """The in-memory counterpart of _reserve_apartments()."""
+        apartments_to_process = set(uuid.UUID(str(a)) for a in apartment_uuids)
+        while apartments_to_process:
+            for apartment_uuid in apartments_to_process.copy():
+                apartments_to_process.remove(apartment_uuid)
+                winner = self._reserve_apartment(apartment_uuid)
+                if winner is None:
+                    continue
+                canceled_winners = self._cancel_lower_priority_apartments(
+                    winner, cancel_lower_priority_reserved
+                )
+                apartments_to_process.update(r.apartment_uuid for r in canceled_winners)
+
+    def reserve_haso_apartment(self, apartment_uuid: uuid.UUID) -> None:
+        """The in-memory counterpart of _reserve_haso_apartment()."""
+        apartment_uuid = uuid.UUID(str(apartment_uuid))
+        queue = self._get_ordered_queue(apartment_uuid)
+
+        if queue:
+            # There can be a single winner, or multiple winners if there are several
+            # winning candidates with the same right of residence number.
+            min_right_of_residence = _get_application(queue[0]).right_of_residence
+            winning_reservations = [
+                r
+                for r in queue
+                if _get_application(r).right_of_residence == min_right_of_residence
+            ]
+            state = ApartmentReservationState.RESERVED
+            if len(winning_reservations) > 1:
+                state = ApartmentReservationState.REVIEW
+            for reservation in winning_reservations:
+                self._set_state(reservation, state)
+
+            for reservation in winning_reservations:
+                lower_priority_reservations = self._get_lower_priority_reservations(
+                    reservation,
+                    [
+                        ApartmentReservationState.SUBMITTED,
+                        ApartmentReservationState.RESERVED,
+                    ],
+                )
+                for lower_priority_reservation in lower_priority_reservations:
+                    self._cancel_reservation(lower_priority_reservation)
+        else:
+            # There are no applications so the winning reservation is the one that is
+            # first in the queue.
+            winning_reservation = self._get_first_active_reservation(apartment_uuid)
+            if winning_reservation:
+                self._set_state(winning_reservation, ApartmentReservationState.RESERVED)
+
+    def _reserve_apartment(
+        self, apartment_uuid: uuid.UUID
+    ) -> Optional[ApartmentReservation]:
+        # The winning application is whoever is at first position in the queue
+        queue = self._get_ordered_queue(apartment_uuid)
+        if queue:
+            winning_reservation = queue[0]
+        else:
+            # There are no applications so the winning reservation is the first
+            # reservation in the queue
+            winning_reservation = self._get_first_active_reservation(apartment_uuid)
+            if not winning_reservation:
+                return None
+
+        self._set_state(winning_reservation, ApartmentReservationState.RESERVED)
+
+        if not winning_reservation.application_apartment_id:
+            return None
+        return winning_reservation
+
+    def _cancel_lower_priority_apartments(
+        self,
+        winning_reservation: ApartmentReservation,
+        cancel_reserved: bool = True,
+    ) -> List[ApartmentReservation]:
+        states_to_cancel = [ApartmentReservationState.SUBMITTED]
+        if cancel_reserved:
+            states_to_cancel.append(ApartmentReservationState.RESERVED)
+        canceled_winners = []
+        for reservation in self._get_lower_priority_reservations(
+            winning_reservation, states_to_cancel
+        ):
+            if reservation.queue_position == 1:
+                canceled_winners.append(reservation)
+            self._cancel_reservation(reservation)
+        return canceled_winners
+
+    def _cancel_reservation(self, reservation: ApartmentReservation) -> None:
+        """The in-memory counterpart of cancel_reservation()."""
+        was_reserved = reservation.state is not ApartmentReservationState.SUBMITTED
+        apartment_uuid = reservation.apartment_uuid
+        ownership_type = self._get_ownership_type(apartment_uuid)
+        if ownership_type not in _VALID_OWNERSHIP_TYPES:
+            raise ValueError(
+                f"Apartment {apartment_uuid} has an invalid "
+                f"project_ownership_type {ownership_type}"
+            )
+
+        self._remove_reservation_from_queue(reservation)
+
+        if was_reserved:
+            if ownership_type == "HASO":
+                self.reserve_haso_apartment(apartment_uuid)
+            else:
+                self.reserve_apartments([apartment_uuid], False)
+
+        self._audit_log_entries.append((Operation.UPDATE, reservation))
+
+    def _remove_reservation_from_queue(self, reservation: ApartmentReservation) -> None:
+        """The in-memory counterpart of remove_reservation_from_queue()."""
+        old_queue_position = reservation.queue_position
+        reservation.queue_position = None
+        reservation.queue_order = None
+        self._changed_reservations[reservation.pk] = reservation
+
+        if old_queue_position is None:
+            logger.warning(
+                "from_position is None, bad reservation data in apartment uuid"
+                f"{reservation.apartment_uuid}?"
+            )
+        else:
+            # Only the positions used in memory shift, the queue_order of the others
+            # stays the same in the database.
+            for other in self._reservations_by_apartment[reservation.apartment_uuid]:
+                if (
+                    other.queue_position is not None
+                    and other.queue_position >= old_queue_position
+                ):
+                    other.queue_position -= 1
+
+        self._set_state(
+            reservation,
+            ApartmentReservationState.CANCELED,
+            cancellation_reason=ApartmentReservationCancellationReason.LOWER_PRIORITY,
+        )
+        self._queue_change_events.append(
+            ApartmentQueueChangeEvent(
+                queue_application=reservation,
+                type=ApartmentQueueChangeEventType.REMOVED,
+                comment="",
+            )
+        )
+        self._removed_reservation_ids.add(reservation.pk)
+
+    def _set_state(
+        self,
+        reservation: ApartmentReservation,
+        state: ApartmentReservationState,
+        cancellation_reason: ApartmentReservationCancellationReason = None,
+    ) -> None:
+        """The in-memory counterpart of ApartmentReservation.set_state()."""
+        state_change_event = ApartmentReservationStateChangeEvent(
+            reservation=reservation,
+            state=state,
+            comment="",
+            cancellation_reason=cancellation_reason,
+        )
+        self._state_change_events.append(state_change_event)
+        reservation.state = state
+        self._changed_reservations[reservation.pk] = reservation
+        self._audit_log_entries.append((Operation.CREATE, state_change_event))
+
+    def _get_ordered_queue(
+        self, apartment_uuid: uuid.UUID
+    ) -> List[ApartmentReservation]:
+        """
+        Return the application reservations of the apartment that have not been
+        removed from the queue, ordered by their queue position. This matches the
+        ordering of get_ordered_applications().
+        """
+        return sorted(
+            (
+                r
+                for r in self._reservations_by_apartment[apartment_uuid]
+                if r.application_apartment_id
+                and r.pk not in self._removed_reservation_ids
+            ),
+            key=_queue_position_sort_key,
+        )
+
+    def _get_first_active_reservation(
+        self, apartment_uuid: uuid.UUID
+    ) -> Optional[ApartmentReservation]:
+        active_reservations = [
+            r
+            for r in self._reservations_by_apartment[apartment_uuid]
+            if r.state != ApartmentReservationState.CANCELED
+        ]
+        return min(active_reservations, key=_queue_position_sort_key, default=None)
+
+    def _get_lower_priority_reservations(
+        self,
+        reservation: ApartmentReservation,
+        states: List[ApartmentReservationState],
+    ) -> List[ApartmentReservation]:
+        """
+        Return the reservations of the same application that have a lower priority
+        than the given reservation and are in one of the given states.
+        """
+        application_apartment = reservation.application_apartment
+        return [
+            r
+            for r in self._reservations_by_application[
+                application_apartment.application_id
+            ]
+            if r.application_apartment.priority_number
+            > application_apartment.priority_number
+            and r.state in states
+        ]
+
+    def _get_ownership_type(self, apartment_uuid: uuid.UUID) -> str:
+        if apartment_uuid not in self._ownership_types:
+            apartment = get_apartment(apartment_uuid, include_project_fields=True)
+            self._ownership_types[
+                apartment_uuid
+            ] = apartment.project_ownership_type.upper()
+        return self._ownership_types[apartment_uuid]
+
+
+def _get_application(reservation: ApartmentReservation):
+    return reservation.application_apartment.application
+
+
+def _queue_position_sort_key(reservation: ApartmentReservation) -> Tuple:
+    # PostgreSQL sorts NULL values last in ascending order
+    return (
+        reservation.queue_position is None,
+        reservation.queue_position or 0,
+        reservation.pk,
+    )
@@ -12,3 +12,14 @@ class ApplicationTimeNotFinishedException(Exception):
         self, msg="Project's application time is not finished.", *args, **kwargs
     ):
         super().__init__(msg, *args, **kwargs)
+
+
+class LotteryJobAlreadyRunningException(Exception):
+    """
+    Raises when a lottery job of the project is already pending or running.
+    """
+
+    def __init__(
+        self, msg="Project's lottery is already pending or running.", *args, **kwargs
+    ):
+        super().__init__(msg, *args, **kwargs)
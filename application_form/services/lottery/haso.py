@@ -1,28 +1,47 @@
 import uuid
 from django.contrib.auth import get_user_model
+from typing import Callable, Optional
 
-from apartment.elastic.queries import get_apartment_uuids
-from application_form.services.application import _reserve_haso_apartment
-from application_form.services.lottery.utils import _save_application_order
+from apartment.elastic.queries import get_apartment_uuids, get_project
+from application_form.services.lottery.engine import LotteryEngine
+from application_form.services.lottery.utils import _save_application_orders
+from application_form.services.queue import apply_deferred_queue_orders
 
 User = get_user_model()
 
 
-def _distribute_haso_apartments(project_uuid: uuid.UUID, user: User = None) -> None:
+def _distribute_haso_apartments(
+    project_uuid: uuid.UUID,
+    user: User = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> None:
     """
     Declares a winner for each apartment in the project.
 
     This goes through each apartment in the given project, calculates the winner for
     each, and marks the winning application as reserved. Before declaring a winner, the
     state of the apartment queue will be persisted to the database.
+
+    The winners and the cancellations of lower priority applications are resolved in
+    memory and written to the database at once.
+
+    If on_progress is given, it is called with the number of reserved apartments and
+    the total number of apartments after each apartment.
     """
     apartment_uuids = get_apartment_uuids(project_uuid)
 
+    # Order the queues whose ordering was deferred during the application period
+    apply_deferred_queue_orders(apartment_uuids)
+
     # Persist the initial order of applications
-    for apartment_uuid in apartment_uuids:
-        _save_application_order(apartment_uuid, user)
+    _save_application_orders(apartment_uuids, user)
 
     # Reserve each apartment. This will modify the queue of each apartment, since
     # apartment applications with lower priority may get canceled.
-    for apartment_uuid in apartment_uuids:
-        _reserve_haso_apartment(apartment_uuid)
+    project = get_project(project_uuid)
+    engine = LotteryEngine(apartment_uuids, project.project_ownership_type)
+    for index, apartment_uuid in enumerate(apartment_uuids, start=1):
+        engine.reserve_haso_apartment(apartment_uuid)
+        if on_progress:
+            on_progress(index, len(apartment_uuids))
+    engine.save()
@@ -1,13 +1,13 @@
 import secrets
 import uuid
 from django.contrib.auth import get_user_model
-from django.db import transaction
-from django.db.models import QuerySet
+from typing import Callable, Dict, List, Optional
 
-from apartment.elastic.queries import get_apartment, get_apartment_uuids
-from application_form.models import ApplicationApartment
-from application_form.services.application import _reserve_apartments
-from application_form.services.lottery.utils import _save_application_order
+from apartment.elastic.queries import get_apartment, get_apartment_uuids, get_project
+from application_form.models import ApartmentDataVersion, ApartmentReservation
+from application_form.services.lottery.engine import LotteryEngine
+from application_form.services.lottery.utils import _save_application_orders
+from application_form.services.queue import POSITION_GAP
 
 User = get_user_model()
 # If the number of rooms in an apartment is greater or equal to this threshold,
@@ -15,23 +15,38 @@ User = get_user_model()
 _PRIORITIZE_CHILDREN_ROOM_THRESHOLD = 3
 
 
-def _distribute_hitas_apartments(project_uuid: uuid.UUID, user: User = None) -> None:
+def _distribute_hitas_apartments(
+    project_uuid: uuid.UUID,
+    user: User = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> None:
     """
     Declares a winner for each apartment in the project.
 
     This goes through each apartment in the given project, calculates the winner for
     each, and marks the winning application as reserved. Before declaring a winner, the
     state of the apartment queue will be persisted to the database.
+
+    The winners and the cancellations of lower priority applications are resolved in
+    memory and written to the database at once.
+
+    If on_progress is given, it is called with the number of shuffled apartments and
+    the total number of apartments after each apartment.
     """
 
     apartment_uuids = get_apartment_uuids(project_uuid)
 
     # Perform lottery and persist the initial order of applications
-    for apartment_uuid in apartment_uuids:
+    for index, apartment_uuid in enumerate(apartment_uuids, start=1):
         _shuffle_applications(apartment_uuid)
-        _save_application_order(apartment_uuid, user)
+        if on_progress:
+            on_progress(index, len(apartment_uuids))
+    _save_application_orders(apartment_uuids, user)
 
-    _reserve_apartments(apartment_uuids)
+    project = get_project(project_uuid)
+    engine = LotteryEngine(apartment_uuids, project.project_ownership_type)
+    engine.reserve_apartments(apartment_uuids)
+    engine.save()
 
 
 def _shuffle_applications(apartment_uuid: uuid.UUID) -> None:
@@ -47,49 +62,76 @@ def _shuffle_applications(apartment_uuid: uuid.UUID) -> None:
     The first positions in the apartment queue will go to applications with children, in
     random order. The remaining positions will go to the applications without children,
     in random order.
+
+    The new positions of all the applications are written with a single query.
     """
     apartment = get_apartment(apartment_uuid)
-    apartment_apps = ApplicationApartment.objects.filter(apartment_uuid=apartment_uuid)
+    apartment_reservations = ApartmentReservation.objects.filter(
+        application_apartment__apartment_uuid=apartment_uuid
+    ).order_by("application_apartment_id")
 
     # If the apartment has enough rooms, applications with children should have priority
     prioritize_children = apartment.room_count >= _PRIORITIZE_CHILDREN_ROOM_THRESHOLD
     if prioritize_children:
         # Split applications into two pools
-        apps_with_children = apartment_apps.filter(application__has_children=True)
-        apps_without_children = apartment_apps.exclude(application__has_children=True)
-        with transaction.atomic():
-            # The first queue segment go to applications with children, in random order
-            _shuffle_queue_segment(apps_with_children)
-            # The remaining segment go to applications without children
-            _shuffle_queue_segment(
-                apps_without_children, apps_with_children.count() + 1
-            )
+        reservations_with_children = apartment_reservations.filter(
+            application_apartment__application__has_children=True
+        )
+        reservations_without_children = apartment_reservations.exclude(
+            application_apartment__application__has_children=True
+        )
+        ids_with_children = list(
+            reservations_with_children.values_list("id", flat=True)
+        )
+        ids_without_children = list(
+            reservations_without_children.values_list("id", flat=True)
+        )
+        # The first queue segment go to applications with children, in random order
+        positions = _shuffle_queue_segment(ids_with_children)
+        # The remaining segment go to applications without children
+        positions.update(
+            _shuffle_queue_segment(ids_without_children, len(ids_with_children) + 1)
+        )
     else:
         # Each application stays in the same pool and is assigned a random position
-        _shuffle_queue_segment(apartment_apps)
+        positions = _shuffle_queue_segment(
+            list(apartment_reservations.values_list("id", flat=True))
+        )
+
+    ApartmentReservation.objects.bulk_update(
+        [
+            ApartmentReservation(
+                id=reservation_id,
+                list_order=position * POSITION_GAP,
+                queue_order=position * POSITION_GAP,
+            )
+            for reservation_id, position in positions.items()
+        ],
+        ["list_order", "queue_order"],
+    )
+    ApartmentDataVersion.objects.bump([apartment_uuid])
 
 
-@transaction.atomic
 def _shuffle_queue_segment(
-    application_apartments: QuerySet,
+    reservation_ids: List[int],
     start_position: int = 1,
-) -> None:
+) -> Dict[int, int]:
     """
-    Randomizes the queue segment of the given applications, starting at the given
+    Randomizes the queue segment of the given reservations, starting at the given
     position. A unique queue position between start_position (inclusive) and
-    start_position + number of application apartments (exclusive) will be assigned
-    randomly for each application in the queue.
+    start_position + number of reservations (exclusive) will be assigned randomly for
+    each reservation in the queue.
+
+    The positions are permuted in place with the Fisher-Yates shuffle using the
+    cryptographically secure random number generator. Returns a dict of the new
+    positions keyed by reservation id.
     """
-    end_position = start_position + application_apartments.count()
-
-    # Create a list of all possible queue positions between start and end position
-    possible_positions = list(range(start_position, end_position))
-
-    for app_apartment in application_apartments.order_by("id").all():
-        # Remove a random queue position from the list assign it to the application
-        random_index = secrets.randbelow(len(possible_positions))
-        position = possible_positions.pop(random_index)
-        apartment_reservation = app_apartment.apartment_reservation
-        apartment_reservation.list_position = position
-        apartment_reservation.queue_position = position
-        apartment_reservation.save(update_fields=["list_position", "queue_position"])
+    positions = list(range(start_position, start_position + len(reservation_ids)))
+    for index in range(len(positions) - 1):
+        # Pick a random position from the ones that have not been assigned yet
+        random_index = index + secrets.randbelow(len(positions) - index)
+        positions[index], positions[random_index] = (
+            positions[random_index],
+            positions[index],
+        )
+    return dict(zip(reservation_ids, positions))
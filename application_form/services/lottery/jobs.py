@@ -0,0 +1,206 @@
+import threading
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, IntegrityError, transaction
+from django.utils import timezone
+from logging import getLogger
+from typing import Optional
+
+from application_form.enums import LotteryJobState
+from application_form.models import LotteryJob
+from application_form.services.lottery.exceptions import (
+    LotteryJobAlreadyRunningException,
+)
+from application_form.services.lottery.machine import distribute_apartments
+from application_form.services.lottery.utils import (
+    _validate_project_application_time_has_finished,
+    _validate_project_has_applications,
+)
+
+logger = getLogger(__name__)
+
+User = get_user_model()
+
+ACTIVE_LOTTERY_JOB_STATES = [LotteryJobState.PENDING, LotteryJobState.RUNNING]
+
+# Minimum interval between two progress updates of a running job, in seconds
+PROGRESS_UPDATE_INTERVAL = 1.0
+# Interval of the heartbeat of a running job when it has no progress to report, in
+# seconds. It has to be well below LOTTERY_JOB_TIMEOUT.
+HEARTBEAT_INTERVAL = 10.0
+
+
+def submit_lottery_job(
+    project_uuid: uuid.UUID,
+    user: User = None,
+    state: LotteryJobState = LotteryJobState.PENDING,
+) -> LotteryJob:
+    """
+    Create a pending lottery job for the given project, or a running one if the
+    caller runs it right away.
+
+    The project is validated the same way as distribute_apartments() does it, so that
+    the caller gets the validation errors right away instead of a failed job.
+    """
+    _validate_project_has_applications(project_uuid)
+    _validate_project_application_time_has_finished(project_uuid)
+
+    fail_stale_lottery_jobs()
+    if LotteryJob.objects.filter(
+        project_uuid=project_uuid, state__in=ACTIVE_LOTTERY_JOB_STATES
+    ).exists():
+        raise LotteryJobAlreadyRunningException()
+    try:
+        with transaction.atomic():
+            return LotteryJob.objects.create(
+                project_uuid=project_uuid,
+                user=user,
+                state=state,
+                started_at=timezone.now() if state == LotteryJobState.RUNNING else None,
+            )
+    except IntegrityError as e:
+        # Another job of the project was submitted at the same time
+        raise LotteryJobAlreadyRunningException() from e
+
+
+def run_lottery_now(project_uuid: uuid.UUID, user: User = None) -> LotteryJob:
+    """
+    Run the lottery of the given project right away, as a job that is running from
+    the start. The job prevents the lottery from running at the same time as a
+    pending or running job of the same project. Errors are raised to the caller.
+    """
+    job = submit_lottery_job(project_uuid, user, state=LotteryJobState.RUNNING)
+    run_lottery_job(job, raise_errors=True)
+    return job
+
+
+def fail_stale_lottery_jobs() -> int:
+    """
+    Mark the running lottery jobs which have not sent a heartbeat within
+    LOTTERY_JOB_TIMEOUT seconds as failed, e.g. because their worker died. The
+    lottery of a dead worker is rolled back with its transaction, so the lottery can
+    be submitted again. Returns the number of failed jobs.
+    """
+    stale_jobs = LotteryJob.objects.filter(
+        state=LotteryJobState.RUNNING,
+        updated_at__lt=timezone.now() - timedelta(seconds=settings.LOTTERY_JOB_TIMEOUT),
+    )
+    failed = stale_jobs.update(
+        state=LotteryJobState.FAILED,
+        error="The lottery job timed out.",
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    if failed:
+        logger.warning("Marked %s stale lottery jobs as failed", failed)
+    return failed
+
+
+def run_next_lottery_job() -> Optional[LotteryJob]:
+    """
+    Claim the oldest pending lottery job and run it.
+
+    Returns the job, or None if there was no pending job. Several workers can call
+    this at the same time, since a job that another worker is claiming is skipped.
+    """
+    fail_stale_lottery_jobs()
+    with transaction.atomic():
+        job = (
+            LotteryJob.objects.select_for_update(skip_locked=True)
+            .filter(state=LotteryJobState.PENDING)
+            .order_by("created_at", "id")
+            .first()
+        )
+        if job is None:
+            return None
+        job.state = LotteryJobState.RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=["state", "started_at", "updated_at"])
+
+    run_lottery_job(job)
+    return job
+
+
+def run_lottery_job(job: LotteryJob, raise_errors: bool = False) -> None:
+    """
+    Run the lottery of the given job and store its outcome to the job. If
+    raise_errors is given, the error of a failed lottery is raised after it has been
+    stored.
+    """
+    try:
+        with _ProgressReporter(job) as reporter:
+            distribute_apartments(job.project_uuid, job.user, reporter.report)
+    except Exception as e:
+        logger.exception(f"Lottery job {job.pk} failed")
+        job.state = LotteryJobState.FAILED
+        job.error = str(e) or e.__class__.__name__
+        job.finished_at = timezone.now()
+        job.save()
+        if raise_errors:
+            raise
+        return
+    job.state = LotteryJobState.SUCCEEDED
+    if job.apartments_total is not None:
+        job.apartments_done = job.apartments_total
+    job.finished_at = timezone.now()
+    job.save()
+
+
+class _ProgressReporter:
+    """
+    Writes the progress of a running lottery job to the database while the lottery
+    is run inside the block.
+
+    The lottery is run in a single transaction, so the progress is written by a
+    thread with its own database connection in order to make it visible to the
+    status endpoint while the lottery is still running. The updates are throttled so
+    that large projects do not cause an update per apartment. The thread also writes
+    a heartbeat every HEARTBEAT_INTERVAL seconds, so that a job in a phase without
+    progress reports is not considered stale, see fail_stale_lottery_jobs().
+    """
+
+    def __init__(self, job: LotteryJob):
+        self.job = job
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"lottery-job-{job.pk}", daemon=True
+        )
+
+    def __enter__(self) -> "_ProgressReporter":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stopped.set()
+        self._changed.set()
+        self._thread.join()
+
+    def report(self, apartments_done: int, apartments_total: int) -> None:
+        self.job.apartments_done = apartments_done
+        self.job.apartments_total = apartments_total
+        self._changed.set()
+
+    def _run(self) -> None:
+        try:
+            while not self._stopped.is_set():
+                self._changed.wait(HEARTBEAT_INTERVAL)
+                self._changed.clear()
+                if self._stopped.is_set():
+                    break
+                self._update()
+                self._stopped.wait(PROGRESS_UPDATE_INTERVAL)
+        finally:
+            connection.close()
+
+    def _update(self) -> None:
+        try:
+            LotteryJob.objects.filter(pk=self.job.pk).update(
+                apartments_done=self.job.apartments_done,
+                apartments_total=self.job.apartments_total,
+                updated_at=timezone.now(),
+            )
+        except Exception:
+            logger.exception(f"Updating the progress of lottery job {self.job.pk}")
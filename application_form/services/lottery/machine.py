@@ -2,6 +2,7 @@ import uuid
 from django.contrib.auth import get_user_model
 from django.db import transaction
 from django.utils.translation import ugettext_lazy as _
+from typing import Callable, Optional
 
 from apartment.elastic.queries import get_project
 from apartment.enums import OwnershipType
@@ -11,23 +12,36 @@ from application_form.services.lottery.utils import (
     _validate_project_application_time_has_finished,
     _validate_project_has_applications,
 )
+from application_form.utils import lock_project
 
 User = get_user_model()
 
 
 @transaction.atomic
-def distribute_apartments(project_uuid: uuid.UUID, user: User = None) -> None:
+def distribute_apartments(
+    project_uuid: uuid.UUID,
+    user: User = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> None:
+    """
+    Run the lottery for the given project.
+
+    If on_progress is given, it is called with the number of apartments done and the
+    total number of apartments as the lottery proceeds.
+    """
+    # A lottery job considered stale may still be running the same lottery
+    lock_project(project_uuid)
     _validate_project_has_applications(project_uuid)
     _validate_project_application_time_has_finished(project_uuid)
 
     project = get_project(project_uuid)
     if project.project_ownership_type.lower() == OwnershipType.HASO.value:
-        _distribute_haso_apartments(project_uuid, user)
+        _distribute_haso_apartments(project_uuid, user, on_progress)
     elif project.project_ownership_type.lower() in [
         OwnershipType.HITAS.value,
         OwnershipType.PUOLIHITAS.value,
     ]:
-        _distribute_hitas_apartments(project_uuid, user)
+        _distribute_hitas_apartments(project_uuid, user, on_progress)
     else:
         raise NotImplementedError(
             _(
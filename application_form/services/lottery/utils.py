@@ -1,11 +1,19 @@
 import uuid
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.utils import timezone
+from typing import Iterable
 
 from apartment.elastic.queries import get_apartment_uuids, get_project
 from apartment_application_service.settings import METADATA_HANDLER_INFORMATION
 from application_form.exceptions import ProjectDoesNotHaveApplicationsException
-from application_form.models import ApartmentReservation, Application, LotteryEvent
+from application_form.models import (
+    ApartmentDataVersion,
+    ApartmentReservation,
+    Application,
+    LotteryEvent,
+    LotteryEventResult,
+)
 from application_form.services.lottery.exceptions import (
     ApplicationTimeNotFinishedException,
 )
@@ -26,27 +34,63 @@ def _save_application_order(apartment_uuid: uuid.UUID, user: User = None) -> Non
 
     The salesperson's name who initiate the lottery will be stored in the DB
     """
-    if LotteryEvent.objects.filter(apartment_uuid=apartment_uuid).exists():
-        return  # don't record it twice
+    _save_application_orders([apartment_uuid], user)
+
+
+@transaction.atomic
+def _save_application_orders(
+    apartment_uuids: Iterable[uuid.UUID], user: User = None
+) -> None:
+    """
+    Persist the apartment queues for all the given apartments in the database.
 
-    event = LotteryEvent.objects.create(
-        apartment_uuid=apartment_uuid,
+    Works like _save_application_order(), but the lottery events, their results and
+    the handlers of the reservations are written in bulk, so the number of queries
+    does not depend on the number of apartments or applications.
+    """
+    apartment_uuids = [uuid.UUID(str(a)) for a in apartment_uuids]
+    recorded_apartment_uuids = set(
+        LotteryEvent.objects.filter(apartment_uuid__in=apartment_uuids).values_list(
+            "apartment_uuid", flat=True
+        )
     )
+    # don't record them twice
+    apartment_uuids = [
+        apartment_uuid
+        for apartment_uuid in apartment_uuids
+        if apartment_uuid not in recorded_apartment_uuids
+    ]
+    if not apartment_uuids:
+        return
+
+    handler = ""
     if user:
-        event.handler = (
-            METADATA_HANDLER_INFORMATION + " / " + user.profile_or_user_full_name
+        handler = METADATA_HANDLER_INFORMATION + " / " + user.profile_or_user_full_name
+    events = LotteryEvent.objects.bulk_create(
+        LotteryEvent(apartment_uuid=apartment_uuid, handler=handler)
+        for apartment_uuid in apartment_uuids
+    )
+    events_by_apartment_uuid = {event.apartment_uuid: event for event in events}
+
+    reservations = ApartmentReservation.objects.filter(
+        apartment_uuid__in=apartment_uuids
+    )
+    LotteryEventResult.objects.bulk_create(
+        LotteryEventResult(
+            event=events_by_apartment_uuid[apartment_uuid],
+            application_apartment_id=application_apartment_id,
+            result_position=list_position,
         )
-        event.save()
-    reservations = ApartmentReservation.objects.filter(apartment_uuid=apartment_uuid)
-    for apartment_reservation in reservations:
-        event.results.create(
-            application_apartment=apartment_reservation.application_apartment,
-            result_position=apartment_reservation.list_position,
+        for apartment_uuid, application_apartment_id, list_position in (
+            reservations.with_window_positions().values_list(
+                "apartment_uuid", "application_apartment_id", "list_position"
+            )
         )
-        if user:
-            apartment_reservation.handler = user.profile_or_user_full_name
-            apartment_reservation.save()
-    audit_logging.log(user, Operation.CREATE, event)
+    )
+    if user:
+        reservations.update(handler=user.profile_or_user_full_name)
+    ApartmentDataVersion.objects.bump(apartment_uuids)
+    audit_logging.log_many((user, Operation.CREATE, event) for event in events)
 
 
 def _validate_project_has_applications(project_uuid: uuid.UUID):
@@ -1,9 +1,11 @@
 import uuid
+from collections import defaultdict
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import transaction
-from django.db.models import F
+from django.db import connection, transaction
+from django.db.models import Max, Q
 from logging import getLogger
-from typing import Optional
+from typing import Iterable, List, Optional, Tuple
 
 from application_form.enums import (
     ApartmentQueueChangeEventType,
@@ -12,17 +14,25 @@ from application_form.enums import (
     ApplicationType,
 )
 from application_form.models import (
+    ApartmentDataVersion,
+    ApartmentQueueChangeEvent,
     ApartmentReservation,
     ApartmentReservationStateChangeEvent,
     Application,
     ApplicationApartment,
 )
-from application_form.utils import lock_table
+from application_form.utils import lock_apartment_queues
 
 logger = getLogger(__name__)
 
 User = get_user_model()
 
+# The gap between the queue_order and list_order of consecutive reservations when they
+# are added to the end of the queue or rebalanced. A reservation added between two
+# others gets an order halfway between theirs, so about 20 reservations can be added
+# to the same place before the orders of the apartment need rebalancing.
+POSITION_GAP = 1 << 20
+
 
 def add_application_to_queues(
     application: Application, comment: str = "", user: Optional[User] = None
@@ -30,63 +40,129 @@ def add_application_to_queues(
     """
     Adds the given application to the queues of all the apartments applied to.
     """
-    for application_apartment in application.application_apartments.all():
-        apartment_uuid = application_apartment.apartment_uuid
-        with lock_table(ApartmentReservation):
-            if application.type == ApplicationType.HASO:
-                # For HASO applications, the queue position is determined by the
-                # right of residence number.
-                # The list position will be the same as queue position
-                queue_position = _calculate_queue_position(
-                    apartment_uuid, application_apartment
-                )
-                list_position = queue_position
-                # Need to shift both list position and queue position
-                _shift_positions(apartment_uuid, queue_position)
-            elif application.type in [
-                ApplicationType.HITAS,
-                ApplicationType.PUOLIHITAS,
-            ]:
-                # HITAS and PUOLIHITAS work the same way from the apartment lottery
-                # perspective, and should always be added to the end of the queue.
-                try:
-                    queue_position = (
-                        ApartmentReservation.objects.filter(
-                            apartment_uuid=apartment_uuid
-                        )
-                        .order_by("-queue_position")[0]
-                        .queue_position
-                        + 1
-                    )
-                except IndexError:
-                    queue_position = 1
-                list_position = (
-                    ApartmentReservation.objects.filter(
-                        apartment_uuid=apartment_uuid
-                    ).count()
-                    + 1
-                )
-            else:
-                raise ValueError(f"unsupported application type {application.type}")
-
-            application = application_apartment.application
-            apartment_reservation = ApartmentReservation(
-                customer=application.customer,
-                queue_position=queue_position,
-                list_position=list_position,
-                application_apartment=application_apartment,
-                apartment_uuid=apartment_uuid,
-                right_of_residence=application.right_of_residence,
-                has_children=application.has_children,
-                has_hitas_ownership=application.has_hitas_ownership,
-                is_age_over_55=application.customer.is_age_over_55,
-                is_right_of_occupancy_housing_changer=application.is_right_of_occupancy_housing_changer,  # noqa: E501
+    add_application_apartments_to_queues(
+        list(application.application_apartments.all()), comment=comment, user=user
+    )
+
+
+def add_application_apartments_to_queues(
+    application_apartments: List[ApplicationApartment],
+    comment: str = "",
+    user: Optional[User] = None,
+) -> List[ApartmentReservation]:
+    """
+    Adds the given application apartments, possibly of several applications, to the
+    queues of their apartments, and returns the created reservations.
+
+    The queues of all the apartments are locked once for the whole batch, and the
+    reservations and their change events are created in bulk.
+    """
+    application_apartments_by_apartment = defaultdict(list)
+    for application_apartment in application_apartments:
+        application_apartments_by_apartment[
+            application_apartment.apartment_uuid
+        ].append(application_apartment)
+
+    # All the queues are locked at once, since locking them one by one could deadlock
+    # with another application to the same apartments in a different order.
+    with lock_apartment_queues(
+        ApartmentReservation, application_apartments_by_apartment.keys()
+    ):
+        reservations = []
+        for (
+            apartment_uuid,
+            apartment_items,
+        ) in application_apartments_by_apartment.items():
+            reservations += _create_queue_reservations(apartment_uuid, apartment_items)
+
+        ApartmentReservationStateChangeEvent.objects.bulk_create(
+            ApartmentReservationStateChangeEvent(
+                reservation=reservation, state=reservation.state, user=user
             )
-            apartment_reservation.save(user=user)
-            apartment_reservation.queue_change_events.create(
+            for reservation in reservations
+        )
+        ApartmentQueueChangeEvent.objects.bulk_create(
+            ApartmentQueueChangeEvent(
+                queue_application=reservation,
                 type=ApartmentQueueChangeEventType.ADDED,
                 comment=comment,
             )
+            for reservation in reservations
+        )
+        ApartmentDataVersion.objects.bump(application_apartments_by_apartment.keys())
+    return reservations
+
+
+def _create_queue_reservations(
+    apartment_uuid: uuid.UUID, application_apartments: List[ApplicationApartment]
+) -> List[ApartmentReservation]:
+    """
+    Creates the reservations of the given application apartments to the queue of the
+    given apartment, in the given order.
+    """
+    reservations = []
+    unsaved_reservations = []
+    last_orders = None
+    deferred_orders_applied = False
+    for application_apartment in application_apartments:
+        application = application_apartment.application
+        defer_order = _is_haso_order_deferred(application)
+        # Deferred HASO applications are ranked when their queue is ordered
+        right_of_residence_rank = None
+        if application.type == ApplicationType.HASO and not defer_order:
+            # For HASO applications, the queue position is determined by the
+            # right of residence number, so the queue cannot have deferred orders.
+            # The list position will be the same as queue position
+            last_orders = None
+            # The rank is found among the saved reservations of the apartment, so
+            # the reservations before it have to be saved and ordered first
+            ApartmentReservation.objects.bulk_create(unsaved_reservations)
+            unsaved_reservations = []
+            if not deferred_orders_applied:
+                apply_deferred_queue_orders([apartment_uuid])
+                deferred_orders_applied = True
+            right_of_residence_rank = get_right_of_residence_rank(
+                apartment_uuid, application.right_of_residence
+            )
+            queue_order, list_order = _calculate_haso_order(
+                apartment_uuid, application_apartment, right_of_residence_rank
+            )
+        elif defer_order or application.type in [
+            ApplicationType.HITAS,
+            ApplicationType.PUOLIHITAS,
+        ]:
+            # HITAS and PUOLIHITAS work the same way from the apartment lottery
+            # perspective, and should always be added to the end of the queue.
+            # Deferred HASO applications are added to the end too, and the queue is
+            # ordered later by apply_deferred_queue_orders().
+            if last_orders is None:
+                ApartmentReservation.objects.bulk_create(unsaved_reservations)
+                unsaved_reservations = []
+                last_orders = _get_last_order(apartment_uuid)
+            else:
+                last_orders = tuple(order + POSITION_GAP for order in last_orders)
+            queue_order, list_order = last_orders
+        else:
+            raise ValueError(f"unsupported application type {application.type}")
+
+        reservation = ApartmentReservation(
+            customer=application.customer,
+            queue_order=queue_order,
+            list_order=list_order,
+            application_apartment=application_apartment,
+            apartment_uuid=apartment_uuid,
+            right_of_residence=application.right_of_residence,
+            right_of_residence_rank=right_of_residence_rank,
+            queue_order_deferred=defer_order,
+            has_children=application.has_children,
+            has_hitas_ownership=application.has_hitas_ownership,
+            is_age_over_55=application.customer.is_age_over_55,
+            is_right_of_occupancy_housing_changer=application.is_right_of_occupancy_housing_changer,  # noqa: E501
+        )
+        reservations.append(reservation)
+        unsaved_reservations.append(reservation)
+    ApartmentReservation.objects.bulk_create(unsaved_reservations)
+    return reservations
 
 
 @transaction.atomic
@@ -101,14 +177,17 @@ def remove_reservation_from_queue(
     means that the application for this specific apartment was canceled, so the state
     of the application for this apartment will also be updated to "CANCELED".
     """
-    old_queue_position = apartment_reservation.queue_position
+    if apartment_reservation.queue_order is None:
+        logger.warning(
+            "queue_order is None, bad reservation data in apartment uuid"
+            f"{apartment_reservation.apartment_uuid}?"
+        )
+
+    # The other reservations keep their queue_order, so their positions shift
+    # without updating them.
+    apartment_reservation.queue_order = None
     apartment_reservation.queue_position = None
-    apartment_reservation.save(update_fields=("queue_position",))
-    _shift_positions(
-        apartment_reservation.apartment_uuid,
-        old_queue_position,
-        deleted=True,
-    )
+    apartment_reservation.save(update_fields=("queue_order",))
     state_change_event = apartment_reservation.set_state(
         ApartmentReservationState.CANCELED,
         user=user,
@@ -122,64 +201,312 @@ def remove_reservation_from_queue(
     return state_change_event
 
 
-def _calculate_queue_position(
+def _is_haso_order_deferred(application: Application) -> bool:
+    """
+    HASO applications submitted during the application period are not ordered by
+    their right of residence number when they are added, if the ordering is deferred
+    with the HASO_QUEUE_ORDERING_DEFERRED setting.
+    """
+    return (
+        settings.HASO_QUEUE_ORDERING_DEFERRED
+        and application.type == ApplicationType.HASO
+        and not application.submitted_late
+    )
+
+
+def apply_deferred_queue_orders(
+    apartment_uuids: Optional[Iterable[uuid.UUID]] = None,
+) -> int:
+    """
+    Orders the queues of the given apartments, or all the apartments, that have HASO
+    applications added without ordering. Returns the number of ordered queues.
+
+    The reservations of each queue are ordered by the right of residence number
+    within the pools of applications submitted on time and late, the same way as
+    when they are added one by one. The deferred reservations are ranked first, see
+    _rank_deferred_reservations(), and then the queues are ordered with a single
+    statement. Reservations removed from the queue are kept at the end of the list.
+
+    This modifies the queues, so it is run when the lottery is run or with the
+    apply_deferred_queue_orders management command, and not when they are read.
+    """
+    deferred_reservations = ApartmentReservation.objects.filter(
+        queue_order_deferred=True
+    )
+    if apartment_uuids is not None:
+        deferred_reservations = deferred_reservations.filter(
+            apartment_uuid__in=apartment_uuids
+        )
+
+    def get_deferred_apartment_uuids():
+        return list(
+            deferred_reservations.order_by()
+            .values_list("apartment_uuid", flat=True)
+            .distinct()
+        )
+
+    deferred_apartment_uuids = get_deferred_apartment_uuids()
+    if not deferred_apartment_uuids:
+        return 0
+
+    with lock_apartment_queues(ApartmentReservation, deferred_apartment_uuids):
+        # Another transaction may have ordered the queues while waiting for the lock
+        deferred_apartment_uuids = get_deferred_apartment_uuids()
+        if not deferred_apartment_uuids:
+            return 0
+        _rank_deferred_reservations(deferred_apartment_uuids)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _APPLY_DEFERRED_QUEUE_ORDERS_SQL,
+                {"gap": POSITION_GAP, "apartment_uuids": deferred_apartment_uuids},
+            )
+        ApartmentDataVersion.objects.bump(deferred_apartment_uuids)
+    logger.info("Applied deferred orders to %s queues", len(deferred_apartment_uuids))
+    return len(deferred_apartment_uuids)
+
+
+def _rank_deferred_reservations(apartment_uuids: List[uuid.UUID]) -> None:
+    """
+    Set the right_of_residence_rank of the deferred reservations of the given
+    apartments, which are added without one.
+
+    Searching the place of each deferred reservation separately would decrypt a few
+    numbers of the queue per reservation. Instead the numbers of each queue with
+    unranked reservations are decrypted once, and the ranks of the whole queue are
+    reassigned in their order. The ranked reservations keep their relative order.
+    The queues must be locked.
+    """
+    unranked_apartment_uuids = list(
+        ApartmentReservation.objects.filter(
+            apartment_uuid__in=apartment_uuids,
+            queue_order_deferred=True,
+            right_of_residence_rank=None,
+        )
+        .order_by()
+        .values_list("apartment_uuid", flat=True)
+        .distinct()
+    )
+    if not unranked_apartment_uuids:
+        return
+    reservations_by_apartment = defaultdict(list)
+    for reservation in ApartmentReservation.objects.filter(
+        apartment_uuid__in=unranked_apartment_uuids
+    ).only("pk", "apartment_uuid", "right_of_residence", "right_of_residence_rank"):
+        if reservation.right_of_residence is not None:
+            reservations_by_apartment[reservation.apartment_uuid].append(reservation)
+
+    ranked_reservations = []
+    for reservations in reservations_by_apartment.values():
+        reservations.sort(
+            key=lambda r: (
+                r.right_of_residence,
+                r.right_of_residence_rank is None,
+                r.right_of_residence_rank or 0,
+                r.pk,
+            )
+        )
+        for index, reservation in enumerate(reservations, start=1):
+            reservation.right_of_residence_rank = index * POSITION_GAP
+        ranked_reservations += reservations
+    ApartmentReservation.objects.bulk_update(
+        ranked_reservations, ["right_of_residence_rank"], batch_size=1000
+    )
+
+
+_APPLY_DEFERRED_QUEUE_ORDERS_SQL = f"""
+UPDATE {ApartmentReservation._meta.db_table} AS reservation
+SET
+    queue_order = CASE
+        WHEN reservation.queue_order IS NULL THEN NULL
+        ELSE ordered.position * %(gap)s
+    END,
+    list_order = ordered.position * %(gap)s,
+    queue_order_deferred = false
+FROM (
+    SELECT
+        r.id,
+        ROW_NUMBER() OVER (
+            PARTITION BY r.apartment_uuid
+            ORDER BY
+                r.queue_order IS NULL,
+                a.submitted_late,
+                r.right_of_residence_rank,
+                r.id
+        ) AS position
+    FROM {ApartmentReservation._meta.db_table} AS r
+    LEFT JOIN {ApplicationApartment._meta.db_table} AS aa
+        ON aa.id = r.application_apartment_id
+    LEFT JOIN {Application._meta.db_table} AS a ON a.id = aa.application_id
+    WHERE r.apartment_uuid = ANY(%(apartment_uuids)s)
+) AS ordered
+WHERE reservation.id = ordered.id
+"""
+
+
+def get_right_of_residence_rank(
+    apartment_uuid: uuid.UUID, right_of_residence: Optional[int]
+) -> Optional[int]:
+    """
+    Return the right_of_residence_rank for a new reservation of the apartment with the
+    given right of residence number. The rank comes after the ranks of the
+    reservations with the same or a smaller number, and before the others. If there
+    is no room between them, the ranks of the apartment are rebalanced first.
+
+    The ranks are in the order of the numbers, so the place is found with a binary
+    search over the ranks. Each step finds the reservation at the middle by its rank
+    without decrypting anything, and then decrypts the number of only that
+    reservation. The apartment's queue must be locked.
+    """
+    if right_of_residence is None:
+        return None
+    ranked_reservations = (
+        ApartmentReservation.objects.filter(apartment_uuid=apartment_uuid)
+        .exclude(right_of_residence_rank=None)
+        .order_by("right_of_residence_rank", "pk")
+    )
+    low, high = 0, ranked_reservations.count()
+    while low < high:
+        middle = (low + high) // 2
+        # Selecting the encrypted number with the offset would decrypt the skipped
+        # rows too, so only the primary key is selected with it
+        middle_pk = ranked_reservations.values_list("pk", flat=True)[middle]
+        middle_right_of_residence = (
+            ApartmentReservation.objects.filter(pk=middle_pk)
+            .values_list("right_of_residence", flat=True)
+            .get()
+        )
+        if middle_right_of_residence > right_of_residence:
+            high = middle
+        else:
+            low = middle + 1
+
+    # The ranks of the reservations before and after the new one
+    start, end = max(low - 1, 0), low + 1
+    neighbour_ranks = list(
+        ranked_reservations.values_list("right_of_residence_rank", flat=True)[start:end]
+    )
+    previous_rank = neighbour_ranks.pop(0) if low > 0 else None
+    next_rank = neighbour_ranks[0] if neighbour_ranks else None
+    if next_rank is None:
+        return (previous_rank or 0) + POSITION_GAP
+    rank = _get_order_between(previous_rank, next_rank)
+    if rank is not None:
+        return rank
+    _rebalance_right_of_residence_ranks(apartment_uuid)
+    return get_right_of_residence_rank(apartment_uuid, right_of_residence)
+
+
+def _rebalance_right_of_residence_ranks(apartment_uuid: uuid.UUID) -> None:
+    """Spread the right_of_residence_rank of the apartment's reservations evenly."""
+    reservations = list(
+        ApartmentReservation.objects.filter(apartment_uuid=apartment_uuid)
+        .exclude(right_of_residence_rank=None)
+        .order_by("right_of_residence_rank", "pk")
+        .only("pk", "right_of_residence_rank")
+    )
+    for index, reservation in enumerate(reservations, start=1):
+        reservation.right_of_residence_rank = index * POSITION_GAP
+    ApartmentReservation.objects.bulk_update(reservations, ["right_of_residence_rank"])
+
+
+def _calculate_haso_order(
     apartment_uuid: uuid.UUID,
     application_apartment: ApplicationApartment,
-) -> int:
+    right_of_residence_rank: Optional[int],
+) -> Tuple[int, int]:
     """
-    Finds the new position in the queue for the given application based on its right
-    of residence number. The smaller the number, the smaller the position in the queue.
+    Finds the new queue_order and list_order for the given application based on the
+    rank of its right of residence number. The smaller the number, the smaller the
+    position in the queue.
 
     Late applications form a pool of their own and should be kept in the order of their
     right of residence number within that pool.
     """
-    right_of_residence = application_apartment.application.right_of_residence
+    if right_of_residence_rank is None:
+        return _get_last_order(apartment_uuid)
     submitted_late = application_apartment.application.submitted_late
-    all_reservations = ApartmentReservation.objects.filter(
+    # The right of residence numbers are compared by their ranks, so that the queue
+    # doesn't need to be decrypted
+    next_orders = (
+        ApartmentReservation.objects.filter(
+            apartment_uuid=apartment_uuid,
+            application_apartment__application__submitted_late=submitted_late,
+            right_of_residence_rank__gt=right_of_residence_rank,
+        )
+        .exclude(queue_order=None)
+        .order_by("queue_order", "pk")
+        .values_list("queue_order", "list_order")
+        .first()
+    )
+    if next_orders:
+        return _get_order_before(apartment_uuid, *next_orders)
+    return _get_last_order(apartment_uuid)
+
+
+def _get_last_order(apartment_uuid: uuid.UUID) -> Tuple[int, int]:
+    """Return the queue_order and list_order for the end of the apartment's queue."""
+    orders = ApartmentReservation.objects.filter(
         apartment_uuid=apartment_uuid
-    ).only("queue_position", "application_apartment__application__right_of_residence")
-    reservations = all_reservations.filter(
-        application_apartment__application__submitted_late=submitted_late
-    ).order_by("queue_position")
-    for apartment_reservation in reservations:
-        other_application = apartment_reservation.application_apartment.application
-        if right_of_residence < other_application.right_of_residence:
-            return apartment_reservation.queue_position
-    return all_reservations.count() + 1
-
-
-def _shift_positions(
-    apartment_uuid: uuid.UUID,
-    from_position: int,
-    deleted: bool = False,
-) -> None:
-    """
-    Shifts all items in the queue by one by either incrementing or decrementing their
-    positions, depending on whether the item was added or deleted from the queue.
+    ).aggregate(max_queue_order=Max("queue_order"), max_list_order=Max("list_order"))
+    return (
+        (orders["max_queue_order"] or 0) + POSITION_GAP,
+        (orders["max_list_order"] or 0) + POSITION_GAP,
+    )
 
-    NOTE: This function cannot be used for adding after the apartment's lottery has been
-    executed, because then there can be cancelled reservations, and for those the
-    shifting won't work correctly.
-    """
-    if from_position is None:
-        logger.warning(
-            "from_position is None, bad reservation data in apartment uuid"
-            f"{apartment_uuid}?"
-        )
-        return
 
+def _get_order_before(
+    apartment_uuid: uuid.UUID, queue_order: int, list_order: int
+) -> Tuple[int, int]:
+    """
+    Return the queue_order and list_order for a reservation right before the one with
+    the given orders. If there is no room between the orders, the orders of the
+    apartment are rebalanced first.
+    """
     reservations = ApartmentReservation.objects.filter(apartment_uuid=apartment_uuid)
-    if not deleted and reservations.filter(queue_position=None).exists():
-        raise RuntimeError(
-            "This function cannot be used for adding a reservation when the apartment "
-            "has reservations without a queue_position."
-        )
+    orders = reservations.aggregate(
+        previous_queue_order=Max("queue_order", filter=Q(queue_order__lt=queue_order)),
+        previous_list_order=Max("list_order", filter=Q(list_order__lt=list_order)),
+    )
+    new_queue_order = _get_order_between(orders["previous_queue_order"], queue_order)
+    new_list_order = _get_order_between(orders["previous_list_order"], list_order)
+    if new_queue_order is not None and new_list_order is not None:
+        return new_queue_order, new_list_order
+
+    # Move the reservation to the same relative place in the rebalanced orders
+    reservation = reservations.get(queue_order=queue_order, list_order=list_order)
+    rebalance_orders(apartment_uuid)
+    reservation.refresh_from_db(fields=("queue_order", "list_order"))
+    return _get_order_before(
+        apartment_uuid, reservation.queue_order, reservation.list_order
+    )
+
+
+def _get_order_between(previous_order: Optional[int], next_order: int) -> Optional[int]:
+    """
+    Return an order between the given ones, or None if there is no room for one.
+    A previous_order of None means the beginning of the queue.
+    """
+    previous_order = previous_order or 0
+    if next_order - previous_order < 2:
+        return None
+    return previous_order + (next_order - previous_order) // 2
 
-    # We only need to update the positions in the queue that are >= from_position
-    reservations = reservations.filter(queue_position__gte=from_position)
 
-    # When deleting, we have to decrement each position. When adding, increment instead.
-    position_change = -1 if deleted else 1
-    reservations.update(queue_position=F("queue_position") + position_change)
-    if not deleted:
-        reservations.update(list_position=F("list_position") + position_change)
+def rebalance_orders(apartment_uuid: uuid.UUID) -> None:
+    """
+    Spread the queue_order and list_order of the apartment's reservations evenly, so
+    that there is again room to add reservations between them. The positions of the
+    reservations do not change.
+    """
+    reservations = list(
+        ApartmentReservation.objects.filter(apartment_uuid=apartment_uuid)
+        .with_window_positions()
+        .only("pk", "queue_order", "list_order")
+    )
+    for reservation in reservations:
+        if reservation.queue_order is not None:
+            reservation.queue_order = reservation.queue_position * POSITION_GAP
+        reservation.list_order = reservation.list_position * POSITION_GAP
+    ApartmentReservation.objects.bulk_update(
+        reservations, ["queue_order", "list_order"]
+    )
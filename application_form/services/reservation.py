@@ -1,6 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.db import transaction
-from django.db.models import F, Max
+from django.db.models import Max, Min
 
 from application_form.enums import (
     ApartmentQueueChangeEventType,
@@ -8,7 +8,13 @@ from application_form.enums import (
     ApartmentReservationState,
 )
 from application_form.models import ApartmentReservation
-from application_form.utils import lock_table
+from application_form.services.queue import (
+    _get_order_between,
+    get_right_of_residence_rank,
+    POSITION_GAP,
+    rebalance_orders,
+)
+from application_form.utils import lock_apartment_queues
 from customer.models import Customer
 
 User = get_user_model()
@@ -27,33 +33,29 @@ def transfer_reservation_to_another_customer(
     created instead. The new reservation will get a list position right after the
     cancelled old one."""
 
-    # Get the new reservation's field values ready but don't save it yet to keep it from
-    # messing up reservation shifting
+    # Finding the list order may rebalance the orders of the apartment, so it has to
+    # be done before reading the queue order of the old reservation.
+    list_order = _get_list_order_after(old_reservation)
+
+    # The new reservation takes the queue place of the old one. We don't need to
+    # update the others because the queue positions stay the same when transferring a
+    # reservation.
     new_reservation = ApartmentReservation(
         apartment_uuid=old_reservation.apartment_uuid,
-        queue_position=old_reservation.queue_position,
-        list_position=old_reservation.list_position + 1,
+        queue_order=old_reservation.queue_order,
+        list_order=list_order,
         state=old_reservation.state,
         customer=customer,
         handler=user.profile_or_user_full_name,
     )
-
-    # Shift reservations after the old reservation one step back to make room for the
-    # new reservation. We don't need to update queue positions because they will stay
-    # the same when transferring a reservation.
-    reservations_after_old_reservation = ApartmentReservation.objects.filter(
-        apartment_uuid=old_reservation.apartment_uuid,
-        list_position__gt=old_reservation.list_position,
-    )
-    reservations_after_old_reservation.update(list_position=F("list_position") + 1)
-
     new_reservation.save()
     new_reservation.queue_change_events.create(
         type=ApartmentQueueChangeEventType.ADDED,
     )
 
+    old_reservation.queue_order = None
     old_reservation.queue_position = None
-    old_reservation.save(update_fields=("queue_position",))
+    old_reservation.save(update_fields=("queue_order",))
     state_change_event = old_reservation.set_state(
         ApartmentReservationState.CANCELED,
         user=user,
@@ -68,7 +70,9 @@ def transfer_reservation_to_another_customer(
 def create_reservation_without_application(
     reservation_data: dict, user: User = None
 ) -> ApartmentReservation:
-    with lock_table(ApartmentReservation):
+    with lock_apartment_queues(
+        ApartmentReservation, [reservation_data["apartment_uuid"]]
+    ):
         existing_reservations = ApartmentReservation.objects.filter(
             apartment_uuid=reservation_data["apartment_uuid"]
         )
@@ -78,12 +82,12 @@ def create_reservation_without_application(
         else:
             state = ApartmentReservationState.RESERVED
 
-        max_list_position = existing_reservations.aggregate(
-            max_list_position=Max("list_position")
-        )["max_list_position"]
-        max_queue_position = existing_reservations.exclude(
+        max_list_order = existing_reservations.aggregate(
+            max_list_order=Max("list_order")
+        )["max_list_order"]
+        max_queue_order = existing_reservations.exclude(
             state=ApartmentReservationState.CANCELED
-        ).aggregate(max_queue_position=Max("queue_position"))["max_queue_position"]
+        ).aggregate(max_queue_order=Max("queue_order"))["max_queue_order"]
 
         if user:
             reservation_data["handler"] = user.profile_or_user_full_name
@@ -91,9 +95,13 @@ def create_reservation_without_application(
         reservation = ApartmentReservation(
             **reservation_data,
             state=state,
-            list_position=(max_list_position or 0) + 1,
-            queue_position=(max_queue_position or 0) + 1,
+            list_order=(max_list_order or 0) + POSITION_GAP,
+            queue_order=(max_queue_order or 0) + POSITION_GAP,
             right_of_residence=reservation_data["customer"].right_of_residence,
+            right_of_residence_rank=get_right_of_residence_rank(
+                reservation_data["apartment_uuid"],
+                reservation_data["customer"].right_of_residence,
+            ),
             has_children=reservation_data["customer"].has_children,
             has_hitas_ownership=reservation_data["customer"].has_hitas_ownership,
             is_age_over_55=reservation_data["customer"].is_age_over_55,
@@ -102,5 +110,30 @@ def create_reservation_without_application(
             ].is_right_of_occupancy_housing_changer,  # noqa: E501
         )
         reservation.save(user=user)
+        reservation.refresh_positions()
 
     return reservation
+
+
+def _get_list_order_after(reservation: ApartmentReservation) -> int:
+    """
+    Return a list_order right after the given reservation's. If there is no room after
+    it, the orders of the apartment are rebalanced first.
+    """
+    next_list_order = (
+        ApartmentReservation.objects.filter(
+            apartment_uuid=reservation.apartment_uuid,
+            list_order__gt=reservation.list_order,
+        )
+        .order_by()
+        .aggregate(next_list_order=Min("list_order"))["next_list_order"]
+    )
+    if next_list_order is None:
+        return reservation.list_order + POSITION_GAP
+    list_order = _get_order_between(reservation.list_order, next_list_order)
+    if list_order is not None:
+        return list_order
+
+    rebalance_orders(reservation.apartment_uuid)
+    reservation.refresh_from_db(fields=("queue_order", "list_order"))
+    return _get_list_order_after(reservation)
@@ -0,0 +1,117 @@
+"""
+Bump the data versions of the apartments when their export data changes, so that
+the cached export files of their projects are no longer used.
+
+The changes are collected during the transaction, and the versions are bumped once
+when it is committed. This way saving many objects in a transaction doesn't bump the
+same versions again and again, and the version rows are locked only briefly and
+always in the same order.
+
+The signals are not sent by bulk operations, which bump the versions themselves.
+"""
+import threading
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from application_form.models import (
+    ApartmentDataVersion,
+    ApartmentReservation,
+    LotteryEvent,
+    LotteryEventResult,
+)
+from customer.models import Customer
+from users.models import Profile
+
+_local = threading.local()
+
+
+class _PendingBump:
+    """The changes of a transaction whose apartment data versions are bumped."""
+
+    def __init__(self):
+        self.apartment_uuids = set()
+        self.lottery_event_ids = set()
+        self.customer_ids = set()
+        self.profile_ids = set()
+
+    def __call__(self):
+        apartment_uuids = set(self.apartment_uuids)
+        apartment_uuids.update(
+            LotteryEvent.objects.filter(pk__in=self.lottery_event_ids).values_list(
+                "apartment_uuid", flat=True
+            )
+        )
+        if self.customer_ids or self.profile_ids:
+            apartment_uuids.update(
+                ApartmentReservation.objects.filter(
+                    Q(customer__in=self.customer_ids)
+                    | Q(customer__primary_profile__in=self.profile_ids)
+                    | Q(customer__secondary_profile__in=self.profile_ids)
+                )
+                .order_by()
+                .values_list("apartment_uuid", flat=True)
+                .distinct()
+            )
+        ApartmentDataVersion.objects.bump(apartment_uuids)
+
+
+def _bump_on_commit(
+    apartment_uuids=(), lottery_event_ids=(), customer_ids=(), profile_ids=()
+) -> None:
+    """
+    Add the given changes to the pending bump of the current transaction, which is
+    run when the transaction is committed. Outside a transaction it is run right
+    away.
+    """
+    connection = transaction.get_connection()
+    pending_bump = getattr(_local, "pending_bump", None)
+    # The callbacks of a rolled back transaction or savepoint are discarded, and the
+    # ones of a committed transaction are run, so a pending bump which is no longer
+    # registered belongs to a finished transaction
+    registered = (
+        pending_bump is not None
+        and connection.in_atomic_block
+        and any(func is pending_bump for _, func in connection.run_on_commit)
+    )
+    if not registered:
+        pending_bump = _PendingBump()
+    pending_bump.apartment_uuids.update(apartment_uuids)
+    pending_bump.lottery_event_ids.update(lottery_event_ids)
+    pending_bump.customer_ids.update(customer_ids)
+    pending_bump.profile_ids.update(profile_ids)
+    if not registered:
+        _local.pending_bump = pending_bump
+        transaction.on_commit(pending_bump)
+
+
+@receiver(post_save, sender=ApartmentReservation)
+@receiver(post_delete, sender=ApartmentReservation)
+def bump_reservation_data_version(sender, instance, **kwargs):
+    _bump_on_commit(apartment_uuids=[instance.apartment_uuid])
+
+
+@receiver(post_save, sender=LotteryEventResult)
+@receiver(post_delete, sender=LotteryEventResult)
+def bump_lottery_result_data_version(sender, instance, **kwargs):
+    # The lottery event is fetched when the bump is run, unless it is already here
+    if LotteryEventResult.event.is_cached(instance):
+        _bump_on_commit(apartment_uuids=[instance.event.apartment_uuid])
+    else:
+        _bump_on_commit(lottery_event_ids=[instance.event_id])
+
+
+@receiver(post_save, sender=Customer)
+def bump_customer_data_version(sender, instance, created, **kwargs):
+    # A new customer doesn't have reservations yet
+    if created:
+        return
+    _bump_on_commit(customer_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Profile)
+def bump_profile_data_version(sender, instance, created, **kwargs):
+    if created:
+        return
+    _bump_on_commit(profile_ids=[instance.pk])
@@ -4,7 +4,9 @@ from datetime import date
 from decimal import Decimal
 from django.urls import reverse
 from django.utils.timezone import localtime
+from unittest import mock
 
+from apartment.elastic import queries
 from apartment.models import ProjectExtraData
 from apartment.tests.factories import ApartmentDocumentFactory
 from application_form.enums import (
@@ -34,7 +36,7 @@ def test_root_apartment_reservation_detail_unauthorized(
 ):
     _, apartments = elastic_project_with_5_apartments
     reservation = ApartmentReservationFactory(
-        apartment_uuid=apartments[0].uuid, list_position=1
+        apartment_uuid=apartments[0].uuid, list_order=1
     )
 
     response = user_api_client.get(
@@ -53,7 +55,7 @@ def test_root_apartment_reservation_detail(
 ):
     _, apartments = elastic_project_with_5_apartments
     reservation = ApartmentReservationFactory(
-        apartment_uuid=apartments[0].uuid, list_position=1, queue_position=1
+        apartment_uuid=apartments[0].uuid, list_order=1, queue_order=1
     )
     installment = ApartmentInstallmentFactory(
         apartment_reservation=reservation, value=100
@@ -313,6 +315,29 @@ def test_contract_pdf_creation(
     assert bytes(test_value, encoding="utf-8") in response.content
 
 
+@pytest.mark.parametrize("ownership_type", ("HASO", "Hitas"))
+@pytest.mark.django_db
+def test_contract_pdf_creation_fetches_the_apartment_once(
+    elasticsearch, sales_ui_salesperson_api_client, ownership_type
+):
+    apartment = ApartmentDocumentFactory(project_ownership_type=ownership_type)
+    reservation = ApartmentReservationFactory(apartment_uuid=apartment.uuid)
+
+    with mock.patch(
+        "apartment.elastic.queries._get_apartment", wraps=queries._get_apartment
+    ) as get_apartment_mock:
+        response = sales_ui_salesperson_api_client.get(
+            reverse(
+                "application_form:sales-apartment-reservation-contract",
+                kwargs={"pk": reservation.id},
+            ),
+            format="json",
+        )
+
+    assert response.status_code == 200
+    assert get_apartment_mock.call_count <= 1
+
+
 @pytest.mark.django_db
 def test_apartment_reservation_set_state_unauthorized(elasticsearch, user_api_client):
     apartment = ApartmentDocumentFactory()
@@ -441,7 +466,7 @@ def test_cannot_cancel_already_canceled_apartment_reservation(
     reservation = ApartmentReservationFactory(
         apartment_uuid=apartment.uuid,
         state=ApartmentReservationState.CANCELED,
-        queue_position=None,
+        queue_order=None,
     )
 
     data = {"cancellation_reason": "terminated", "comment": "Foo"}
@@ -520,29 +545,29 @@ def test_transfer_reservation_to_another_customer(
     reservation_1 = ApartmentReservationFactory(
         apartment_uuid=apartment.uuid,
         state=ApartmentReservationState.SUBMITTED,
-        queue_position=1,
-        list_position=1,
+        queue_order=1,
+        list_order=1,
         customer=customer,
     )
     reservation_2 = ApartmentReservationFactory(
         apartment_uuid=apartment.uuid,
         state=ApartmentReservationState.SUBMITTED,
-        queue_position=2,
-        list_position=2,
+        queue_order=2,
+        list_order=2,
         customer=customer,
     )
     reservation_3 = ApartmentReservationFactory(
         apartment_uuid=apartment.uuid,
         state=ApartmentReservationState.SUBMITTED,
-        queue_position=3,
-        list_position=3,
+        queue_order=3,
+        list_order=3,
         customer=customer,
     )
     reservation_4 = ApartmentReservationFactory(
         apartment_uuid=apartment.uuid,
         state=ApartmentReservationState.CANCELED,
-        queue_position=None,
-        list_position=4,
+        queue_order=None,
+        list_order=4,
         customer=customer,
     )
 
@@ -560,10 +585,9 @@ def test_transfer_reservation_to_another_customer(
     )
     assert response.status_code == 200
 
-    reservation_1.refresh_from_db()
-    reservation_2.refresh_from_db()
-    reservation_3.refresh_from_db()
-    reservation_4.refresh_from_db()
+    for reservation in (reservation_1, reservation_2, reservation_3, reservation_4):
+        reservation.refresh_from_db()
+        reservation.refresh_positions()
 
     state_change_event = reservation_2.state_change_events.last()
     assert (
@@ -572,6 +596,7 @@ def test_transfer_reservation_to_another_customer(
     )
     assert state_change_event.comment == "foo"
     new_reservation = state_change_event.replaced_by
+    new_reservation.refresh_positions()
 
     assert len(response.data.keys()) == 6
     assert response.data.pop("timestamp")
@@ -712,7 +737,7 @@ def test_create_reservation(
         "is_right_of_occupancy_housing_changer": False,
     }
 
-    reservation = ApartmentReservation.objects.get(id=reservation_id)
+    reservation = ApartmentReservation.objects.with_positions().get(id=reservation_id)
     assert reservation.list_position == 1
     assert reservation.queue_position == 1
     assert reservation.state == ApartmentReservationState.RESERVED
@@ -790,8 +815,8 @@ def test_create_reservation_queue_already_has_canceled_reservation(
     ApartmentReservationFactory(
         apartment_uuid=apartment.uuid,
         state=ApartmentReservationState.CANCELED,
-        queue_position=None,
-        list_position=1,
+        queue_order=None,
+        list_order=1,
     )
 
     data = {
@@ -823,8 +848,8 @@ def test_create_reservation_queue_already_has_reserved_reservation(
     ApartmentReservationFactory(
         apartment_uuid=apartment.uuid,
         state=ApartmentReservationState.RESERVED,
-        queue_position=1,
-        list_position=1,
+        queue_order=1,
+        list_order=1,
     )
 
     data = {
@@ -192,8 +192,8 @@ def test_update_offer_change_state(sales_ui_salesperson_api_client, new_state):
     reservation = ApartmentReservationFactory(
         apartment_uuid=apartment.uuid,
         state=ApartmentReservationState.OFFERED,
-        list_position=1,
-        queue_position=1,
+        list_order=1,
+        queue_order=1,
     )
     offer = OfferFactory(
         apartment_reservation=reservation,
@@ -201,8 +201,8 @@ def test_update_offer_change_state(sales_ui_salesperson_api_client, new_state):
     )
     second_reservation = ApartmentReservationFactory(
         apartment_uuid=apartment.uuid,
-        list_position=2,
-        queue_position=2,
+        list_order=2,
+        queue_order=2,
         state=ApartmentReservationState.SUBMITTED,
     )
 
@@ -224,6 +224,7 @@ def test_update_offer_change_state(sales_ui_salesperson_api_client, new_state):
     offer.refresh_from_db()
     reservation.refresh_from_db()
     second_reservation.refresh_from_db()
+    second_reservation.refresh_positions()
     if new_state == "accepted":
         assert offer.state == OfferState.ACCEPTED
         assert reservation.state == ApartmentReservationState.OFFER_ACCEPTED
@@ -274,7 +275,7 @@ def test_update_concluded_offer_comment(sales_ui_salesperson_api_client, state):
     apartment = ApartmentDocumentFactory()
     reservation = ApartmentReservationFactory(apartment_uuid=apartment.uuid)
     another_reservation = ApartmentReservationFactory(
-        apartment_uuid=apartment.uuid, list_position=reservation.list_position + 1
+        apartment_uuid=apartment.uuid, list_order=reservation.list_order + 1
     )
 
     offer = OfferFactory(
@@ -350,18 +351,18 @@ def test_create_offer_cancel_other_reservations(sales_ui_salesperson_api_client)
     reservation = ApartmentReservationFactory(
         apartment_uuid=apartment_1.uuid,
         state=ApartmentReservationState.SUBMITTED,
-        list_position=1,
+        list_order=1,
         customer=customer,
     )
     ApartmentReservationFactory(
         apartment_uuid=apartment_2.uuid,
         state=ApartmentReservationState.CANCELED,
-        list_position=1,
+        list_order=1,
         customer=customer,
     )
     other_reservation = ApartmentReservationFactory(
         apartment_uuid=apartment_3.uuid,
-        list_position=1,
+        list_order=1,
         customer=customer,
         state=ApartmentReservationState.SUBMITTED,
     )
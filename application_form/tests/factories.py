@@ -111,8 +111,8 @@ class ApartmentReservationFactory(factory.django.DjangoModelFactory):
 
     apartment_uuid = factory.Faker("uuid4")
     customer = factory.SubFactory(CustomerFactory)
-    queue_position = fuzzy.FuzzyInteger(1)
-    list_position = fuzzy.FuzzyInteger(1)
+    queue_order = fuzzy.FuzzyInteger(1)
+    list_order = fuzzy.FuzzyInteger(1)
     application_apartment = factory.SubFactory(ApplicationApartmentFactory)
     state = fuzzy.FuzzyChoice(list(ApartmentReservationState))
     right_of_residence = LazyAttribute(
@@ -120,6 +120,8 @@ class ApartmentReservationFactory(factory.django.DjangoModelFactory):
         if o.application_apartment
         else o.customer.right_of_residence
     )
+    # Any increasing key will do as the rank
+    right_of_residence_rank = factory.SelfAttribute("right_of_residence")
     handler = factory.Faker("name")
 
 
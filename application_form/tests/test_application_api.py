@@ -1,8 +1,10 @@
 import pytest
+import uuid
 from datetime import datetime
 from django.urls import reverse
 from freezegun import freeze_time
 from rest_framework import status
+from unittest import mock
 
 from apartment.tests.factories import ApartmentDocumentFactory
 from apartment_application_service.settings import (
@@ -11,6 +13,7 @@ from apartment_application_service.settings import (
     METADATA_HITAS_PROCESS_NUMBER,
 )
 from application_form import error_codes
+from application_form.api.views import ApplicationViewSet
 from application_form.enums import (
     ApartmentReservationState,
     ApplicationArrivalMethod,
@@ -47,6 +50,117 @@ def test_application_post(api_client, elastic_single_project_with_apartments):
         assert reservation.state_change_events.last().user is None
 
 
+@pytest.mark.django_db
+def test_application_batch_post(api_client, elastic_single_project_with_apartments):
+    profile = ProfileFactory()
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {_create_token(profile)}")
+    data = create_application_data(profile)
+    invalid_data = {**data, "application_uuid": "not-a-uuid"}
+    url = reverse("application_form:application-batch")
+
+    response = api_client.post(url, [data, invalid_data], format="json")
+
+    assert response.status_code == 200
+    assert [(r["application_uuid"], r["status"]) for r in response.data] == [
+        (data["application_uuid"], "created"),
+        (None, "invalid"),
+    ]
+    assert "application_uuid" in response.data[1]["errors"]
+    application = Application.objects.get()
+    assert str(application.external_uuid) == data["application_uuid"]
+    assert str(application.customer.primary_profile.id) == profile.id
+    assert application.method_of_arrival == ApplicationArrivalMethod.ELECTRONICAL_SYSTEM
+    assert application.applicants.count() == 2
+    assert application.application_apartments.count() == 5
+    for reservation in ApartmentReservation.objects.all():
+        assert reservation.queue_change_events.count() == 1
+        assert reservation.state_change_events.get().user is None
+
+    # Sending the same application again doesn't create it again
+    response = api_client.post(url, [data], format="json")
+
+    assert response.status_code == 200
+    assert [r["status"] for r in response.data] == ["already_exists"]
+    assert Application.objects.count() == 1
+    assert ApartmentReservation.objects.count() == 5
+
+
+@pytest.mark.django_db
+def test_application_batch_post_validates_apartments_and_applicants(
+    api_client, elastic_single_project_with_apartments
+):
+    profile = ProfileFactory()
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {_create_token(profile)}")
+    data = create_application_data(profile)
+    # The same applicants applying to the same project again
+    duplicate_data = {**data, "application_uuid": str(uuid.uuid4())}
+    wrong_apartment_data = create_application_data(profile)
+    wrong_apartment_data["apartments"][0]["identifier"] = str(uuid.uuid4())
+
+    response = api_client.post(
+        reverse("application_form:application-batch"),
+        [data, duplicate_data, wrong_apartment_data],
+        format="json",
+    )
+
+    assert response.status_code == 200
+    assert [r["status"] for r in response.data] == ["created", "invalid", "invalid"]
+    assert "non_field_errors" in response.data[1]["errors"]
+    assert "apartments" in response.data[2]["errors"]
+    assert Application.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_application_batch_post_reports_concurrently_created_applications(
+    api_client, elastic_single_project_with_apartments
+):
+    profile = ProfileFactory()
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {_create_token(profile)}")
+    data = create_application_data(profile)
+    # Another request creates the first application after the batch has checked
+    # that it doesn't exist
+    ApplicationFactory(external_uuid=data["application_uuid"])
+
+    with mock.patch.object(ApplicationViewSet, "_exclude_existing_applications"):
+        response = api_client.post(
+            reverse("application_form:application-batch"), [data], format="json"
+        )
+
+    assert response.status_code == 200
+    assert [r["status"] for r in response.data] == ["already_exists"]
+    assert Application.objects.count() == 1
+    assert not ApartmentReservation.objects.exists()
+
+
+@pytest.mark.django_db
+def test_application_batch_post_requires_a_list(
+    api_client, elastic_single_project_with_apartments
+):
+    profile = ProfileFactory()
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {_create_token(profile)}")
+    data = create_application_data(profile)
+
+    response = api_client.post(
+        reverse("application_form:application-batch"), data, format="json"
+    )
+
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_application_batch_post_requires_authentication(
+    api_client, elastic_single_project_with_apartments
+):
+    data = create_application_data(ProfileFactory())
+
+    response = api_client.post(
+        reverse("application_form:application-batch"), [data], format="json"
+    )
+
+    assert response.status_code == 401
+    assert not Application.objects.exists()
+
+
 @pytest.mark.parametrize("already_existing_customer", (False, True))
 @pytest.mark.django_db
 def test_application_post_single_profile_customer(
@@ -449,7 +563,7 @@ def test_get_apartment_states(
         ApartmentReservationFactory(
             apartment_uuid=apartment.uuid,
             state=ApartmentReservationState.RESERVED,
-            list_position=1,
+            list_order=1,
         )
 
     # Sold apartments
@@ -467,7 +581,7 @@ def test_get_apartment_states(
     cancelled_reservation = ApartmentReservationFactory(
         apartment_uuid=haso_apartments[2].uuid,
         state=ApartmentReservationState.RESERVED,
-        list_position=2,
+        list_order=2,
     )
     cancelled_reservation.set_state(ApartmentReservationState.CANCELED)
     assert (
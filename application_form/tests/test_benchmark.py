@@ -0,0 +1,82 @@
+import pytest
+import uuid
+from elasticsearch_dsl import connections
+
+from application_form.benchmark import (
+    FakeElasticsearch,
+    PHASES,
+    run_intake_benchmark,
+    run_lottery_benchmark,
+)
+from application_form.models import ApartmentReservation, Application
+from application_form.services.lottery.hitas import _PRIORITIZE_CHILDREN_ROOM_THRESHOLD
+
+
+def test_fake_apartments_have_room_counts_on_both_sides_of_the_threshold():
+    es = FakeElasticsearch(uuid.uuid4(), "Hitas", 8)
+    room_counts = [document["room_count"] for document in es.documents]
+    assert any(count >= _PRIORITIZE_CHILDREN_ROOM_THRESHOLD for count in room_counts)
+    assert any(count < _PRIORITIZE_CHILDREN_ROOM_THRESHOLD for count in room_counts)
+
+
+@pytest.mark.django_db
+def test_hitas_lottery_benchmark_completes():
+    result = run_lottery_benchmark(
+        ownership_type="Hitas", apartments=8, applications=20, seed=1
+    )
+
+    phases = {phase.name: phase for phase in result.phases}
+    assert phases["shuffle"].wall_time > 0
+    assert phases["save_orders"].db_queries > 0
+    assert not ApartmentReservation.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("ownership_type", ["Haso", "Hitas"])
+def test_lottery_benchmark_reports_every_phase(ownership_type):
+    result = run_lottery_benchmark(
+        ownership_type=ownership_type, apartments=5, applications=10, seed=1
+    )
+
+    assert [phase.name for phase in result.phases] == PHASES
+    assert result.reservations == 50
+    phases = {phase.name: phase for phase in result.phases}
+    assert phases["reserve"].db_queries == 0
+    assert phases["save"].db_queries > 0
+    assert result.total.es_calls > 0
+    # The synthetic data is rolled back
+    assert not Application.objects.exists()
+    assert not ApartmentReservation.objects.exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("ownership_type", ["Haso", "Hitas"])
+def test_lottery_benchmark_legacy_lottery_queries_more(ownership_type):
+    kwargs = dict(ownership_type=ownership_type, apartments=5, applications=10, seed=1)
+    result = run_lottery_benchmark(**kwargs)
+    legacy_result = run_lottery_benchmark(legacy=True, **kwargs)
+
+    assert legacy_result.total.db_queries > result.total.db_queries
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize("lock_mode", ["apartment", "table"])
+def test_intake_benchmark_adds_applications_concurrently(lock_mode):
+    result = run_intake_benchmark(
+        lock_mode=lock_mode, threads=2, projects=2, apartments=3, applications=6
+    )
+
+    assert result.applications == 6
+    assert result.wall_time > 0
+    # The data of the benchmark is deleted afterwards
+    assert not Application.objects.exists()
+    assert not ApartmentReservation.objects.exists()
+
+
+@pytest.mark.django_db
+def test_lottery_benchmark_restores_the_elasticsearch_connection():
+    elasticsearch = connections.get_connection()
+
+    run_lottery_benchmark(ownership_type="Hitas", apartments=2, applications=2, seed=1)
+
+    assert connections.get_connection() is elasticsearch
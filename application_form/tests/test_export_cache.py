@@ -0,0 +1,160 @@
+import pytest
+import uuid
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
+
+from apartment.services import sync_apartments
+from application_form.models import ApartmentDataVersion, ApartmentReservation
+from application_form.services import export_cache
+from application_form.services.export import ApplicantExportService
+from application_form.services.export_cache import (
+    export_key,
+    get_project_data_version,
+    iter_cached_csv_bytes,
+)
+from application_form.services.queue import add_application_to_queues
+from application_form.tests.factories import (
+    ApartmentReservationFactory,
+    ApplicationFactory,
+)
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    export_cache.EXPORT_CACHE_ALIAS: {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "exports-tests",
+    },
+}
+
+
+@pytest.fixture
+def cache():
+    with override_settings(CACHES=LOCMEM_CACHES):
+        export_cache._get_cache().clear()
+        yield export_cache._get_cache()
+        export_cache._get_cache().clear()
+
+
+@pytest.mark.django_db
+def test_data_version_changes_with_the_reservations(
+    elastic_project_with_5_apartments, django_capture_on_commit_callbacks
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    apartment_uuids = [apartment.uuid for apartment in apartments]
+    version = get_project_data_version(project_uuid, apartment_uuids)
+    assert get_project_data_version(project_uuid, apartment_uuids) == version
+
+    with django_capture_on_commit_callbacks(execute=True):
+        reservation = ApartmentReservationFactory(apartment_uuid=apartment_uuids[0])
+    assert get_project_data_version(project_uuid, apartment_uuids) != version
+
+    version = get_project_data_version(project_uuid, apartment_uuids)
+    with django_capture_on_commit_callbacks(execute=True):
+        ApartmentReservationFactory(apartment_uuid=uuid.uuid4())
+    assert get_project_data_version(project_uuid, apartment_uuids) == version
+
+    profile = reservation.customer.primary_profile
+    profile.first_name = "Changed"
+    with django_capture_on_commit_callbacks(execute=True):
+        profile.save()
+    assert get_project_data_version(project_uuid, apartment_uuids) != version
+
+    version = get_project_data_version(project_uuid, apartment_uuids)
+    reservation.customer.has_children = not reservation.customer.has_children
+    with django_capture_on_commit_callbacks(execute=True):
+        reservation.customer.save()
+    assert get_project_data_version(project_uuid, apartment_uuids) != version
+
+
+@pytest.mark.django_db
+def test_data_versions_are_bumped_once_per_transaction(
+    elastic_project_with_5_apartments, django_capture_on_commit_callbacks
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    apartment_uuids = [apartment.uuid for apartment in apartments]
+    with django_capture_on_commit_callbacks(execute=True):
+        reservations = [
+            ApartmentReservationFactory(apartment_uuid=apartment_uuid)
+            for apartment_uuid in apartment_uuids
+        ]
+    versions = dict(
+        ApartmentDataVersion.objects.values_list("apartment_uuid", "version")
+    )
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        for reservation in reservations:
+            reservation.save()
+            reservation.customer.primary_profile.save()
+            reservation.customer.save()
+        # Nothing is bumped before the transaction is committed
+        assert (
+            dict(ApartmentDataVersion.objects.values_list("apartment_uuid", "version"))
+            == versions
+        )
+
+    assert len(callbacks) == 1
+    with CaptureQueriesContext(connection) as context:
+        callbacks[0]()
+    assert dict(
+        ApartmentDataVersion.objects.values_list("apartment_uuid", "version")
+    ) == {apartment_uuid: version + 1 for apartment_uuid, version in versions.items()}
+    # The changed apartments are found with one query, and bumped with the queries
+    # of a single bump
+    assert len(context.captured_queries) <= 6
+
+
+@pytest.mark.django_db
+def test_data_version_changes_when_added_to_queue(elastic_project_with_5_apartments):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    apartment_uuids = [apartment.uuid for apartment in apartments]
+    version = get_project_data_version(project_uuid, apartment_uuids)
+
+    application = ApplicationFactory()
+    application.application_apartments.create(
+        apartment_uuid=apartment_uuids[0], priority_number=1
+    )
+    add_application_to_queues(application)
+    assert get_project_data_version(project_uuid, apartment_uuids) != version
+
+
+@pytest.mark.django_db
+def test_export_file_is_cached_by_data_version(
+    elastic_project_with_5_apartments, cache
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    sync_apartments(project_uuid)
+    for apartment in apartments:
+        ApartmentReservationFactory(apartment_uuid=apartment.uuid)
+    export_service = ApplicantExportService(
+        ApartmentReservation.objects.filter(
+            apartment_uuid__in=[apartment.uuid for apartment in apartments]
+        )
+    )
+
+    content = b"".join(
+        iter_cached_csv_bytes(export_service, "applicants", project_uuid, "1")
+    )
+    assert content == b"".join(export_service.iter_csv_bytes())
+    assert cache.get(export_key("applicants", project_uuid, "1")) == content
+    # The cached file is used without the export service
+    assert list(iter_cached_csv_bytes(None, "applicants", project_uuid, "1")) == [
+        content
+    ]
+
+    # The file of the previous version is evicted
+    b"".join(iter_cached_csv_bytes(export_service, "applicants", project_uuid, "2"))
+    assert cache.get(export_key("applicants", project_uuid, "1")) is None
+    assert cache.get(export_key("applicants", project_uuid, "2")) == content
+
+
+@pytest.mark.django_db
+def test_export_rows_are_fetched_before_streaming(cache):
+    export_service = mock.Mock()
+    export_service.get_rows.side_effect = ObjectDoesNotExist
+
+    # The error is raised when the response is created, not in the middle of it
+    with pytest.raises(ObjectDoesNotExist):
+        iter_cached_csv_bytes(export_service, "applicants", uuid.uuid4(), "1")
@@ -1,9 +1,13 @@
+import codecs
 import pytest
 from _pytest.fixtures import fixture
 from datetime import timedelta
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from apartment.elastic.queries import get_apartment_uuids, get_project
+from apartment.services import sync_apartments
 from application_form.enums import ApartmentReservationState
 from application_form.models import (
     ApartmentReservation,
@@ -28,6 +32,7 @@ from users.tests.factories import ProfileFactory
 @fixture
 def applicant_export_service(elastic_project_with_5_apartments):
     project_uuid, apartments = elastic_project_with_5_apartments
+    sync_apartments(project_uuid)
     profile = ProfileFactory()
     customer = CustomerFactory(primary_profile=profile, secondary_profile=None)
     application = ApplicationFactory(customer=customer)
@@ -52,6 +57,7 @@ def applicant_export_service_with_additional_applicant(
     elastic_project_with_5_apartments,
 ):
     project_uuid, apartments = elastic_project_with_5_apartments
+    sync_apartments(project_uuid)
     profile = ProfileFactory()
     secondary_profile = ProfileFactory()
     customer = CustomerFactory(
@@ -97,6 +103,35 @@ def test_export_applicants(applicant_export_service):
     assert csv_lines[2][3] is None
 
 
+@pytest.mark.django_db
+def test_export_applicants_query_count_does_not_depend_on_rows(
+    elastic_project_with_5_apartments,
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    sync_apartments(project_uuid)
+    apartment_uuids = [apartment.uuid for apartment in apartments]
+    for apartment_uuid in apartment_uuids:
+        for _ in range(3):
+            customer = CustomerFactory(secondary_profile=ProfileFactory())
+            ApartmentReservationFactory(
+                apartment_uuid=apartment_uuid, customer=customer
+            )
+
+    query_counts = []
+    for uuids in [apartment_uuids[:1], apartment_uuids]:
+        export_service = ApplicantExportService(
+            ApartmentReservation.objects.filter(apartment_uuid__in=uuids)
+        )
+        with CaptureQueriesContext(connection) as context:
+            csv_lines = export_service.get_rows()
+        assert len(csv_lines) == len(uuids) * 3 + 1
+        assert all(line[3] for line in csv_lines[1:])
+        query_counts.append(len(context.captured_queries))
+
+    # The reservations and their apartments
+    assert query_counts == [2, 2]
+
+
 @pytest.mark.django_db
 def test_export_applicants_and_secondary_applicants(
     applicant_export_service_with_additional_applicant,
@@ -128,6 +163,7 @@ def test_export_project_lottery_result(
         project_uuid, _ = elastic_hitas_project_with_5_apartments
     else:
         project_uuid, _ = elastic_haso_project_with_5_apartments
+    sync_apartments(project_uuid)
 
     apartment_uuids = get_apartment_uuids(project_uuid)
     for apartment_uuid in apartment_uuids:
@@ -138,11 +174,15 @@ def test_export_project_lottery_result(
         add_application_to_queues(apt_app[1].application)
     distribute_apartments(project_uuid)
     # reservations added after the lottery shouldn't be included
-    ApartmentReservationFactory(apartment_uuid=apartment_uuids[0], list_position=777)
+    ApartmentReservationFactory(apartment_uuid=apartment_uuids[0], list_order=777)
 
     project = get_project(project_uuid)
     export_service = ProjectLotteryResultExportService(project)
-    csv_lines = export_service.get_rows()
+    with CaptureQueriesContext(connection) as context:
+        csv_lines = export_service.get_rows()
+    # The apartments, the lottery timestamp and the reservations with their results
+    # and profiles
+    assert len(context.captured_queries) == 3
     csv_headers = csv_lines[3]
     csv_content = csv_lines[4:]
     assert len(csv_lines) == 14
@@ -188,6 +228,7 @@ def test_export_sale_report(
             project_uuid, _ = elastic_hitas_project_with_5_apartments
         else:
             project_uuid, _ = elastic_haso_project_with_5_apartments
+        sync_apartments(project_uuid)
         apartment_uuids = get_apartment_uuids(project_uuid)
         for apartment_uuid in apartment_uuids:
             apt_app = ApplicationApartmentFactory.create_batch(
@@ -215,8 +256,11 @@ def test_export_sale_report(
         state=ApartmentReservationState.SOLD, timestamp__range=[start_date, end_date]
     )
     assert state_events.count() == 2
-    export_service = SaleReportExportService(state_events)
-    csv_lines = export_service.get_rows()
+    with CaptureQueriesContext(connection) as context:
+        export_service = SaleReportExportService(state_events)
+        csv_lines = export_service.get_rows()
+    # The sold events, their apartments and the grouped reservation states
+    assert len(context.captured_queries) == 3
 
     assert len(csv_lines) == 4
     for idx, header in enumerate(csv_lines[0]):
@@ -228,6 +272,11 @@ def test_export_sale_report(
         csv_lines[2][1] == 1 and csv_lines[2][2] == ""
     )
     assert csv_lines[3][:3] == ["Total", 1, 1]
+    # One apartment of each project is sold
+    assert sorted(line[3] for line in csv_lines[1:3]) == sorted(
+        get_project(project_uuid).project_apartment_count - 1
+        for project_uuid in project_uuids
+    )
 
 
 @pytest.mark.django_db
@@ -271,3 +320,17 @@ def test_write_csv_file(applicant_export_service, tmp_path):
         contents = f.read()
         assert contents.startswith('"Primary applicant";"Primary applicant address"')
         assert "äöÄÖtest" in contents
+
+
+@pytest.mark.django_db
+def test_iter_csv_bytes(applicant_export_service):
+    profile = applicant_export_service.get_reservations()[0].customer.primary_profile
+    profile.last_name = "äöÄÖtest"
+    profile.save()
+    chunks = list(applicant_export_service.iter_csv_bytes())
+    assert len(chunks) == 6
+    assert chunks[0].startswith(codecs.BOM_UTF8 + b'"Primary applicant";')
+    assert not any(chunk.startswith(codecs.BOM_UTF8) for chunk in chunks[1:])
+    assert b"".join(chunks).decode("utf-8-sig") == (
+        applicant_export_service.get_csv_string()
+    )
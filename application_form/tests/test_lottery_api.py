@@ -1,13 +1,24 @@
 import pytest
+import threading
 from datetime import timedelta
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status
+from unittest import mock
 
 from apartment.tests.factories import ApartmentDocumentFactory
 from apartment_application_service.settings import METADATA_HANDLER_INFORMATION
-from application_form.enums import ApplicationType
-from application_form.models import ApartmentReservation, LotteryEvent
+from application_form.enums import (
+    ApartmentReservationState,
+    ApplicationType,
+    LotteryJobState,
+)
+from application_form.models import ApartmentReservation, LotteryEvent, LotteryJob
+from application_form.services.lottery.jobs import (
+    _ProgressReporter,
+    fail_stale_lottery_jobs,
+    run_next_lottery_job,
+)
 from application_form.services.queue import add_application_to_queues
 from application_form.tests.factories import ApplicationFactory
 
@@ -200,3 +211,136 @@ def test_execute_lottery_generate_metadata(
         assert (
             r.handler == sales_ui_salesperson_api_client.user.profile_or_user_full_name
         )
+
+
+@pytest.mark.django_db
+def test_lottery_job_is_submitted_run_and_polled(
+    sales_ui_salesperson_api_client, elastic_haso_project_application_end_time_finished
+):
+    project_uuid, apartment = elastic_haso_project_application_end_time_finished
+
+    app = ApplicationFactory(type=ApplicationType.HASO)
+    app.application_apartments.create(apartment_uuid=apartment.uuid, priority_number=0)
+    add_application_to_queues(app)
+
+    data = {"project_uuid": project_uuid}
+    response = sales_ui_salesperson_api_client.post(
+        reverse("application_form:sales-lottery-job-list"), data, format="json"
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    job_id = response.data["id"]
+    assert response.data["state"] == LotteryJobState.PENDING.value
+    assert (
+        ApartmentReservation.objects.get().state == ApartmentReservationState.SUBMITTED
+    )
+
+    # Only one lottery per project can be pending or running at a time
+    response = sales_ui_salesperson_api_client.post(
+        reverse("application_form:sales-lottery-job-list"), data, format="json"
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    assert run_next_lottery_job().pk == job_id
+    assert run_next_lottery_job() is None
+
+    response = sales_ui_salesperson_api_client.get(
+        reverse("application_form:sales-lottery-job-detail", args=(job_id,)),
+        format="json",
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["state"] == LotteryJobState.SUCCEEDED.value
+    assert response.data["apartments_done"] == 1
+    assert response.data["apartments_total"] == 1
+    assert response.data["started_at"] is not None
+    assert response.data["finished_at"] is not None
+    assert (
+        ApartmentReservation.objects.get().state == ApartmentReservationState.RESERVED
+    )
+
+
+@pytest.mark.django_db
+def test_lottery_job_post_without_applications(
+    sales_ui_salesperson_api_client, elastic_haso_project_with_5_apartments
+):
+    project_uuid, apartments = elastic_haso_project_with_5_apartments
+
+    data = {"project_uuid": project_uuid}
+    response = sales_ui_salesperson_api_client.post(
+        reverse("application_form:sales-lottery-job-list"), data, format="json"
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert not LotteryJob.objects.exists()
+
+
+@pytest.mark.django_db
+def test_execute_lottery_for_project_post_with_pending_job(
+    sales_ui_salesperson_api_client, elastic_haso_project_application_end_time_finished
+):
+    project_uuid, apartment = elastic_haso_project_application_end_time_finished
+    app = ApplicationFactory(type=ApplicationType.HASO)
+    app.application_apartments.create(apartment_uuid=apartment.uuid, priority_number=0)
+    add_application_to_queues(app)
+    LotteryJob.objects.create(project_uuid=project_uuid)
+
+    data = {"project_uuid": project_uuid}
+    response = sales_ui_salesperson_api_client.post(
+        reverse("application_form:execute_lottery_for_project"), data, format="json"
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert not LotteryEvent.objects.exists()
+
+
+@pytest.mark.django_db
+def test_stale_running_lottery_job_is_failed(
+    sales_ui_salesperson_api_client, elastic_haso_project_application_end_time_finished
+):
+    project_uuid, apartment = elastic_haso_project_application_end_time_finished
+    app = ApplicationFactory(type=ApplicationType.HASO)
+    app.application_apartments.create(apartment_uuid=apartment.uuid, priority_number=0)
+    add_application_to_queues(app)
+    job = LotteryJob.objects.create(
+        project_uuid=project_uuid,
+        state=LotteryJobState.RUNNING,
+        started_at=timezone.now(),
+    )
+
+    # A job reporting progress is not stale
+    assert fail_stale_lottery_jobs() == 0
+
+    # The worker of the job died an hour ago
+    LotteryJob.objects.filter(pk=job.pk).update(
+        updated_at=timezone.now() - timedelta(hours=1)
+    )
+    data = {"project_uuid": project_uuid}
+    response = sales_ui_salesperson_api_client.post(
+        reverse("application_form:sales-lottery-job-list"), data, format="json"
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    job.refresh_from_db()
+    assert job.state == LotteryJobState.FAILED
+    assert job.finished_at is not None
+
+
+@pytest.mark.django_db
+def test_lottery_job_sends_heartbeats_without_progress_reports():
+    job = LotteryJob(pk=1)
+    heartbeats = []
+    second_heartbeat = threading.Event()
+
+    def update(reporter):
+        heartbeats.append(reporter.job.apartments_done)
+        if len(heartbeats) == 2:
+            second_heartbeat.set()
+
+    with mock.patch(
+        "application_form.services.lottery.jobs.HEARTBEAT_INTERVAL", 0.01
+    ), mock.patch(
+        "application_form.services.lottery.jobs.PROGRESS_UPDATE_INTERVAL", 0.01
+    ), mock.patch.object(
+        _ProgressReporter, "_update", update
+    ):
+        with _ProgressReporter(job):
+            # E.g. the lottery results are being saved
+            assert second_heartbeat.wait(5)
+
+    assert heartbeats[:2] == [0, 0]
@@ -0,0 +1,98 @@
+import random
+import uuid
+from django.db import transaction
+from pytest import fixture, mark
+
+from application_form.enums import ApplicationType
+from application_form.models import (
+    ApartmentReservation,
+    ApartmentReservationStateChangeEvent,
+)
+from application_form.services.application import (
+    _reserve_apartments,
+    _reserve_haso_apartment,
+)
+from application_form.services.lottery.engine import LotteryEngine
+from application_form.services.lottery.hitas import _shuffle_applications
+from application_form.services.queue import add_application_to_queues
+from application_form.tests.factories import ApplicationFactory
+
+
+@fixture(autouse=True)
+def check_latest_reservation_state_change_events_after_every_test(
+    check_latest_reservation_state_change_events,
+):
+    pass
+
+
+def _create_applications(apartment_uuids, application_type, count=8):
+    for _ in range(count):
+        application = ApplicationFactory(
+            type=application_type,
+            # Duplicate right of residence numbers end up in review
+            right_of_residence=random.randint(1, count),
+        )
+        applied_apartments = random.sample(
+            apartment_uuids, random.randint(1, len(apartment_uuids))
+        )
+        for priority_number, apartment_uuid in enumerate(applied_apartments):
+            application.application_apartments.create(
+                apartment_uuid=apartment_uuid, priority_number=priority_number
+            )
+        add_application_to_queues(application)
+
+
+def _get_lottery_result():
+    reservations = {
+        r.id: (r.state, r.queue_position)
+        for r in ApartmentReservation.objects.with_positions()
+    }
+    state_change_events = [
+        (e.reservation_id, e.state, e.cancellation_reason)
+        for e in ApartmentReservationStateChangeEvent.objects.order_by("id")
+    ]
+    return reservations, state_change_events
+
+
+@mark.django_db
+def test_hitas_lottery_engine_gives_same_result_as_reserving_one_by_one(
+    elastic_hitas_project_with_3_tiny_apartments,
+):
+    _, apartments = elastic_hitas_project_with_3_tiny_apartments
+    apartment_uuids = [uuid.UUID(a.uuid) for a in apartments]
+    _create_applications(apartment_uuids, ApplicationType.HITAS)
+    for apartment_uuid in apartment_uuids:
+        _shuffle_applications(apartment_uuid)
+
+    with transaction.atomic():
+        _reserve_apartments(apartment_uuids)
+        expected_result = _get_lottery_result()
+        transaction.set_rollback(True)
+
+    engine = LotteryEngine(apartment_uuids, "hitas")
+    engine.reserve_apartments(apartment_uuids)
+    engine.save()
+
+    assert _get_lottery_result() == expected_result
+
+
+@mark.django_db
+def test_haso_lottery_engine_gives_same_result_as_reserving_one_by_one(
+    elastic_haso_project_with_5_apartments,
+):
+    _, apartments = elastic_haso_project_with_5_apartments
+    apartment_uuids = [uuid.UUID(a.uuid) for a in apartments]
+    _create_applications(apartment_uuids, ApplicationType.HASO)
+
+    with transaction.atomic():
+        for apartment_uuid in apartment_uuids:
+            _reserve_haso_apartment(apartment_uuid)
+        expected_result = _get_lottery_result()
+        transaction.set_rollback(True)
+
+    engine = LotteryEngine(apartment_uuids, "haso")
+    for apartment_uuid in apartment_uuids:
+        engine.reserve_haso_apartment(apartment_uuid)
+    engine.save()
+
+    assert _get_lottery_result() == expected_result
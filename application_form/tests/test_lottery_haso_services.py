@@ -11,10 +11,12 @@ from application_form.services.application import (
     get_ordered_applications,
 )
 from application_form.services.lottery.haso import _distribute_haso_apartments
+from application_form.services.lottery.utils import _save_application_orders
 from application_form.services.queue import add_application_to_queues
 from application_form.services.reservation import create_reservation_without_application
 from application_form.tests.factories import ApplicationFactory
 from customer.tests.factories import CustomerFactory
+from users.tests.factories import UserFactory
 
 
 @fixture(autouse=True)
@@ -128,6 +130,38 @@ def test_application_order_is_not_persisted_twice(
     assert LotteryEvent.objects.filter(apartment_uuid=first_apartment_uuid).count() == 1
 
 
+@mark.django_db
+def test_application_orders_are_persisted_with_constant_number_of_queries(
+    elastic_haso_project_with_5_apartments, django_assert_max_num_queries
+):
+    _, apartments = elastic_haso_project_with_5_apartments
+    apartment_uuids = [apartment.uuid for apartment in apartments]
+    for right_of_residence in range(1, 6):
+        app = ApplicationFactory(
+            type=ApplicationType.HASO, right_of_residence=right_of_residence
+        )
+        for priority_number, apartment_uuid in enumerate(apartment_uuids):
+            app.application_apartments.create(
+                apartment_uuid=apartment_uuid, priority_number=priority_number
+            )
+        add_application_to_queues(app)
+    user = UserFactory()
+
+    with django_assert_max_num_queries(10):
+        _save_application_orders(apartment_uuids, user)
+
+    assert LotteryEvent.objects.count() == 5
+    assert LotteryEventResult.objects.count() == 25
+    for apartment_uuid in apartment_uuids:
+        results = LotteryEventResult.objects.filter(
+            event__apartment_uuid=apartment_uuid
+        ).order_by("result_position")
+        right_of_residences = [
+            r.application_apartment.application.right_of_residence for r in results
+        ]
+        assert right_of_residences == [1, 2, 3, 4, 5]
+
+
 @mark.django_db
 def test_canceling_application_sets_application_state_to_canceled_and_queue_position_to_null(  # noqa: E501
     elastic_haso_project_with_5_apartments,
@@ -142,6 +176,7 @@ def test_canceling_application_sets_application_state_to_canceled_and_queue_posi
     _distribute_haso_apartments(project_uuid)
     cancel_reservation(app_apt.apartment_reservation)
     app_apt.refresh_from_db()
+    app_apt.apartment_reservation.refresh_positions()
     assert app_apt.apartment_reservation.state == ApartmentReservationState.CANCELED
     assert app_apt.apartment_reservation.queue_position is None
 
@@ -11,7 +11,10 @@ from application_form.services.application import (
     cancel_reservation,
     get_ordered_applications,
 )
-from application_form.services.lottery.hitas import _distribute_hitas_apartments
+from application_form.services.lottery.hitas import (
+    _distribute_hitas_apartments,
+    _shuffle_queue_segment,
+)
 from application_form.services.queue import add_application_to_queues
 from application_form.services.reservation import create_reservation_without_application
 from application_form.tests.factories import ApplicationFactory
@@ -192,6 +195,7 @@ def test_canceling_application_sets_state_to_canceled_and_queue_position_to_null
 
     # The state should now be "CANCELED" and queue position null
     app_apt.refresh_from_db()
+    app_apt.apartment_reservation.refresh_positions()
     assert app_apt.apartment_reservation.state == ApartmentReservationState.CANCELED
     assert app_apt.apartment_reservation.queue_position is None
 
@@ -504,3 +508,19 @@ def test_winning_low_priority_apartment_does_not_cancel_higher_priority_applicat
     assert (
         single_high.apartment_reservation.state == ApartmentReservationState.SUBMITTED
     )
+
+
+def test_shuffle_queue_segment_assigns_each_position_once():
+    reservation_ids = list(range(100, 200))
+
+    positions = _shuffle_queue_segment(reservation_ids, start_position=11)
+
+    assert sorted(positions.keys()) == reservation_ids
+    assert sorted(positions.values()) == list(range(11, 111))
+
+
+def test_shuffle_queue_segment_keeps_order_when_random_index_is_zero():
+    with patch("secrets.randbelow", return_value=0):
+        positions = _shuffle_queue_segment([5, 3, 8])
+
+    assert positions == {5: 1, 3: 2, 8: 3}
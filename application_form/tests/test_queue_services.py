@@ -1,21 +1,32 @@
+import uuid
+from django.db import connection, transaction
 from django.db.models import QuerySet
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from pytest import mark, raises
 from unittest.mock import Mock
 
 from application_form.enums import ApartmentQueueChangeEventType, ApplicationType
+from application_form.exceptions import PositionsNotAnnotatedException
 from application_form.models.reservation import (
     ApartmentQueueChangeEvent,
     ApartmentReservation,
 )
 from application_form.services.application import get_ordered_applications
 from application_form.services.queue import (
+    _calculate_haso_order,
+    add_application_apartments_to_queues,
     add_application_to_queues,
+    apply_deferred_queue_orders,
+    get_right_of_residence_rank,
+    POSITION_GAP,
     remove_reservation_from_queue,
 )
 from application_form.tests.factories import (
     ApartmentReservationFactory,
     ApplicationFactory,
 )
+from application_form.utils import _get_advisory_lock_key
 
 
 @mark.django_db
@@ -48,8 +59,8 @@ def test_get_ordered_applications_returns_applications_sorted_by_position(
         )
         ApartmentReservation.objects.create(
             customer=application_apartment.application.customer,
-            queue_position=position,
-            list_position=position,
+            queue_order=position,
+            list_order=position,
             application_apartment=application_apartment,
             apartment_uuid=first_apartment_uuid,
         )
@@ -195,6 +206,330 @@ def test_add_late_application_remains_at_end_when_new_application_is_added(
     ]
 
 
+@mark.django_db
+def test_add_haso_application_between_adjacent_orders_rebalances_queue(
+    elastic_project_with_5_apartments,
+):
+    # If there is no room between the orders of the neighbouring reservations, the
+    # orders of the apartment are rebalanced before adding the application.
+    project_uuid, apartments = elastic_project_with_5_apartments
+    first_apartment_uuid = apartments[0].uuid
+    apps = [
+        ApplicationFactory(type=ApplicationType.HASO, right_of_residence=1),
+        ApplicationFactory(type=ApplicationType.HASO, right_of_residence=3),
+    ]
+    for order, app in enumerate(apps, start=1):
+        application_apartment = app.application_apartments.create(
+            apartment_uuid=first_apartment_uuid, priority_number=1
+        )
+        ApartmentReservationFactory(
+            application_apartment=application_apartment,
+            apartment_uuid=first_apartment_uuid,
+            queue_order=order,
+            list_order=order,
+        )
+    app = ApplicationFactory(type=ApplicationType.HASO, right_of_residence=2)
+    app.application_apartments.create(
+        apartment_uuid=first_apartment_uuid, priority_number=1
+    )
+    add_application_to_queues(app)
+
+    assert list(get_ordered_applications(first_apartment_uuid)) == [
+        apps[0],
+        app,
+        apps[1],
+    ]
+    reservations = (
+        ApartmentReservation.objects.filter(apartment_uuid=first_apartment_uuid)
+        .with_positions()
+        .order_by("queue_order")
+    )
+    assert [r.queue_position for r in reservations] == [1, 2, 3]
+    assert [r.queue_order for r in reservations] == [
+        POSITION_GAP,
+        POSITION_GAP + POSITION_GAP // 2,
+        2 * POSITION_GAP,
+    ]
+
+
+@mark.django_db
+def test_add_haso_application_to_queue_does_not_decrypt_the_queue(
+    elastic_project_with_5_apartments,
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    first_apartment_uuid = apartments[0].uuid
+    for right_of_residence in [1, 3, 5]:
+        app = ApplicationFactory(
+            type=ApplicationType.HASO, right_of_residence=right_of_residence
+        )
+        app.application_apartments.create(
+            apartment_uuid=first_apartment_uuid, priority_number=1
+        )
+        add_application_to_queues(app)
+    app = ApplicationFactory(type=ApplicationType.HASO, right_of_residence=4)
+    application_apartment = app.application_apartments.create(
+        apartment_uuid=first_apartment_uuid, priority_number=1
+    )
+
+    with CaptureQueriesContext(connection) as context:
+        rank = get_right_of_residence_rank(first_apartment_uuid, 4)
+    # The binary search decrypts the number of one reservation per step
+    decrypting_queries = [
+        query for query in context.captured_queries if "pgp_pub_decrypt" in query["sql"]
+    ]
+    assert len(decrypting_queries) == 2
+    # The decrypted reservation is selected by its primary key, so that the rows
+    # skipped by the offset are not decrypted
+    assert not any("OFFSET" in query["sql"] for query in decrypting_queries)
+
+    with CaptureQueriesContext(connection) as context:
+        _calculate_haso_order(first_apartment_uuid, application_apartment, rank)
+
+    assert len(context.captured_queries) == 2
+    assert not any(
+        "pgp_pub_decrypt" in query["sql"] for query in context.captured_queries
+    )
+
+
+@mark.django_db
+def test_right_of_residence_ranks_follow_the_numbers_without_revealing_them(
+    elastic_project_with_5_apartments,
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    first_apartment_uuid = apartments[0].uuid
+    for right_of_residence in [30, 10, 20, 10, 40]:
+        app = ApplicationFactory(
+            type=ApplicationType.HASO, right_of_residence=right_of_residence
+        )
+        app.application_apartments.create(
+            apartment_uuid=first_apartment_uuid, priority_number=1
+        )
+        add_application_to_queues(app)
+
+    reservations = list(
+        ApartmentReservation.objects.filter(
+            apartment_uuid=first_apartment_uuid
+        ).order_by("right_of_residence_rank")
+    )
+
+    assert [r.right_of_residence for r in reservations] == [10, 10, 20, 30, 40]
+    ranks = {r.right_of_residence_rank for r in reservations}
+    assert len(ranks) == 5
+    assert not ranks & {10, 20, 30, 40}
+
+
+@mark.django_db
+def test_right_of_residence_ranks_are_rebalanced_when_there_is_no_room(
+    elastic_project_with_5_apartments,
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    first_apartment_uuid = apartments[0].uuid
+    for right_of_residence, rank in [(1, 1), (3, 2)]:
+        ApartmentReservationFactory(
+            apartment_uuid=first_apartment_uuid,
+            right_of_residence=right_of_residence,
+            right_of_residence_rank=rank,
+        )
+
+    rank = get_right_of_residence_rank(first_apartment_uuid, 2)
+
+    ranks = list(
+        ApartmentReservation.objects.filter(apartment_uuid=first_apartment_uuid)
+        .order_by("right_of_residence_rank")
+        .values_list("right_of_residence_rank", flat=True)
+    )
+    assert ranks == [POSITION_GAP, 2 * POSITION_GAP]
+    assert ranks[0] < rank < ranks[1]
+
+
+@mark.django_db
+def test_positions_are_dense_regardless_of_the_orders(
+    elastic_project_with_5_apartments,
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    first_apartment_uuid = apartments[0].uuid
+    for queue_order, list_order in [(30, 10), (None, 25), (7, 40), (1000, 41)]:
+        ApartmentReservationFactory(
+            apartment_uuid=first_apartment_uuid,
+            queue_order=queue_order,
+            list_order=list_order,
+        )
+    # Reservations of another apartment don't affect the positions
+    ApartmentReservationFactory(
+        apartment_uuid=apartments[1].uuid, queue_order=1, list_order=1
+    )
+    reservations = ApartmentReservation.objects.filter(
+        apartment_uuid=first_apartment_uuid
+    ).order_by("list_order")
+    expected = [(2, 1), (None, 2), (1, 3), (3, 4)]
+
+    assert [
+        (r.queue_position, r.list_position) for r in reservations.with_positions()
+    ] == expected
+    assert [
+        (r.queue_position, r.list_position)
+        for r in reservations.with_window_positions()
+    ] == expected
+    # Without the annotation the positions must be fetched explicitly
+    for reservation in reservations:
+        reservation.refresh_positions()
+    assert [(r.queue_position, r.list_position) for r in reservations] == expected
+    # The positions annotated with with_positions() can also be filtered on
+    assert reservations.with_positions().get(queue_position=1).queue_order == 7
+
+
+@mark.django_db
+def test_positions_are_not_annotated_by_default(elastic_project_with_5_apartments):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    reservation = ApartmentReservationFactory(
+        apartment_uuid=apartments[0].uuid, queue_order=1, list_order=1
+    )
+    application_apartment = reservation.application_apartment
+
+    with CaptureQueriesContext(connection) as context:
+        ApartmentReservation.objects.filter(pk=reservation.pk).exists()
+        ApartmentReservation.objects.filter(pk=reservation.pk).update(queue_order=1)
+        application_apartment.refresh_from_db()
+        application_apartment.apartment_reservation
+
+    assert len(context.captured_queries) == 4
+    assert all(
+        "COUNT(" not in query["sql"].upper() for query in context.captured_queries
+    )
+    # Reading the positions of an unannotated reservation does not query them
+    reservation = application_apartment.apartment_reservation
+    with CaptureQueriesContext(connection) as context:
+        with raises(PositionsNotAnnotatedException):
+            reservation.queue_position
+        with raises(PositionsNotAnnotatedException):
+            reservation.list_position
+    assert len(context.captured_queries) == 0
+    # A single reservation can fetch them with one query
+    with CaptureQueriesContext(connection) as context:
+        reservation.refresh_positions()
+    assert len(context.captured_queries) == 1
+    assert (reservation.queue_position, reservation.list_position) == (1, 1)
+
+
+@mark.django_db
+@mark.parametrize("application_type", [ApplicationType.HASO, ApplicationType.HITAS])
+def test_add_application_apartments_to_queues_in_one_batch(
+    elastic_project_with_5_apartments, application_type
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    first_apartment_uuid = apartments[0].uuid
+    existing_app = ApplicationFactory(type=application_type, right_of_residence=2)
+    existing_app.application_apartments.create(
+        apartment_uuid=first_apartment_uuid, priority_number=1
+    )
+    add_application_to_queues(existing_app)
+    apps = [
+        ApplicationFactory(type=application_type, right_of_residence=3),
+        ApplicationFactory(type=application_type, right_of_residence=1),
+    ]
+    application_apartments = [
+        app.application_apartments.create(
+            apartment_uuid=apartment.uuid, priority_number=1
+        )
+        for app in apps
+        for apartment in apartments[:2]
+    ]
+
+    reservations = add_application_apartments_to_queues(application_apartments)
+
+    assert len(reservations) == 4
+    if application_type == ApplicationType.HASO:
+        expected = [apps[1], existing_app, apps[0]]
+    else:
+        expected = [existing_app] + apps
+    assert list(get_ordered_applications(first_apartment_uuid)) == expected
+    assert list(get_ordered_applications(apartments[1].uuid)) == [
+        app for app in expected if app != existing_app
+    ]
+    assert ApartmentQueueChangeEvent.objects.count() == 5
+
+
+@mark.django_db
+@override_settings(HASO_QUEUE_ORDERING_DEFERRED=True)
+def test_deferred_haso_queue_is_ordered_at_once(elastic_project_with_5_apartments):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    first_apartment_uuid = apartments[0].uuid
+    app1 = ApplicationFactory(type=ApplicationType.HASO, right_of_residence=1)
+    app2 = ApplicationFactory(type=ApplicationType.HASO, right_of_residence=2)
+    app3 = ApplicationFactory(type=ApplicationType.HASO, right_of_residence=3)
+    for app in [app3, app1, app2]:
+        app.application_apartments.create(
+            apartment_uuid=first_apartment_uuid, priority_number=1
+        )
+        # The deferred applications are added without decrypting the queue
+        with CaptureQueriesContext(connection) as context:
+            add_application_to_queues(app)
+        assert not any(
+            "pgp_pub_decrypt" in query["sql"] for query in context.captured_queries
+        )
+
+    # The applications are kept in the order they were added in
+    assert list(get_ordered_applications(first_apartment_uuid)) == [app3, app1, app2]
+    assert ApartmentReservation.objects.filter(queue_order_deferred=True).count() == 3
+    assert not ApartmentReservation.objects.exclude(
+        right_of_residence_rank=None
+    ).exists()
+
+    assert apply_deferred_queue_orders([first_apartment_uuid]) == 1
+
+    assert list(get_ordered_applications(first_apartment_uuid)) == [app1, app2, app3]
+    reservations = ApartmentReservation.objects.order_by("list_order")
+    assert [
+        (r.queue_position, r.list_position) for r in reservations.with_positions()
+    ] == [
+        (1, 1),
+        (2, 2),
+        (3, 3),
+    ]
+    assert not reservations.filter(queue_order_deferred=True).exists()
+    assert [r.right_of_residence_rank for r in reservations] == [
+        POSITION_GAP,
+        2 * POSITION_GAP,
+        3 * POSITION_GAP,
+    ]
+    # Nothing is left to order
+    assert apply_deferred_queue_orders() == 0
+
+
+@mark.django_db
+@override_settings(HASO_QUEUE_ORDERING_DEFERRED=True)
+def test_late_haso_application_orders_the_deferred_queue_first(
+    elastic_project_with_5_apartments,
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    first_apartment_uuid = apartments[0].uuid
+    apps = [
+        ApplicationFactory(type=ApplicationType.HASO, right_of_residence=5),
+        ApplicationFactory(type=ApplicationType.HASO, right_of_residence=4),
+    ]
+    late_apps = [
+        ApplicationFactory(
+            type=ApplicationType.HASO, right_of_residence=3, submitted_late=True
+        ),
+        ApplicationFactory(
+            type=ApplicationType.HASO, right_of_residence=2, submitted_late=True
+        ),
+    ]
+    for app in apps + late_apps:
+        app.application_apartments.create(
+            apartment_uuid=first_apartment_uuid, priority_number=1
+        )
+        add_application_to_queues(app)
+
+    assert list(get_ordered_applications(first_apartment_uuid)) == [
+        apps[1],
+        apps[0],
+        late_apps[1],
+        late_apps[0],
+    ]
+    assert not ApartmentReservation.objects.filter(queue_order_deferred=True).exists()
+
+
 @mark.django_db
 def test_adding_application_to_queue_creates_change_event(
     elastic_project_with_5_apartments,
@@ -217,6 +552,50 @@ def test_adding_application_to_queue_creates_change_event(
     ).exists()
 
 
+@mark.django_db
+def test_adding_application_to_queues_locks_only_the_applied_apartments(
+    elastic_project_with_5_apartments,
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    application = ApplicationFactory(type=ApplicationType.HITAS)
+    for priority_number, apartment in enumerate(apartments[:2], start=1):
+        application.application_apartments.create(
+            apartment_uuid=apartment.uuid, priority_number=priority_number
+        )
+    with transaction.atomic():
+        add_application_to_queues(application)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' "
+                "AND pid = pg_backend_pid()"
+            )
+            assert cursor.fetchone()[0] == 2
+    assert ApartmentReservation.objects.count() == 2
+
+
+@mark.django_db
+@override_settings(APARTMENT_QUEUE_LOCK_MODE="table")
+def test_adding_application_to_queues_with_table_lock_mode(
+    elastic_project_with_5_apartments,
+):
+    project_uuid, apartments = elastic_project_with_5_apartments
+    application = ApplicationFactory(type=ApplicationType.HITAS)
+    application.application_apartments.create(
+        apartment_uuid=apartments[0].uuid, priority_number=1
+    )
+    add_application_to_queues(application)
+    assert ApartmentReservation.objects.with_positions().get().queue_position == 1
+
+
+def test_advisory_lock_key_is_a_signed_64_bit_integer():
+    keys = [_get_advisory_lock_key(uuid.uuid4()) for _ in range(100)]
+    assert all(-(2**63) <= key < 2**63 for key in keys)
+    apartment_uuid = uuid.uuid4()
+    assert _get_advisory_lock_key(apartment_uuid) == _get_advisory_lock_key(
+        str(apartment_uuid)
+    )
+
+
 @mark.django_db
 def test_remove_application_from_queue(elastic_project_with_5_apartments):
     # An application should be removed from the queue and all remaining applications
@@ -234,8 +613,8 @@ def test_remove_application_from_queue(elastic_project_with_5_apartments):
         )
         ApartmentReservation.objects.create(
             customer=application_apartment.application.customer,
-            queue_position=position,
-            list_position=position,
+            queue_order=position,
+            list_order=position,
             application_apartment=application_apartment,
             apartment_uuid=first_apartment_uuid,
         )
@@ -292,6 +671,7 @@ def test_removing_application_from_queue_nullifies_queue_number(
     remove_reservation_from_queue(apartment_application.apartment_reservation)
 
     apartment_application.apartment_reservation.refresh_from_db()
+    apartment_application.apartment_reservation.refresh_positions()
 
     assert apartment_application.apartment_reservation.queue_position is None
 
@@ -303,7 +683,7 @@ def test_remove_reservation_without_queue_positio_bug_ASU_1672(
     project_uuid, apartments = elastic_project_with_5_apartments
     first_apartment_uuid = apartments[0].uuid
     reservation = ApartmentReservationFactory(
-        apartment_uuid=first_apartment_uuid, queue_position=None
+        apartment_uuid=first_apartment_uuid, queue_order=None
     )
     remove_reservation_from_queue(reservation)
     assert caplog.records[0].levelname == "WARNING"
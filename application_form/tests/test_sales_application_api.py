@@ -1,6 +1,6 @@
 import pytest
 from django.contrib.auth.models import Group
-from django.urls import reverse
+from django.urls import NoReverseMatch, reverse
 
 from apartment_application_service.settings import (
     METADATA_HANDLER_INFORMATION,
@@ -188,3 +188,8 @@ def test_sale_application_post_generate_metadata(
         + data["additional_applicant"]["last_name"],
     )
     assert application.method_of_arrival == ApplicationArrivalMethod.POST
+
+
+def test_sales_application_batch_post_is_not_available():
+    with pytest.raises(NoReverseMatch):
+        reverse("application_form:sales-application-batch")
@@ -5,6 +5,7 @@ from application_form.api.sales.views import (
     apartment_states,
     ApartmentReservationViewSet,
     execute_lottery_for_project,
+    LotteryJobViewSet,
     OfferViewSet,
     SalesApplicationViewSet,
 )
@@ -30,6 +31,11 @@ router.register(
     OfferViewSet,
     basename="sales-offer",
 )
+router.register(
+    r"sales/lottery_jobs",
+    LotteryJobViewSet,
+    basename="sales-lottery-job",
+)
 
 
 # URLs for public web pages
@@ -1,8 +1,13 @@
 import re
+import uuid
 from contextlib import contextmanager
+from django.conf import settings
 from django.db import transaction
 from django.db.transaction import get_connection
-from typing import Tuple
+from typing import Iterable, Tuple
+
+APARTMENT_QUEUE_LOCK_MODE_APARTMENT = "apartment"
+APARTMENT_QUEUE_LOCK_MODE_TABLE = "table"
 
 
 # from https://stackoverflow.com/a/54403001
@@ -17,6 +22,48 @@ def lock_table(model):
             cursor.close()
 
 
+@contextmanager
+def lock_apartment_queues(model, apartment_uuids: Iterable[uuid.UUID]):
+    """
+    Lock the queues of the given apartments until the end of the transaction.
+
+    By default a PostgreSQL transaction level advisory lock is taken per apartment,
+    so that the queues of unrelated apartments can be modified in parallel. Setting
+    APARTMENT_QUEUE_LOCK_MODE to "table" locks the whole table of the given model
+    instead. The locks are taken in a fixed order to avoid deadlocks between
+    transactions locking several apartments.
+    """
+    if settings.APARTMENT_QUEUE_LOCK_MODE == APARTMENT_QUEUE_LOCK_MODE_TABLE:
+        with lock_table(model):
+            yield
+        return
+
+    keys = sorted({_get_advisory_lock_key(a) for a in apartment_uuids})
+    with transaction.atomic():
+        with get_connection().cursor() as cursor:
+            for key in keys:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [key])
+        yield
+
+
+def lock_project(project_uuid: uuid.UUID) -> None:
+    """
+    Lock the given project until the end of the current transaction with a PostgreSQL
+    transaction level advisory lock, e.g. so that its lottery is not run twice at the
+    same time.
+    """
+    with get_connection().cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(%s)", [_get_advisory_lock_key(project_uuid)]
+        )
+
+
+def _get_advisory_lock_key(apartment_uuid: uuid.UUID) -> int:
+    # Advisory lock keys are signed 64-bit integers
+    key = uuid.UUID(str(apartment_uuid)).int >> 64
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
 def get_apartment_number_sort_tuple(apartment_number: str) -> Tuple[str, int]:
     """Return a tuple that can be used in sorted() key to sort by apartment number."""
     match = re.match(r"(?P<letters>\D+)?\s*(?P<number>\d+)?", apartment_number)
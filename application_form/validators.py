@@ -1,6 +1,6 @@
 from datetime import date
 from rest_framework.exceptions import PermissionDenied, ValidationError
-from typing import List, Tuple, Union
+from typing import List, Optional, Tuple, Union
 from uuid import UUID
 
 from apartment.elastic.queries import get_apartment_uuids
@@ -61,6 +61,7 @@ class ProjectApplicantValidator:
         self,
         project_uuid: UUID,
         date_of_birth_and_ssn_suffix: Union[Tuple[date, str], List[Tuple[date, str]]],
+        apartment_uuids: Optional[List[UUID]] = None,
     ):
         if isinstance(date_of_birth_and_ssn_suffix, Tuple):
             date_of_birth_and_ssn_suffix = [date_of_birth_and_ssn_suffix]
@@ -79,7 +80,8 @@ class ProjectApplicantValidator:
             queryset = queryset | Applicant.objects.filter(
                 date_of_birth=date_of_birth, ssn_suffix=ssn_suffix
             )
-        apartment_uuids = get_apartment_uuids(project_uuid)
+        if apartment_uuids is None:
+            apartment_uuids = get_apartment_uuids(project_uuid)
         queryset = queryset & Applicant.objects.filter(
             application__application_apartments__apartment_uuid__in=apartment_uuids
         )
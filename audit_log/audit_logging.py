@@ -1,7 +1,7 @@
 from datetime import datetime, timezone
 from django.contrib.auth.models import AnonymousUser
 from django.db.models import Model
-from typing import Callable, Optional, Union
+from typing import Callable, Iterable, Optional, Tuple, Union
 
 from audit_log.enums import Operation, Role, Status
 from audit_log.models import AuditLog
@@ -36,7 +36,37 @@ def log(
 
     Audit log events are written to the "audit" logger at "INFO" level.
     """
+    message = _get_message(actor, operation, target, status, get_time())
+    AuditLog.objects.create(message=message)
+
+
+def log_many(
+    entries: Iterable[
+        Tuple[Optional[Union[Profile, AnonymousUser]], Operation, Optional[Model]]
+    ],
+    status: Status = Status.SUCCESS,
+    get_time: Callable[[], datetime] = _now,
+):
+    """
+    Write several events to the audit log with a single query.
+
+    The entries are (actor, operation, target) tuples, and they are written in the
+    given order. See log() for the details of a single event.
+    """
     current_time = get_time()
+    AuditLog.objects.bulk_create(
+        AuditLog(message=_get_message(actor, operation, target, status, current_time))
+        for actor, operation, target in entries
+    )
+
+
+def _get_message(
+    actor: Optional[Union[Profile, AnonymousUser]],
+    operation: Operation,
+    target: Optional[Model],
+    status: Status,
+    current_time: datetime,
+) -> dict:
     profile_id = None
     if actor is None:
         role = Role.SYSTEM
@@ -48,7 +78,7 @@ def log(
     else:
         role = Role.USER
         profile_id = str(actor.pk)
-    message = {
+    return {
         "audit_event": {
             "origin": ORIGIN,
             "status": str(status.value),
@@ -65,7 +95,6 @@ def log(
             },
         },
     }
-    AuditLog.objects.create(message=message)
 
 
 def _get_target_id(instance: Optional[Model]) -> Optional[str]:
@@ -3,13 +3,24 @@ from datetime import timedelta
 from django.conf import settings
 from django.utils import timezone
 from elasticsearch import Elasticsearch
+from functools import lru_cache
 
 from audit_log.models import AuditLog
+from connections.elastic_client import create_elasticsearch_client
 
 ES_STATUS_CREATED = "created"
 LOGGER = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1)
+def _get_audit_log_client(host, port, username, password) -> Elasticsearch:
+    # The client is reused by the later runs, as long as the settings do not change
+    return create_elasticsearch_client(
+        [{"host": host, "port": port, "use_ssl": True}],
+        http_auth=(username, password),
+    )
+
+
 def send_audit_log_to_elastic_search():
     if not (
         settings.AUDIT_LOG_ELASTICSEARCH_HOST
@@ -23,18 +34,11 @@ def send_audit_log_to_elastic_search():
             "process skipped"
         )
         return
-    es = Elasticsearch(
-        [
-            {
-                "host": settings.AUDIT_LOG_ELASTICSEARCH_HOST,
-                "port": settings.AUDIT_LOG_ELASTICSEARCH_PORT,
-                "use_ssl": True,
-            }
-        ],
-        http_auth=(
-            settings.AUDIT_LOG_ELASTICSEARCH_USERNAME,
-            settings.AUDIT_LOG_ELASTICSEARCH_PASSWORD,
-        ),
+    es = _get_audit_log_client(
+        settings.AUDIT_LOG_ELASTICSEARCH_HOST,
+        settings.AUDIT_LOG_ELASTICSEARCH_PORT,
+        settings.AUDIT_LOG_ELASTICSEARCH_USERNAME,
+        settings.AUDIT_LOG_ELASTICSEARCH_PASSWORD,
     )
     entries = AuditLog.objects.filter(sent_at=None).order_by("created_at")
 
@@ -0,0 +1,179 @@
+"""
+The factory of the Elasticsearch clients used by the project.
+
+The clients pool their connections to each node, time out slow requests and retry
+transient errors with an exponential backoff. Every request is reported to the
+registered query hooks with the name of the query helper that made it, so that slow
+Elasticsearch calls can be attributed.
+"""
+import inspect
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from elasticsearch import Elasticsearch, Transport, Urllib3HttpConnection
+from elasticsearch.exceptions import ConnectionError, ConnectionTimeout, TransportError
+from functools import wraps
+from typing import Callable, Iterator, List
+
+_logger = logging.getLogger(__name__)
+
+# Called with the query name, the duration in seconds and the request and response
+# body sizes in bytes of every request
+QueryHook = Callable[[str, float, int, int], None]
+
+_query_hooks: List[QueryHook] = []
+_query_name: ContextVar[str] = ContextVar("elasticsearch_query_name", default="")
+
+
+def register_query_hook(hook: QueryHook) -> QueryHook:
+    _query_hooks.append(hook)
+    return hook
+
+
+def unregister_query_hook(hook: QueryHook) -> None:
+    _query_hooks.remove(hook)
+
+
+@contextmanager
+def query_name(name: str) -> Iterator[None]:
+    """
+    Report the requests made inside the block with the given name. The name of an
+    outer block is kept.
+    """
+    if _query_name.get():
+        yield
+        return
+    token = _query_name.set(name)
+    try:
+        yield
+    finally:
+        _query_name.reset(token)
+
+
+def instrument_query(func):
+    """Report the requests made by the decorated function with its name."""
+    name = func.__name__
+
+    if inspect.isgeneratorfunction(func):
+
+        @wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            # The name is set only while the generator runs, not while it is paused
+            generator = func(*args, **kwargs)
+            while True:
+                with query_name(name):
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        return
+                yield item
+
+        return generator_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with query_name(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+@register_query_hook
+def log_query(name: str, duration: float, request_size: int, response_size: int):
+    level = (
+        logging.WARNING
+        if duration >= settings.ELASTICSEARCH_SLOW_QUERY_SECONDS
+        else logging.DEBUG
+    )
+    _logger.log(
+        level,
+        "Elasticsearch query %s took %.3f s (request %d B, response %d B)",
+        name,
+        duration,
+        request_size,
+        response_size,
+    )
+
+
+class InstrumentedConnection(Urllib3HttpConnection):
+    """Reports every request to the query hooks."""
+
+    def perform_request(
+        self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None
+    ):
+        start = time.monotonic()
+        data = None
+        try:
+            status, response_headers, data = super().perform_request(
+                method,
+                url,
+                params=params,
+                body=body,
+                timeout=timeout,
+                ignore=ignore,
+                headers=headers,
+            )
+            return status, response_headers, data
+        finally:
+            duration = time.monotonic() - start
+            name = _query_name.get() or f"{method} {url}"
+            for hook in _query_hooks:
+                try:
+                    hook(name, duration, len(body or b""), len(data or ""))
+                except Exception:
+                    _logger.exception("Elasticsearch query hook %r failed", hook)
+
+
+class RetryingTransport(Transport):
+    """
+    Retries the transient errors of a request with an exponential backoff, instead
+    of retrying immediately like the default transport.
+    """
+
+    def __init__(self, hosts, retries=3, retry_backoff=0.5, **kwargs):
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        super().__init__(hosts, max_retries=0, **kwargs)
+
+    def perform_request(self, method, url, headers=None, params=None, body=None):
+        attempt = 0
+        while True:
+            try:
+                return super().perform_request(
+                    method, url, headers=headers, params=params, body=body
+                )
+            except TransportError as e:
+                if attempt >= self.retries or not self._is_transient(e):
+                    raise
+            time.sleep(self.retry_backoff * 2**attempt)
+            attempt += 1
+
+    def _is_transient(self, error: TransportError) -> bool:
+        if isinstance(error, ConnectionTimeout):
+            return self.retry_on_timeout
+        if isinstance(error, ConnectionError):
+            return True
+        return error.status_code in self.retry_on_status
+
+
+def get_client_kwargs(**kwargs) -> dict:
+    """
+    Return the keyword arguments of an Elasticsearch client configured from the
+    settings. The given arguments override the defaults.
+    """
+    return {
+        "transport_class": RetryingTransport,
+        "connection_class": InstrumentedConnection,
+        "maxsize": settings.ELASTICSEARCH_MAX_CONNECTIONS,
+        "timeout": settings.ELASTICSEARCH_TIMEOUT,
+        "retries": settings.ELASTICSEARCH_MAX_RETRIES,
+        "retry_backoff": settings.ELASTICSEARCH_RETRY_BACKOFF,
+        "retry_on_timeout": True,
+        **kwargs,
+    }
+
+
+def create_elasticsearch_client(hosts, **kwargs) -> Elasticsearch:
+    return Elasticsearch(hosts, **get_client_kwargs(**kwargs))
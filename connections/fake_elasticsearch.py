@@ -0,0 +1,392 @@
+"""
+An in-process stand-in for Elasticsearch, which answers the queries of the project
+from documents loaded from JSON fixtures.
+
+It is used instead of a cluster when ELASTICSEARCH_FAKE_FIXTURES is set, so that the
+application can be profiled and load tested without Elasticsearch. Only the subset
+of the search API used by the project is supported: the term, terms, exists and
+bool queries, _source filtering, sorting with search_after, collapse, composite
+aggregations with top_hits, scroll (used by scan) and count.
+
+A fixture is a JSON list of documents. A document is either the _source of the
+document, or a dict with the keys "_source" and optionally "_id" and "_index".
+"""
+import itertools
+import json
+import uuid
+from django.conf import settings
+from elasticsearch import Connection
+from elasticsearch.exceptions import NotFoundError, RequestError
+from fnmatch import fnmatchcase
+from functools import cmp_to_key
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ROOT_RESPONSE = {
+    "name": "fake-elasticsearch",
+    "cluster_name": "fake-elasticsearch",
+    "version": {"number": "7.9.1"},
+    "tagline": "You Know, for Search",
+}
+DEFAULT_SIZE = 10
+
+
+class FakeElasticsearchStore:
+    """The documents of the fake, by index name."""
+
+    def __init__(self):
+        self.indices: Dict[str, List[dict]] = {}
+        # The remaining hits and the page size of the open scrolls
+        self.scrolls: Dict[str, Tuple[List[tuple], int]] = {}
+
+    def load_fixture(self, path: str) -> int:
+        with open(path, encoding="utf-8") as f:
+            documents = json.load(f)
+        return self.add_documents(documents)
+
+    def add_documents(self, documents: List[dict]) -> int:
+        """Add the given documents, in the format of the fixtures."""
+        for document in documents:
+            if "_source" not in document:
+                document = {"_source": document}
+            index = document.get("_index", settings.APARTMENT_INDEX_NAME)
+            hits = self.indices.setdefault(index, [])
+            source = document["_source"]
+            doc_id = document.get("_id") or source.get("uuid") or str(len(hits))
+            hits.append({"_index": index, "_id": str(doc_id), "_source": source})
+        return len(documents)
+
+    def get_documents(self, index: str) -> List[dict]:
+        if index not in self.indices:
+            raise NotFoundError(404, "index_not_found_exception", {"index": index})
+        return self.indices[index]
+
+
+_stores: Dict[Tuple[str, ...], FakeElasticsearchStore] = {}
+
+
+def get_store(fixtures: Iterable[str]) -> FakeElasticsearchStore:
+    """Return the store of the given fixtures, shared by all the connections."""
+    key = tuple(fixtures)
+    if key not in _stores:
+        store = FakeElasticsearchStore()
+        for path in key:
+            store.load_fixture(path)
+        _stores[key] = store
+    return _stores[key]
+
+
+class FakeElasticsearchConnection(Connection):
+    """
+    Answers the requests from the store of the given fixtures, or from the given
+    store.
+    """
+
+    def __init__(
+        self, fixtures=(), store: Optional[FakeElasticsearchStore] = None, **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.store = store if store is not None else get_store(fixtures)
+
+    def perform_request(
+        self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None
+    ):
+        params = params or {}
+        body = json.loads(body) if body else {}
+        parts = [part for part in url.split("?")[0].split("/") if part]
+
+        if not parts:
+            response = ROOT_RESPONSE
+        elif parts == ["_search", "scroll"]:
+            if method == "DELETE":
+                response = self._clear_scroll(body)
+            else:
+                response = self._scroll(body.get("scroll_id") or params["scroll_id"])
+        elif len(parts) == 2 and parts[1] == "_search":
+            response = self._search(parts[0], body, params)
+        elif len(parts) == 2 and parts[1] == "_count":
+            documents = self.store.get_documents(parts[0])
+            query = body.get("query", {"match_all": {}})
+            count = sum(1 for doc in documents if _matches(doc["_source"], query))
+            response = {"count": count}
+        else:
+            raise RequestError(400, "unsupported_operation", f"{method} {url}")
+
+        return 200, {"content-type": "application/json"}, json.dumps(response)
+
+    def _search(self, index: str, body: dict, params: dict) -> dict:
+        query = body.get("query", {"match_all": {}})
+        hits = [
+            doc
+            for doc in self.store.get_documents(index)
+            if _matches(doc["_source"], query)
+        ]
+        total = len(hits)
+        aggregations = {
+            name: _aggregate(hits, agg) for name, agg in body.get("aggs", {}).items()
+        }
+
+        sort = _parse_sort(body.get("sort", params.get("sort")))
+        if sort:
+            hits = sorted(hits, key=cmp_to_key(lambda a, b: _compare(a, b, sort)))
+        if "collapse" in body:
+            hits = _collapse(hits, body["collapse"]["field"])
+        if "search_after" in body:
+            hits = [
+                hit
+                for hit in hits
+                if _compare_values(_sort_values(hit, sort), body["search_after"], sort)
+                > 0
+            ]
+
+        size = int(body.get("size", params.get("size", DEFAULT_SIZE)))
+        start = int(body.get("from", params.get("from", 0)))
+        source_filter = body.get("_source", params.get("_source"))
+
+        response = _search_response(
+            hits[start:],
+            total,
+            size,
+            sort,
+            source_filter,
+            aggregations,
+        )
+        if "scroll" in params:
+            scroll_id = uuid.uuid4().hex
+            end = start + size
+            self.store.scrolls[scroll_id] = (
+                [(hit, source_filter, sort) for hit in hits[end:]],
+                size,
+            )
+            response["_scroll_id"] = scroll_id
+        return response
+
+    def _scroll(self, scroll_id: str) -> dict:
+        remaining, size = self.store.scrolls[scroll_id]
+        page, self.store.scrolls[scroll_id] = remaining[:size], (remaining[size:], size)
+        response = _search_response([], len(page), 0, None, None, {})
+        response["hits"]["hits"] = [
+            _format_hit(hit, sort, source_filter) for hit, source_filter, sort in page
+        ]
+        response["_scroll_id"] = scroll_id
+        return response
+
+    def _clear_scroll(self, body: dict) -> dict:
+        scroll_ids = body.get("scroll_id", [])
+        if isinstance(scroll_ids, str):
+            scroll_ids = [scroll_ids]
+        for scroll_id in scroll_ids:
+            self.store.scrolls.pop(scroll_id, None)
+        return {"succeeded": True, "num_freed": len(scroll_ids)}
+
+
+def _search_response(hits, total, size, sort, source_filter, aggregations) -> dict:
+    response = {
+        "took": 0,
+        "timed_out": False,
+        "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+        "hits": {
+            "total": {"value": total, "relation": "eq"},
+            "max_score": None,
+            "hits": [_format_hit(hit, sort, source_filter) for hit in hits[:size]],
+        },
+    }
+    if aggregations:
+        response["aggregations"] = aggregations
+    return response
+
+
+def _format_hit(hit: dict, sort, source_filter) -> dict:
+    formatted = {
+        "_index": hit["_index"],
+        "_type": "_doc",
+        "_id": hit["_id"],
+        "_score": None,
+        "_source": _filter_source(hit["_source"], source_filter),
+    }
+    if sort:
+        formatted["sort"] = _sort_values(hit, sort)
+    return formatted
+
+
+def _field_value(source: dict, field: str):
+    if field.endswith(".keyword"):
+        field = field[: -len(".keyword")]
+    return source.get(field)
+
+
+def _normalize(value):
+    if isinstance(value, (bool, int, float)) or value is None:
+        return value
+    return str(value)
+
+
+def _values(source: dict, field: str) -> list:
+    value = _field_value(source, field)
+    if value is None:
+        return []
+    values = value if isinstance(value, list) else [value]
+    return [_normalize(v) for v in values]
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _matches(source: dict, query: dict) -> bool:  # noqa: C901
+    (query_type, args), *_ = query.items()
+    if query_type == "match_all":
+        return True
+    if query_type == "bool":
+        must = _as_list(args.get("must")) + _as_list(args.get("filter"))
+        should = _as_list(args.get("should"))
+        if not all(_matches(source, q) for q in must):
+            return False
+        if any(_matches(source, q) for q in _as_list(args.get("must_not"))):
+            return False
+        if should and not must:
+            return any(_matches(source, q) for q in should)
+        return True
+    if query_type == "term":
+        (field, value), *_ = args.items()
+        if isinstance(value, dict):
+            value = value["value"]
+        return _normalize(value) in _values(source, field)
+    if query_type == "terms":
+        (field, values), *_ = args.items()
+        return bool(set(map(_normalize, values)) & set(_values(source, field)))
+    if query_type == "exists":
+        return bool(_values(source, args["field"]))
+    raise RequestError(400, "unsupported_query", query_type)
+
+
+def _filter_source(source: dict, source_filter) -> Optional[dict]:
+    if source_filter is None or source_filter is True:
+        return source
+    if source_filter is False:
+        return {}
+    if isinstance(source_filter, str):
+        source_filter = source_filter.split(",")
+    if isinstance(source_filter, list):
+        source_filter = {"includes": source_filter}
+    includes = source_filter.get("includes", [])
+    excludes = source_filter.get("excludes", [])
+    return {
+        name: value
+        for name, value in source.items()
+        if (not includes or any(fnmatchcase(name, p) for p in includes))
+        and not any(fnmatchcase(name, p) for p in excludes)
+    }
+
+
+def _parse_sort(sort) -> List[Tuple[str, str]]:
+    result = []
+    for item in _as_list(sort):
+        if isinstance(item, str):
+            field, _, order = item.partition(":")
+            result.append((field, order or "asc"))
+        else:
+            (field, order), *_ = item.items()
+            if isinstance(order, dict):
+                order = order.get("order", "asc")
+            result.append((field, order))
+    return result
+
+
+def _sort_values(hit: dict, sort) -> list:
+    values = []
+    for field, _ in sort:
+        if field == "_doc":
+            values.append(0)
+        else:
+            field_values = _values(hit["_source"], field)
+            values.append(field_values[0] if field_values else None)
+    return values
+
+
+def _compare_values(a: list, b: list, sort) -> int:
+    for value_a, value_b, (_, order) in zip(a, b, sort):
+        if value_a == value_b:
+            continue
+        # Missing values are sorted last in both orders
+        if value_a is None:
+            return 1
+        if value_b is None:
+            return -1
+        result = -1 if value_a < value_b else 1
+        return -result if order == "desc" else result
+    return 0
+
+
+def _compare(a: dict, b: dict, sort) -> int:
+    return _compare_values(_sort_values(a, sort), _sort_values(b, sort), sort)
+
+
+def _collapse(hits: List[dict], field: str) -> List[dict]:
+    seen = set()
+    collapsed = []
+    for hit in hits:
+        values = _values(hit["_source"], field)
+        key = values[0] if values else None
+        if key not in seen:
+            seen.add(key)
+            collapsed.append(hit)
+    return collapsed
+
+
+def _aggregate(hits: List[dict], agg: dict) -> dict:
+    sub_aggs = agg.get("aggs", agg.get("aggregations", {}))
+    if "composite" in agg:
+        return _composite(hits, agg["composite"], sub_aggs)
+    if "top_hits" in agg:
+        args = agg["top_hits"]
+        return {
+            "hits": {
+                "total": {"value": len(hits), "relation": "eq"},
+                "max_score": None,
+                "hits": [
+                    _format_hit(hit, None, args.get("_source"))
+                    for hit in hits[: args.get("size", 3)]
+                ],
+            }
+        }
+    raise RequestError(400, "unsupported_aggregation", list(agg))
+
+
+def _composite(hits: List[dict], args: dict, sub_aggs: dict) -> dict:
+    fields = []
+    for source in args["sources"]:
+        (name, definition), *_ = source.items()
+        if "terms" not in definition:
+            raise RequestError(400, "unsupported_aggregation", list(definition))
+        fields.append((name, definition["terms"]["field"]))
+
+    buckets: Dict[tuple, List[dict]] = {}
+    for hit in hits:
+        key_values = [_values(hit["_source"], field) for _, field in fields]
+        for key in itertools.product(*key_values):
+            buckets.setdefault(key, []).append(hit)
+
+    keys = sorted(buckets)
+    if "after" in args:
+        after = tuple(_normalize(args["after"][name]) for name, _ in fields)
+        keys = [key for key in keys if key > after]
+    keys = keys[: args.get("size", DEFAULT_SIZE)]
+
+    result = {
+        "buckets": [
+            {
+                "key": dict(zip((name for name, _ in fields), key)),
+                "doc_count": len(buckets[key]),
+                **{
+                    name: _aggregate(buckets[key], sub_agg)
+                    for name, sub_agg in sub_aggs.items()
+                },
+            }
+            for key in keys
+        ]
+    }
+    if keys:
+        result["after_key"] = result["buckets"][-1]["key"]
+    return result
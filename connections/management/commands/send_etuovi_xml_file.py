@@ -5,10 +5,8 @@ from django_etuovi.etuovi import send_items
 
 from connections.etuovi.services import create_xml, fetch_apartments_for_sale
 from connections.models import MappedApartment
-from connections.utils import create_elastic_connection
 
 _logger = logging.getLogger(__name__)
-create_elastic_connection()
 
 
 class Command(BaseCommand):
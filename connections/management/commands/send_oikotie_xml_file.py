@@ -9,10 +9,8 @@ from connections.oikotie.services import (
     create_xml_housing_company_file,
     fetch_apartments_for_sale,
 )
-from connections.utils import create_elastic_connection
 
 _logger = logging.getLogger(__name__)
-create_elastic_connection()
 
 
 class Command(BaseCommand):
@@ -0,0 +1,89 @@
+import json
+import pytest
+from elasticsearch import Urllib3HttpConnection
+from elasticsearch.exceptions import ConnectionError, NotFoundError
+from unittest import mock
+
+from connections.elastic_client import (
+    create_elasticsearch_client,
+    instrument_query,
+    register_query_hook,
+    unregister_query_hook,
+)
+
+ROOT_RESPONSE = json.dumps(
+    {"version": {"number": "7.9.1"}, "tagline": "You Know, for Search"}
+)
+
+
+def _respond(responses):
+    def perform_request(self, method, url, *args, **kwargs):
+        if url == "/":
+            return 200, {}, ROOT_RESPONSE
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return 200, {}, response
+
+    return perform_request
+
+
+@pytest.fixture
+def recorded_queries():
+    queries = []
+
+    def hook(name, duration, request_size, response_size):
+        queries.append((name, request_size, response_size))
+
+    register_query_hook(hook)
+    yield queries
+    unregister_query_hook(hook)
+
+
+def test_queries_are_reported_with_the_helper_name(recorded_queries):
+    client = create_elasticsearch_client(["http://localhost:9200"])
+
+    @instrument_query
+    def count_apartments():
+        return client.count(index="apartments", body={"query": {"match_all": {}}})
+
+    with mock.patch.object(
+        Urllib3HttpConnection, "perform_request", _respond(['{"count": 5}'])
+    ):
+        assert count_apartments()["count"] == 5
+
+    name, request_size, response_size = recorded_queries[-1]
+    assert name == "count_apartments"
+    assert request_size > 0
+    assert response_size == len('{"count": 5}')
+
+
+def test_transient_errors_are_retried_with_backoff():
+    client = create_elasticsearch_client(
+        ["http://localhost:9200"], retries=2, retry_backoff=0.1
+    )
+    responses = [
+        ConnectionError("N/A", "connection refused", None),
+        ConnectionError("N/A", "connection refused", None),
+        '{"count": 5}',
+    ]
+
+    with mock.patch.object(
+        Urllib3HttpConnection, "perform_request", _respond(responses)
+    ), mock.patch("connections.elastic_client.time.sleep") as sleep:
+        assert client.count(index="apartments")["count"] == 5
+
+    assert [c.args[0] for c in sleep.call_args_list] == [0.1, 0.2]
+
+
+def test_other_errors_are_not_retried():
+    client = create_elasticsearch_client(["http://localhost:9200"])
+    responses = [NotFoundError(404, "index_not_found_exception", None)]
+
+    with mock.patch.object(
+        Urllib3HttpConnection, "perform_request", _respond(responses)
+    ), mock.patch("connections.elastic_client.time.sleep") as sleep:
+        with pytest.raises(NotFoundError):
+            client.count(index="apartments")
+
+    sleep.assert_not_called()
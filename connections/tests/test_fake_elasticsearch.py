@@ -0,0 +1,103 @@
+import json
+import pytest
+import uuid
+from django.conf import settings
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch_dsl import connections
+
+from apartment.elastic.documents import ApartmentDocument
+from apartment.elastic.queries import (
+    get_apartment,
+    get_apartment_uuids,
+    get_apartments_by_uuids,
+    get_project,
+    iter_apartments,
+    iter_projects,
+)
+from connections.elastic_client import create_elasticsearch_client
+from connections.fake_elasticsearch import FakeElasticsearchConnection
+
+
+def _apartment(project_id, project_uuid, number):
+    return {
+        "uuid": str(uuid.uuid4()),
+        "project_id": project_id,
+        "project_uuid": project_uuid,
+        "project_ownership_type": "HASO",
+        "project_housing_company": f"Company {project_id}",
+        "apartment_number": f"A{number}",
+        "_language": "fi",
+    }
+
+
+@pytest.fixture
+def fake_apartments(tmp_path):
+    apartments = [_apartment(i, str(uuid.uuid4()), i) for i in range(3)]
+    project_uuid = apartments[0]["project_uuid"]
+    apartments += [_apartment(0, project_uuid, i) for i in range(3, 7)]
+    fixture = tmp_path / "apartments.json"
+    fixture.write_text(json.dumps(apartments))
+
+    client = create_elasticsearch_client(
+        ["http://fake-elasticsearch"],
+        connection_class=FakeElasticsearchConnection,
+        fixtures=[str(fixture)],
+    )
+    previous_client = connections.get_connection()
+    connections.add_connection("default", client)
+    yield project_uuid, apartments
+    connections.add_connection("default", previous_client)
+
+
+def test_get_apartment(fake_apartments):
+    _, apartments = fake_apartments
+
+    apartment = get_apartment(apartments[0]["uuid"])
+
+    assert apartment.apartment_number == apartments[0]["apartment_number"]
+    assert "project_uuid" not in apartment.to_dict()
+
+
+def test_get_apartments_by_uuids(fake_apartments):
+    _, apartments = fake_apartments
+    apartment_uuids = [a["uuid"] for a in apartments[:4]]
+
+    result = get_apartments_by_uuids(apartment_uuids, projection="ownership_type")
+
+    assert set(result) == set(apartment_uuids)
+    assert result[apartment_uuids[0]].project_ownership_type == "HASO"
+
+
+def test_iter_apartments_and_scan(fake_apartments):
+    project_uuid, apartments = fake_apartments
+    project_apartment_uuids = [
+        a["uuid"] for a in apartments if a["project_uuid"] == project_uuid
+    ]
+
+    assert [a.uuid for a in iter_apartments(project_uuid, page_size=2)] == sorted(
+        project_apartment_uuids
+    )
+    assert sorted(get_apartment_uuids(project_uuid)) == sorted(project_apartment_uuids)
+    assert ApartmentDocument.search().count() == len(apartments)
+
+
+@pytest.mark.django_db
+def test_projects(fake_apartments):
+    project_uuid, apartments = fake_apartments
+
+    projects = list(iter_projects(page_size=1))
+
+    assert sorted(p.project_uuid for p in projects) == sorted(
+        {a["project_uuid"] for a in apartments}
+    )
+    project = get_project(project_uuid)
+    assert project.project_uuid == project_uuid
+    assert project.project_ownership_type == "HASO"
+    assert "apartment_number" not in project.to_dict()
+
+
+def test_unknown_index(fake_apartments):
+    search = ApartmentDocument.search(index=f"{settings.APARTMENT_INDEX_NAME}-other")
+
+    with pytest.raises(NotFoundError):
+        search.execute()
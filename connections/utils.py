@@ -2,20 +2,33 @@ from decimal import Decimal
 from django.conf import settings
 from elasticsearch_dsl import connections
 
+from connections.elastic_client import get_client_kwargs
+from connections.fake_elasticsearch import FakeElasticsearchConnection
+
 
 def create_elastic_connection() -> None:
     """
-    Creates the ElasticSearch connection with the url provided in the settings.
-    The ElasticSearch connection needs to be established before it can be accessed.
+    Configures the default ElasticSearch connection with the url provided in the
+    settings. The client is created lazily when the connection is first used.
     """
     http_auth = None
     if settings.ELASTICSEARCH_USERNAME and settings.ELASTICSEARCH_PASSWORD:
         http_auth = (settings.ELASTICSEARCH_USERNAME, settings.ELASTICSEARCH_PASSWORD)
 
-    connections.create_connection(
-        hosts=[settings.ELASTICSEARCH_URL],
-        port=settings.ELASTICSEARCH_PORT,
-        http_auth=http_auth,
+    fake_kwargs = {}
+    if settings.ELASTICSEARCH_FAKE_FIXTURES:
+        fake_kwargs = {
+            "connection_class": FakeElasticsearchConnection,
+            "fixtures": settings.ELASTICSEARCH_FAKE_FIXTURES,
+        }
+
+    connections.configure(
+        default=get_client_kwargs(
+            hosts=[settings.ELASTICSEARCH_URL],
+            port=settings.ELASTICSEARCH_PORT,
+            http_auth=http_auth,
+            **fake_kwargs,
+        )
     )
 
 
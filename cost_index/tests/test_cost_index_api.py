@@ -101,26 +101,26 @@ def test_apartment_revaluation_summary_api(
     haso_0_reservation_0 = ApartmentReservationFactory(
         apartment_uuid=haso_0.uuid,
         state=ApartmentReservationState.CANCELED,
-        list_position=1,
+        list_order=1,
     )
     haso_0_reservation_1 = ApartmentReservationFactory(
         apartment_uuid=haso_0.uuid,
         state=ApartmentReservationState.CANCELED,
-        list_position=2,
+        list_order=2,
     )
 
     haso_1 = haso_apartments[1]
     haso_1_reservation_0 = ApartmentReservationFactory(
         apartment_uuid=haso_1.uuid,
         state=ApartmentReservationState.CANCELED,
-        list_position=1,
+        list_order=1,
     )
 
     haso_2 = haso_apartments[2]
     haso_2_reservation_0 = ApartmentReservationFactory(
         apartment_uuid=haso_2.uuid,
         state=ApartmentReservationState.CANCELED,
-        list_position=1,
+        list_order=1,
     )
 
     now = timezone.now()
@@ -187,7 +187,7 @@ def test_revaluation_and_haso_payment_api(
     haso_0_reservation_0 = ApartmentReservationFactory(
         apartment_uuid=haso_0.uuid,
         state=ApartmentReservationState.CANCELED,
-        list_position=1,
+        list_order=1,
     )
 
     haso_0_revaluation_template = ApartmentRevaluationFactory(
@@ -58,7 +58,7 @@ def test_apartment_revaluation_effect_on_apartment_document(
     haso_0_reservation_0 = ApartmentReservationFactory(
         apartment_uuid=haso_0.uuid,
         state=ApartmentReservationState.CANCELED,
-        list_position=1,
+        list_order=1,
     )
     assert (
         haso_0.right_of_occupancy_payment == haso_0.current_right_of_occupancy_payment
@@ -3,7 +3,7 @@ from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 from uuid import UUID
 
-from apartment.elastic.queries import get_apartment
+from apartment.elastic.queries import get_apartment, get_apartments_by_uuids
 from apartment_application_service.utils import update_obj
 from application_form.api.serializers import (
     ApartmentReservationSerializerBase,
@@ -56,9 +56,11 @@ class CustomerApartmentReservationSerializer(ApartmentReservationSerializerBase)
         ) + ApartmentReservationSerializerBase.Meta.fields
 
     def to_representation(self, instance):
-        self.context["apartment"] = get_apartment(
-            instance.apartment_uuid, include_project_fields=True
-        )
+        # The apartments can be fetched in advance with get_apartments_by_uuids()
+        apartments = self.context.get("apartments", {})
+        self.context["apartment"] = apartments.get(
+            str(instance.apartment_uuid)
+        ) or get_apartment(instance.apartment_uuid, include_project_fields=True)
         self.context["reservation_id"] = instance.id
         return super().to_representation(instance)
 
@@ -128,9 +130,15 @@ class CustomerSerializer(serializers.ModelSerializer):
 
     @extend_schema_field(CustomerApartmentReservationSerializer(many=True))
     def get_apartment_reservations(self, obj):
-        reservations = ApartmentReservation.objects.filter(customer=obj)
+        reservations = list(
+            ApartmentReservation.objects.filter(customer=obj).with_positions()
+        )
+        apartments = get_apartments_by_uuids(
+            (reservation.apartment_uuid for reservation in reservations),
+            include_project_fields=True,
+        )
         serialized_reservations = CustomerApartmentReservationSerializer(
-            reservations, many=True
+            reservations, many=True, context={"apartments": apartments}
         ).data
 
         # sort reservations by
@@ -52,7 +52,7 @@ def test_get_customer_api_detail(sales_ui_salesperson_api_client):
         apartment_uuid=apartment.uuid,
         has_hitas_ownership=True,
         has_children=False,
-        queue_position=1,
+        queue_order=1,
     )
     installment = ApartmentInstallmentFactory(
         apartment_reservation=reservation, value=100
@@ -440,29 +440,29 @@ def test_customer_reservation_ordering(sales_ui_salesperson_api_client):
             apartment_uuid=apartment_a10.uuid,
             customer=customer,
             state=ApartmentReservationState.CANCELED,
-            queue_position=None,
-            list_position=2,
+            queue_order=None,
+            list_order=2,
         ),
         ApartmentReservationFactory(
             apartment_uuid=apartment_a5.uuid,
             customer=customer,
             state=ApartmentReservationState.CANCELED,
-            queue_position=None,
-            list_position=1,
+            queue_order=None,
+            list_order=1,
         ),
         ApartmentReservationFactory(
             apartment_uuid=apartment_a5.uuid,
             customer=customer,
             state=ApartmentReservationState.SUBMITTED,
-            queue_position=2,
-            list_position=2,
+            queue_order=2,
+            list_order=2,
         ),
         ApartmentReservationFactory(
             apartment_uuid=apartment_a10.uuid,
             customer=customer,
             state=ApartmentReservationState.RESERVED,
-            queue_position=1,
-            list_position=1,
+            queue_order=1,
+            list_order=1,
         ),
     ]
     reservation_ids = [r.id for r in reservations]
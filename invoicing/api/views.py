@@ -92,8 +92,11 @@ class ApartmentInstallmentInvoiceAPIView(APIView):
         if not installments.exists():
             raise Http404
 
-        pdf_data = create_invoice_pdf_from_installments(installments)
-        apartment = get_apartment(reservation.apartment_uuid)
+        # The same apartment is used for the PDF, so it is fetched only once
+        apartment = get_apartment(
+            reservation.apartment_uuid, include_project_fields=True
+        )
+        pdf_data = create_invoice_pdf_from_installments(installments, apartment)
         title = (apartment.title or "").strip().lower().replace(" ", "_")
         filename = f"laskut_{title}.pdf" if title else "laskut.pdf"
 
@@ -2,6 +2,7 @@ from django.conf import settings
 from django.core.management.base import BaseCommand
 from logging import getLogger
 
+from apartment.elastic.memo import query_memo
 from invoicing.services import (
     send_email_notification_to_talpa,
     send_needed_installments_to_sap,
@@ -15,7 +16,8 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         logger.info("Sending installments to SAP...")
-        num_of_installments, timestamp = send_needed_installments_to_sap()
+        with query_memo():
+            num_of_installments, timestamp = send_needed_installments_to_sap()
         logger.info(f"{num_of_installments} installment(s) sent to SAP")
         if settings.TALPA_EMAIL:
             sent_count = send_email_notification_to_talpa(
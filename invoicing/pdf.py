@@ -2,11 +2,10 @@ import dataclasses
 from datetime import date
 from decimal import Decimal
 from django.utils.translation import gettext_lazy as _
-from functools import lru_cache
-from typing import ClassVar, Dict
-from uuid import UUID
+from typing import ClassVar, Dict, Optional
 
 from apartment.elastic.documents import ApartmentDocument
+from apartment.elastic.memo import query_memo
 from apartment.elastic.queries import get_apartment, get_project
 from apartment_application_service.pdf import create_pdf, PDFData
 from customer.models import Customer
@@ -50,23 +49,29 @@ class InvoicePDFData(PDFData):
     }
 
 
-def create_invoice_pdf_from_installments(installments):
-    @lru_cache
-    def get_cached_project(project_uuid: UUID):
-        return get_project(project_uuid)
+def create_invoice_pdf_from_installments(
+    installments, apartment: Optional[ApartmentDocument] = None
+):
+    """
+    Create an invoice PDF of the installments. If the installments are all of the
+    same reservation, the caller can give its apartment with the project fields.
+    """
+    with query_memo():
+        return _create_invoice_pdf_from_installments(installments, apartment)
 
-    @lru_cache
-    def get_cached_apartment(apartment_uuid: UUID) -> ApartmentDocument:
-        return get_apartment(apartment_uuid, include_project_fields=True)
 
+def _create_invoice_pdf_from_installments(installments, apartment=None):
     invoice_pdf_data_list = []
     for installment in installments:
         reservation = installment.apartment_reservation
         payer_name_and_address = _get_payer_name_and_address(
             installment.apartment_reservation.customer
         )
-        apartment = get_cached_apartment(reservation.apartment_uuid)
-        project = get_cached_project(apartment.project_uuid)
+        if apartment is None or apartment.uuid != str(reservation.apartment_uuid):
+            apartment = get_apartment(
+                reservation.apartment_uuid, include_project_fields=True
+            )
+        project = get_project(apartment.project_uuid)
         invoice_pdf_data = InvoicePDFData(
             recipient=project.project_housing_company,
             recipient_account_number=f"{project.project_contract_rs_bank or ''} "
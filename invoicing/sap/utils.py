@@ -1,7 +1,8 @@
 from datetime import date, datetime, timedelta
 from django.conf import settings
-from typing import Union
+from typing import Optional, Union
 
+from apartment.elastic.documents import ApartmentDocument
 from apartment.elastic.queries import get_apartment
 from invoicing.enums import InstallmentType
 from invoicing.models import ApartmentInstallment
@@ -53,10 +54,13 @@ def get_installment_type_text(installment_type: InstallmentType) -> str:  # noqa
     return result
 
 
-def get_wbs_element(installment: ApartmentInstallment) -> str:
-    apartment = get_apartment(
-        installment.apartment_reservation.apartment_uuid, include_project_fields=True
-    )
+def get_wbs_element(
+    installment: ApartmentInstallment, apartment: Optional[ApartmentDocument] = None
+) -> str:
+    if apartment is None:
+        apartment = get_apartment(
+            installment.apartment_reservation.apartment_uuid, projection="wbs_element"
+        )
     ownership_type = apartment.project_ownership_type.upper()
 
     wbs_element_settings = settings.SAP["WBS_ELEMENT"]
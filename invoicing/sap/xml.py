@@ -75,9 +75,11 @@
 # </SBO_AccountsReceivableContainer>
 from django.conf import settings
 from django.db.models import QuerySet
-from typing import List, Union
+from typing import List, Optional, Union
 from xml.etree.ElementTree import Element, SubElement, tostring
 
+from apartment.elastic.documents import ApartmentDocument
+from apartment.elastic.queries import get_apartments_by_uuids
 from invoicing.models import ApartmentInstallment
 from invoicing.sap.utils import (
     get_base_line_date_string,
@@ -98,6 +100,7 @@ def generate_installments_xml(
 def _append_account_receivable_container_xml(
     parent: Element,
     apartment_installment: ApartmentInstallment,
+    apartment: Optional[ApartmentDocument] = None,
 ) -> Element:
     sbo_account_receivable = SubElement(parent, "SBO_AccountsReceivable")
 
@@ -230,7 +233,7 @@ def _append_account_receivable_container_xml(
 
     # FI: Projektirakenteen osa (PRR-osa)
     wbs_element = SubElement(credit_line_item, "WBS_Element")
-    wbs_element.text = get_wbs_element(apartment_installment)
+    wbs_element.text = get_wbs_element(apartment_installment, apartment)
 
     return sbo_account_receivable
 
@@ -240,7 +243,13 @@ def generate_installments_xml_element(
 ):
     root = Element("SBO_AccountsReceivableContainer")
 
+    apartment_installments = list(apartment_installments)
+    apartments = get_apartments_by_uuids(
+        (item.apartment_reservation.apartment_uuid for item in apartment_installments),
+        projection="wbs_element",
+    )
     for item in apartment_installments:
-        _append_account_receivable_container_xml(root, item)
+        apartment = apartments.get(str(item.apartment_reservation.apartment_uuid))
+        _append_account_receivable_container_xml(root, item, apartment)
 
     return root
@@ -24,13 +24,13 @@ def test_pending_installments_to_sap(send_xml_to_sap):
 
     not_added_to_be_sent = ApartmentInstallmentFactory(
         apartment_reservation__apartment_uuid=apartment.uuid,
-        apartment_reservation__list_position=1,
+        apartment_reservation__list_order=1,
         added_to_be_sent_to_sap_at=None,
         sent_to_sap_at=None,
     )
     added_to_be_sent_but_not_yet_ready = ApartmentInstallmentFactory(
         apartment_reservation__apartment_uuid=apartment.uuid,
-        apartment_reservation__list_position=2,
+        apartment_reservation__list_order=2,
         added_to_be_sent_to_sap_at=timezone.now(),
         sent_to_sap_at=None,
         due_date=timezone.localdate()
@@ -38,13 +38,13 @@ def test_pending_installments_to_sap(send_xml_to_sap):
     )
     should_get_sent = ApartmentInstallmentFactory(
         apartment_reservation__apartment_uuid=apartment.uuid,
-        apartment_reservation__list_position=3,
+        apartment_reservation__list_order=3,
         added_to_be_sent_to_sap_at=timezone.now(),
         sent_to_sap_at=None,
     )
     ApartmentInstallmentFactory(
         apartment_reservation__apartment_uuid=apartment.uuid,
-        apartment_reservation__list_position=4,
+        apartment_reservation__list_order=4,
         added_to_be_sent_to_sap_at=timezone.now(),
         sent_to_sap_at=timezone.now(),
     )  # already sent to SAP
@@ -77,7 +77,7 @@ def test_email_notification_after_sending_installments_to_sap(_, freezer):
     apartment = ApartmentDocumentFactory()
     added_to_be_sent_but_not_yet_ready = ApartmentInstallmentFactory(
         apartment_reservation__apartment_uuid=apartment.uuid,
-        apartment_reservation__list_position=2,
+        apartment_reservation__list_order=2,
         added_to_be_sent_to_sap_at=timezone.now(),
         sent_to_sap_at=None,
         due_date=timezone.localdate()
@@ -85,7 +85,7 @@ def test_email_notification_after_sending_installments_to_sap(_, freezer):
     )
     should_get_sent = ApartmentInstallmentFactory(
         apartment_reservation__apartment_uuid=apartment.uuid,
-        apartment_reservation__list_position=3,
+        apartment_reservation__list_order=3,
         added_to_be_sent_to_sap_at=timezone.now(),
         sent_to_sap_at=None,
     )